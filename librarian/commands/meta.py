@@ -1,6 +1,9 @@
+import psycopg2
+
 from ..core.exceptions import EarlyExit
 from ..core.exts import ext_container as exts
 from ..data.meta.archive import Archive
+from ..data.meta.snapshot import SnapshotError
 
 
 class ReloadMetaCommand(object):
@@ -23,3 +26,83 @@ class ReloadMetaCommand(object):
         archive.clear_and_reload()
         print('Meta reload finished.')
         raise EarlyExit()
+
+
+class RebuildMetaCommand(object):
+    name = 'rebuild_meta'
+    flags = '--rebuild-meta'
+    kwargs = {
+        'action': 'store_true',
+        'help': "Reconstruct meta archive in the background, while the "
+                "existing one keeps being served."
+    }
+
+    def run(self, args):
+        exts.events.subscribe('init_complete', self.start)
+
+    def start(self, *args, **kwargs):
+        exts.tasks.schedule(self.rebuild)
+
+    def rebuild(self):
+        Archive().rebuild()
+
+
+class ExportMetaCommand(object):
+    name = 'export_meta'
+    flags = '--export-meta'
+    kwargs = {
+        'metavar': 'PATH',
+        'help': "Export meta archive into a snapshot file and exit."
+    }
+
+    def run(self, args):
+        self.path = args.export_meta
+        exts.events.subscribe('init_complete', self.export)
+
+    def export(self, *args, **kwargs):
+        print('Begin meta export.')
+        counts = Archive().export_snapshot(self.path)
+        print('Meta export finished: {} entries.'.format(counts['fs']))
+        raise EarlyExit()
+
+
+class ImportMetaCommand(object):
+    name = 'import_meta'
+    flags = '--import-meta'
+    kwargs = {
+        'metavar': 'PATH',
+        'help': "Replace meta archive with a snapshot file and exit. Files "
+                "which are not in the snapshot are analyzed by the crawler "
+                "when librarian is started the next time."
+    }
+
+    def run(self, args):
+        self.path = args.import_meta
+        exts.events.subscribe('init_complete', self.load)
+
+    def load(self, *args, **kwargs):
+        print('Begin meta import.')
+        try:
+            result = Archive().import_snapshot(self.path)
+        except (SnapshotError, psycopg2.Error) as exc:
+            print('Meta import failed: {}'.format(exc))
+            raise EarlyExit(str(exc), exit_code=1)
+        print('Meta import finished: {imported} files, {missing} missing, '
+              '{changed} changed.'.format(**result))
+        raise EarlyExit()
+
+
+class CrawlCommand(object):
+    name = 'crawl'
+    flags = '--crawl'
+    kwargs = {
+        'action': 'store_true',
+        'help': "Crawl the content library in the background and analyze "
+                "files which have no metadata stored yet."
+    }
+
+    def run(self, args):
+        exts.events.subscribe('init_complete', self.start)
+
+    def start(self, *args, **kwargs):
+        exts.crawler.start()
@@ -3,6 +3,8 @@ from ...utils import is_string
 
 class BasePermission(object):
     name = None  # subclasses should provide a unique identifier
+    # maps permission names to classes, shared by all lookups
+    _registry = {}
 
     def __init__(self, *args, **kwargs):
         if self.name is None:
@@ -32,12 +34,19 @@ class BasePermission(object):
 
     @classmethod
     def cast(cls, name):
+        try:
+            return cls._registry[name]
+        except KeyError:
+            pass
+        # permission classes may be defined after the previous lookup, so the
+        # registry is rebuilt whenever a name is not found in it
         for subclass in cls.subclasses():
-            if subclass.name == name:
-                return subclass
-
-        raise ValueError("No Permission class found under the name: "
-                         "{0}".format(name))
+            cls._registry.setdefault(subclass.name, subclass)
+        try:
+            return cls._registry[name]
+        except KeyError:
+            raise ValueError("No Permission class found under the name: "
+                             "{0}".format(name))
 
 
 class BaseGroup(object):
@@ -9,6 +9,9 @@ class GroupNotFound(Exception):
 
 
 class Group(BaseGroup):
+    # maps group names to their stored data, loaded once for all groups and
+    # shared by all requests, as groups are rarely ever changed
+    _registry = None
 
     @identify_database
     def __init__(self, db, *args, **kwargs):
@@ -16,17 +19,34 @@ class Group(BaseGroup):
         super(Group, self).__init__(*args, **kwargs)
 
     @classmethod
-    @identify_database
-    def from_name(cls, group_name, db):
-        query = db.Select(sets='groups', where='name = %(name)s')
-        group = db.fetchone(query, dict(name=group_name))
-        group = row_to_dict(group) if group else {}
-
-        if group:
+    def load(cls, db):
+        query = db.Select(sets='groups')
+        registry = {}
+        for row in db.fetchall(query):
+            group = row_to_dict(row)
             group['permissions'] = from_csv(group.pop('permissions', ''))
-            return cls(db=db, **group)
+            registry[group['name']] = group
+        cls._registry = registry
+        return registry
+
+    @classmethod
+    def invalidate(cls):
+        cls._registry = None
 
-        raise GroupNotFound(group_name)
+    @classmethod
+    @identify_database
+    def from_name(cls, group_name, db):
+        registry = cls._registry
+        if registry is None:
+            registry = cls.load(db)
+
+        try:
+            group = registry[group_name]
+        except KeyError:
+            raise GroupNotFound(group_name)
+        return cls(db=db, name=group['name'],
+                   permissions=list(group['permissions']),
+                   has_superpowers=group['has_superpowers'])
 
     def save(self):
         query = self.db.Replace(
@@ -37,3 +57,4 @@ class Group(BaseGroup):
         self.db.execute(query, dict(name=self.name,
                                     permissions=self.permissions,
                                     has_superpowers=self.has_superpowers))
+        self.invalidate()
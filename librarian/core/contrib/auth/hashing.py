@@ -0,0 +1,94 @@
+"""
+hashing.py: Password hashing outside of the gevent hub
+
+Copyright 2014-2015, Outernet Inc.
+Some rights reserved.
+
+This software is free software licensed under the terms of GPLv3. See COPYING
+file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
+"""
+
+import base64
+import hashlib
+import logging
+import time
+
+import pbkdf2
+
+from gevent.threadpool import ThreadPool
+
+from ...exts import ext_container as exts
+
+
+#: Number of threads used for hashing, unless configured otherwise
+DEFAULT_POOL_SIZE = 1
+#: Number of PBKDF2 iterations used for new hashes, unless configured otherwise
+DEFAULT_ITERATIONS = 400
+
+#: Prefix of hashes in the format produced by ``pbkdf2.crypt``
+PREFIX = '$p5k2$'
+#: Length of the raw hash in bytes
+HASH_SIZE = 24
+
+_pool = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        size = exts.config.get('auth.hash_pool_size', DEFAULT_POOL_SIZE)
+        _pool = ThreadPool(size)
+    return _pool
+
+
+def pbkdf2_crypt(password, salt=None, iterations=DEFAULT_ITERATIONS):
+    """
+    Drop-in replacement for ``pbkdf2.crypt`` which produces identical hashes
+    using ``hashlib.pbkdf2_hmac``. The latter is implemented in C and releases
+    the GIL while hashing, so the gevent hub keeps running while a worker
+    thread is busy with it, which is not the case with the pure Python
+    implementation of the ``pbkdf2`` package.
+    """
+    if salt is None:
+        salt = pbkdf2._makesalt()
+    if isinstance(password, unicode):
+        password = password.encode('utf-8')
+    salt = str(salt)
+    if salt.startswith(PREFIX):
+        (iterations, salt) = salt.split('$')[2:4]
+        iterations = int(iterations, 16) if iterations else DEFAULT_ITERATIONS
+    if iterations < 1:
+        raise ValueError("Invalid number of iterations: {}".format(iterations))
+    if iterations == DEFAULT_ITERATIONS:
+        salt = '{}${}'.format(PREFIX, salt)
+    else:
+        salt = '{}{:x}${}'.format(PREFIX, iterations, salt)
+    raw = hashlib.pbkdf2_hmac('sha1', password, salt, iterations, HASH_SIZE)
+    return '{}${}'.format(salt, base64.b64encode(raw, './'))
+
+
+if not hasattr(hashlib, 'pbkdf2_hmac'):
+    # Python older than 2.7.8: fall back to the pure Python implementation,
+    # which holds the GIL, so the worker thread competes with the hub for it
+    pbkdf2_crypt = pbkdf2.crypt  # NOQA
+
+
+def crypt(password, salt=None):
+    """
+    Return the PBKDF2 hash of ``password``. The hash is calculated in the
+    thread pool, while the calling greenlet yields to others. If ``salt`` is
+    an existing hash, the number of iterations stored in it is used.
+    """
+    iterations = exts.config.get('auth.hash_iterations', DEFAULT_ITERATIONS)
+    start = time.time()
+    result = get_pool().apply(pbkdf2_crypt, (password, salt, iterations))
+    logging.debug(u"Password hashed in %.3f seconds.", time.time() - start)
+    return result
+
+
+def encrypt(password):
+    return crypt(password)
+
+
+def verify(password, encrypted_password):
+    return encrypted_password == crypt(password, encrypted_password)
@@ -0,0 +1,23 @@
+from ....databases import serializers
+
+
+def convert(db, table, column, keys):
+    """
+    Rewrite the JSON payloads stored in ``column`` of ``table`` in the typed
+    format. Rows are matched by the values of the ``keys`` columns.
+    """
+    where = ' AND '.join('{0} = %({0})s'.format(key) for key in keys)
+    query = db.Update(table, where=where, **{column: '%(data)s'})
+    rows = []
+    for row in db.fetchall(db.Select(sets=table)):
+        params = dict((key, row[key]) for key in keys)
+        params['data'] = serializers.dumps(serializers.loads(row[column] or
+                                                             '{}'))
+        rows.append(params)
+    if rows:
+        db.executemany(query, rows)
+
+
+def up(db, conf):
+    convert(db, 'users', 'options', ('username',))
+    convert(db, 'permissions', 'data', ('name', 'identifier'))
@@ -9,9 +9,8 @@ file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
 """
 
 import copy
-import json
 
-from ..databases.serializers import DateTimeDecoder, DateTimeEncoder
+from ..databases import serializers
 
 
 class Options(object):
@@ -25,7 +24,14 @@ class Options(object):
         if isinstance(data, dict):
             self.__data = data
         else:
-            self.__data = json.loads(data or '{}', cls=DateTimeDecoder)
+            self.__data = serializers.loads(data or '{}')
+        # serialized state of the options at the time changes were deferred,
+        # or ``None`` if changes are not deferred
+        self.__snapshot = None
+
+    def __changed(self):
+        if self.__snapshot is None:
+            self.onchange()
 
     def get(self, key, default=None):
         return self.__data.get(key, default)
@@ -38,20 +44,36 @@ class Options(object):
 
     def __setitem__(self, key, value):
         self.__data[key] = value
-        self.onchange()
+        self.__changed()
 
     def __contains__(self, key):
         return key in self.__data
 
     def __delitem__(self, key):
         del self.__data[key]
-        self.onchange()
+        self.__changed()
 
     def __len__(self):
         return len(self.__data)
 
     def to_json(self):
-        return json.dumps(self.__data, cls=DateTimeEncoder)
+        return serializers.dumps(self.__data, sort_keys=True)
+
+    def defer(self):
+        """Stop invoking the callback on each change. Changes made from now on
+        are reported by a single invocation when :py:meth:`flush` is called,
+        and only if the options are different from what they are now."""
+        self.__snapshot = self.to_json()
+
+    def flush(self):
+        """Invoke the callback if the options were changed since
+        :py:meth:`defer` or the last flush."""
+        if self.__snapshot is None:
+            return
+        data = self.to_json()
+        if data != self.__snapshot:
+            self.__snapshot = data
+            self.onchange()
 
     def to_native(self):
         return copy.copy(self.__data)
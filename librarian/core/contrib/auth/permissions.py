@@ -1,14 +1,17 @@
+import copy
 import functools
-import json
 
 from ...utils import is_string
-from ..databases.serializers import DateTimeDecoder, DateTimeEncoder
+from ..databases import serializers
 
 from .base import BasePermission
 from .helpers import identify_database
 
 
 class BaseDynamicPermission(BasePermission):
+    # maps ``(name, identifier)`` pairs to the stored permission data, which
+    # is kept up to date by :py:meth:`save`, shared by all requests
+    _cache = {}
 
     @identify_database
     def __init__(self, identifier, db):
@@ -17,29 +20,122 @@ class BaseDynamicPermission(BasePermission):
         self.identifier = identifier
         self.data = self._load()
 
+    @property
+    def cache_key(self):
+        return (self.name, self.identifier)
+
+    @classmethod
+    def invalidate(cls):
+        cls._cache.clear()
+
     def _load(self):
-        q = self.db.Select(
-            sets='permissions',
-            where='name = %(name)s AND identifier = %(identifier)s'
-        )
-        result = self.db.fetchone(q, dict(name=self.name,
-                                          identifier=self.identifier))
-        if result:
-            return json.loads(result['data'], cls=DateTimeDecoder)
-        return {}
+        try:
+            data = self._cache[self.cache_key]
+        except KeyError:
+            q = self.db.Select(
+                sets='permissions',
+                where='name = %(name)s AND identifier = %(identifier)s'
+            )
+            result = self.db.fetchone(q, dict(name=self.name,
+                                              identifier=self.identifier))
+            data = {}
+            if result:
+                data = serializers.loads(result['data'])
+            self._cache[self.cache_key] = data
+        # instances modify their data before saving it, so they get a copy
+        return copy.deepcopy(data)
 
     def save(self):
         q = self.db.Replace('permissions',
                             constraints=('name', 'identifier'),
                             cols=('name', 'identifier', 'data'))
-        data = json.dumps(self.data, cls=DateTimeEncoder)
+        data = serializers.dumps(self.data)
         self.db.execute(q, dict(name=self.name,
                                 identifier=self.identifier,
                                 data=data))
+        self._cache[self.cache_key] = copy.deepcopy(self.data)
+
+
+class ACLTrie(object):
+    """
+    Path prefix tree compiled from a mapping of paths to ACL bitmasks. Paths
+    that have no bitmask of their own inherit the bitmask of their closest
+    ancestor that has one.
+
+    Nodes are ``[bitmask, children]`` lists, where ``bitmask`` is ``None`` for
+    nodes that only lead to more specific paths.
+    """
+    SEPARATOR = '/'
+    NO_PERMISSION = 0
+
+    def __init__(self, grants):
+        self.root = [None, {}]
+        for (path, bitmask) in grants.items():
+            node = self.root
+            for part in self.split(path):
+                node = node[1].setdefault(part, [None, {}])
+            node[0] = bitmask
+
+    @classmethod
+    def split(cls, path):
+        return [part for part in path.split(cls.SEPARATOR)
+                if part and part != '.']
+
+    def find(self, path):
+        """
+        Return the node of ``path`` and the bitmask that applies to it. The
+        node is ``None`` if there are no grants on ``path`` or below it.
+        """
+        node = self.root
+        bitmask = node[0] or self.NO_PERMISSION
+        for part in self.split(path):
+            node = node[1].get(part)
+            if node is None:
+                break
+            if node[0] is not None:
+                bitmask = node[0]
+        return (node, bitmask)
+
+    def get(self, path):
+        return self.find(path)[1]
+
+    def inherited(self, path):
+        """
+        Return the bitmask that ``path`` would have without a bitmask of its
+        own, which is the bitmask of its closest ancestor.
+        """
+        parts = self.split(path)
+        if not parts:
+            return self.NO_PERMISSION
+        return self.get(self.SEPARATOR.join(parts[:-1]))
+
+    def filter(self, paths, bitmask):
+        """
+        Return the paths from ``paths`` on which all bits of ``bitmask`` are
+        granted. The tree is walked only once per distinct parent directory.
+        """
+        parents = {}
+        result = []
+        for path in paths:
+            (parent, _, name) = path.rstrip(self.SEPARATOR).rpartition(
+                self.SEPARATOR)
+            try:
+                (node, granted) = parents[parent]
+            except KeyError:
+                (node, granted) = parents[parent] = self.find(parent)
+            if node is not None:
+                child = node[1].get(name)
+                if child is not None and child[0] is not None:
+                    granted = child[0]
+            if granted & bitmask == bitmask:
+                result.append(path)
+        return result
 
 
 class ACLPermission(BaseDynamicPermission):
     name = 'acl'
+    # compiled grants, keyed the same way as the cached permission data
+    _tries = {}
 
     NO_PERMISSION = 0
     READ = 4
@@ -74,24 +170,40 @@ class ACLPermission(BaseDynamicPermission):
             return func(self, path, bitmask)
         return wrapper
 
+    @classmethod
+    def invalidate(cls):
+        super(ACLPermission, cls).invalidate()
+        cls._tries.clear()
+
+    @property
+    def trie(self):
+        try:
+            return self._tries[self.cache_key]
+        except KeyError:
+            trie = self._tries[self.cache_key] = ACLTrie(self.data)
+            return trie
+
+    def save(self):
+        super(ACLPermission, self).save()
+        self._tries.pop(self.cache_key, None)
+
     @to_bitmask
     def grant(self, path, permission):
-        existing = self.data.get(path, self.NO_PERMISSION)
-        self.data[path] = existing | permission
-        self.save()
+        self._update(path, self.trie.get(path) | permission)
 
     @to_bitmask
     def revoke(self, path, permission):
-        existing = self.data.get(path, self.NO_PERMISSION)
-        permission = existing & ~permission
-        if permission == self.NO_PERMISSION:
-            # when having no permission, we can freely just remove the whole
-            # path as not having a path at all also means having no permissions
-            # whatsoever
+        self._update(path, self.trie.get(path) & ~permission)
+
+    def _update(self, path, bitmask):
+        if bitmask == self.trie.inherited(path):
+            # a path that has the same permissions as its closest ancestor
+            # does not need an entry of its own
             self.data.pop(path, None)
         else:
-            self.data[path] = permission
-
+            # this includes an explicit ``NO_PERMISSION`` entry, which
+            # overrides permissions granted on an ancestor
+            self.data[path] = bitmask
         self.save()
 
     def clear(self):
@@ -100,5 +212,12 @@ class ACLPermission(BaseDynamicPermission):
 
     @to_bitmask
     def is_granted(self, path, permission):
-        existing = self.data.get(path, self.NO_PERMISSION)
-        return existing & permission == permission
+        return self.trie.get(path) & permission == permission
+
+    @to_bitmask
+    def filter_paths(self, paths, permission):
+        """
+        Return the paths from ``paths`` on which ``permission`` is granted,
+        either directly or through one of their parent directories.
+        """
+        return self.trie.filter(paths, permission)
@@ -12,6 +12,8 @@ from .users import User
 def store_user_in_session(route):
     if hasattr(request, 'session') and hasattr(request, 'user'):
         request.user.options.collect()
+        # writes the user only once per request, if options were changed
+        request.user.options.flush()
         request.session['user'] = request.user.to_json()
 
 
@@ -22,6 +24,7 @@ def user_plugin(fn):
         request.no_auth = request.app.config['args'].no_auth
         user_data = request.session.get('user', '{}')
         request.user = User.from_json(user_data)
+        request.user.options.defer()
         request.user.options.process()
         return fn(*args, **kwargs)
     return wrapper
@@ -1,18 +1,18 @@
 import functools
 import hashlib
-import json
+import logging
 import re
-
-import pbkdf2
+import time
 
 from bottle import request
 
 from ...exts import ext_container as exts
-from ..databases.serializers import DateTimeDecoder, DateTimeEncoder
+from ..databases import serializers
 from ..databases.utils import utcnow, from_csv, to_csv, row_to_dict
 
 from .base import BaseUser
 from .groups import Group
+from .hashing import encrypt, verify
 from .helpers import identify_database
 from .options import Options
 from .utils import generate_random_key
@@ -93,11 +93,11 @@ class User(BaseUser):
                     created=self.created,
                     options=self.options.to_native(),
                     groups=to_csv([group.name for group in self.groups]))
-        return json.dumps(data, cls=DateTimeEncoder)
+        return serializers.dumps(data, sort_keys=True)
 
     @classmethod
     def from_json(cls, data):
-        return cls(**json.loads(data, cls=DateTimeDecoder))
+        return cls(**serializers.loads(data))
 
     @classmethod
     @identify_database
@@ -165,15 +165,21 @@ class User(BaseUser):
     @classmethod
     @identify_database
     def login(cls, username, password, db):
+        start = time.time()
         username = (username or '').strip()
         password = (password or '').strip()
         user = cls.from_username(username, db=db)
         if user and cls.is_valid_password(password, user.password):
+            user.options.defer()
             request.user = user
             request.session['user'] = user.to_json()
             request.session.rotate()
+            logging.debug(u"Login of '%s' took %.3f seconds.", username,
+                          time.time() - start)
             return user
 
+        logging.debug(u"Failed login of '%s' took %.3f seconds.", username,
+                      time.time() - start)
         return False
 
     @classmethod
@@ -188,11 +194,11 @@ class User(BaseUser):
 
     @staticmethod
     def encrypt_password(password):
-        return pbkdf2.crypt(password)
+        return encrypt(password)
 
     @staticmethod
     def is_valid_password(password, encrypted_password):
-        return encrypted_password == pbkdf2.crypt(password, encrypted_password)
+        return verify(password, encrypted_password)
 
     @staticmethod
     def generate_reset_token():
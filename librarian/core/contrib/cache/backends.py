@@ -8,13 +8,19 @@ This software is free software licensed under the terms of GPLv3. See COPYING
 file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
 """
 
-import sys
+import collections
+import cPickle as pickle
+import heapq
+import logging
+import os
+import struct
 import time
 import uuid
+import zlib
 
 import validators as v
 
-from .utils import strip_protocol
+from .utils import deep_size, read_meminfo, strip_protocol
 
 
 class BaseCache(object):
@@ -27,8 +33,16 @@ class BaseCache(object):
     class Config:
         timeout = v.istype(int)
 
+    #: Names of the counters reported by :py:meth:`stats`
+    COUNTERS = ('hits', 'misses', 'sets', 'evictions', 'expirations')
+    #: Name under which the counters of keys without a known prefix are
+    #: reported
+    NO_PREFIX = ''
+
     def __init__(self, timeout=0, **kwargs):
         self.default_timeout = timeout
+        self._prefixes = set()
+        self.reset_stats()
 
     def get(self, key):
         raise NotImplementedError()
@@ -42,9 +56,39 @@ class BaseCache(object):
     def clear(self):
         raise NotImplementedError()
 
+    def get_many(self, keys):
+        """Return a dict of the values found under any of the passed in
+        ``keys``. Keys which are not found are omitted from the result.
+        Backends which are able to fetch multiple keys at once are meant to
+        override it.
+        """
+        found = dict()
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def set_many(self, mapping, timeout=None):
+        """Store all the key-value pairs of ``mapping``."""
+        for (key, value) in mapping.items():
+            self.set(key, value, timeout=timeout)
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.delete(key)
+
     def parse_prefix(self, prefix):
+        """Return the current version of ``prefix``, which should be used
+        for building keys that are expected to be invalidated together by
+        :py:meth:`invalidate`.
+        """
         raise NotImplementedError()
 
+    def prefixed(self, prefix, key):
+        """Return ``key`` prefixed with the current version of ``prefix``."""
+        return '{0}{1}'.format(self.parse_prefix(prefix), key)
+
     def invalidate(self, prefix):
         """Invalidates all cached data where the cached `key` starts with the
         given prefix.
@@ -55,6 +99,54 @@ class BaseCache(object):
         """
         raise NotImplementedError()
 
+    def sweep(self):
+        """Remove expired entries from the cache. It is invoked periodically,
+        and is meant to be overridden by backends that keep expired entries
+        around until they are accessed again.
+        """
+        pass
+
+    def _prefix_of(self, key):
+        """Return the longest of the known prefixes that ``key`` starts
+        with."""
+        found = self.NO_PREFIX
+        for prefix in self._prefixes:
+            if len(prefix) > len(found) and key.startswith(prefix):
+                found = prefix
+        return found
+
+    def _count(self, counter, key=None, amount=1):
+        """Increment ``counter`` both in total and for the prefix of
+        ``key``."""
+        self._counters[counter] += amount
+        prefix = self.NO_PREFIX if key is None else self._prefix_of(key)
+        try:
+            counters = self._prefix_counters[prefix]
+        except KeyError:
+            counters = self._prefix_counters[prefix] = dict.fromkeys(
+                self.COUNTERS, 0)
+        counters[counter] += amount
+
+    def reset_stats(self):
+        """Reset all counters reported by :py:meth:`stats` to zero."""
+        self._counters = dict.fromkeys(self.COUNTERS, 0)
+        self._prefix_counters = dict()
+
+    def stats(self):
+        """Return a dict of counters of the cache operations since the last
+        reset, together with a breakdown of the counters per prefix under the
+        ``prefixes`` key. Backends which know the number of stored items and
+        the storage they take up add them under the ``items`` and ``bytes``
+        keys, which are ``None`` otherwise.
+        """
+        stats = dict(self._counters)
+        stats.update(backend=self.identifier,
+                     items=None,
+                     bytes=None,
+                     prefixes=dict((prefix, dict(counters)) for (prefix,
+                                   counters) in self._prefix_counters.items()))
+        return stats
+
     def get_expiry(self, timeout):
         if timeout is None:
             timeout = self.default_timeout
@@ -104,48 +196,107 @@ class NoOpCache(BaseCache):
     def clear(self):
         return
 
-    def parse_prefix(self, prefix):
+    def get_many(self, keys):
+        return dict()
+
+    def set_many(self, mapping, timeout=None):
         return
 
+    def delete_many(self, keys):
+        return
+
+    def parse_prefix(self, prefix):
+        return prefix
+
     def invalidate(self, prefix):
         return
 
 
 class InMemoryCache(BaseCache):
-    """Simple in-memory cache backend"""
+    """Simple in-memory cache backend
+
+    Prefixes are versioned by a generation counter which is incremented when
+    the prefix is invalidated, so invalidation takes constant time no matter
+    how many items are stored. Items stored under an outdated generation can
+    no longer be reached, and they are deleted by the next :py:meth:`sweep`,
+    which finds them through an index of keys per prefix.
+    """
     identifier = 'in-memory'
 
     def __init__(self, **kwargs):
         super(InMemoryCache, self).__init__(**kwargs)
         self._cache = dict()
+        self._generations = dict()
+        self._index = dict()
+        self._stale = []
+
+    def _track(self, key):
+        """Add ``key`` to the index of the prefix that it starts with."""
+        for (parsed_prefix, keys) in self._index.items():
+            if key.startswith(parsed_prefix):
+                keys.add(key)
+                return
+
+    def _untrack(self, key):
+        for keys in self._index.values():
+            keys.discard(key)
 
     def get(self, key):
         try:
             (expires, data) = self._cache[key]
             if not self.has_expired(expires):
+                self._count('hits', key)
                 return data
             self.delete(key)  # delete expired data from cache
+            self._count('expirations', key)
         except KeyError:
-            return None
+            pass
+        self._count('misses', key)
+        return None
 
     def set(self, key, value, timeout=None):
         expires = self.get_expiry(timeout)
         self._cache[key] = (expires, value)
+        self._track(key)
+        self._count('sets', key)
 
     def delete(self, key):
         self._cache.pop(key, None)
+        self._untrack(key)
 
     def clear(self):
         self._cache = dict()
+        self._index = dict((p, set()) for p in self._index)
+        self._stale = []
 
     def parse_prefix(self, prefix):
-        return prefix
+        self._prefixes.add(prefix)
+        generation = self._generations.get(prefix, 0)
+        parsed_prefix = '{0}{1}:'.format(prefix, generation)
+        self._index.setdefault(parsed_prefix, set())
+        return parsed_prefix
 
     def invalidate(self, prefix):
-        for key in list(self._cache.keys()):
-            if key.startswith(prefix):
+        parsed_prefix = self.parse_prefix(prefix)
+        self._generations[prefix] = self._generations.get(prefix, 0) + 1
+        self._stale.append(self._index.pop(parsed_prefix))
+
+    def sweep(self):
+        """Delete the items stored under outdated prefix generations."""
+        (stale, self._stale) = (self._stale, [])
+        for keys in stale:
+            for key in keys:
                 self.delete(key)
 
+    def _get_size(self):
+        """Return the number of bytes taken up by the stored items."""
+        return deep_size(self._cache)
+
+    def stats(self):
+        stats = super(InMemoryCache, self).stats()
+        stats.update(items=len(self._cache), bytes=self._get_size())
+        return stats
+
 
 class ScoredInMemoryCache(InMemoryCache):
     """In-memory cache with a specified storage limit. Items are scored and
@@ -180,6 +331,7 @@ class ScoredInMemoryCache(InMemoryCache):
         while self._cache and self.has_reached_limit():
             lowest_scored_key = min(self._scores, key=self._scores.get)
             self.delete(lowest_scored_key)
+            self._count('evictions', lowest_scored_key)
 
     def set(self, key, value, timeout=None):
         if key not in self._cache:
@@ -218,7 +370,7 @@ class SizeScoredInMemoryCache(ScoredInMemoryCache):
 
     def set(self, key, value, timeout=None):
         super(SizeScoredInMemoryCache, self).set(key, value, timeout=timeout)
-        item_size = sys.getsizeof(value)
+        item_size = deep_size(value)
         self._sizes[key] = item_size
         self._cache_size += item_size
 
@@ -232,6 +384,447 @@ class SizeScoredInMemoryCache(ScoredInMemoryCache):
         self._sizes = dict()
         self._cache_size = 0
 
+    def _get_size(self):
+        return self._cache_size
+
+
+class LRUInMemoryCache(InMemoryCache):
+    """In-memory cache with a specified limit on the number of items, where
+    the least recently used item is evicted when the limit is reached. All
+    operations take constant time.
+
+    Expired items are removed periodically by :py:meth:`sweep`, without
+    having to look at every item: keys are grouped into buckets of a timer
+    wheel by their expiry time, so only the buckets that are due need to be
+    visited.
+
+    The number of items is kept exact, since they are removed as soon as they
+    expire.
+    """
+    identifier = 'lru-in-memory'
+    #: Time span covered by a single bucket of the timer wheel in seconds
+    WHEEL_RESOLUTION = 5
+
+    class Config(InMemoryCache.Config):
+        lru_items = v.istype(int)
+
+    def __init__(self, lru_items, **kwargs):
+        super(LRUInMemoryCache, self).__init__(**kwargs)
+        self.limit = lru_items
+        self.clear()
+
+    def _slot(self, expires):
+        return int(expires // self.WHEEL_RESOLUTION)
+
+    def get(self, key):
+        try:
+            (expires, data) = self._cache.pop(key)
+        except KeyError:
+            self._count('misses', key)
+            return None
+        if self.has_expired(expires):
+            self._discard(key, expires)
+            self._count('expirations', key)
+            self._count('misses', key)
+            return None
+        # reinserting the item moves it to the most recently used end
+        self._cache[key] = (expires, data)
+        self._count('hits', key)
+        return data
+
+    def _schedule(self, key, expires):
+        if expires <= 0:
+            return
+        slot = self._slot(expires)
+        if slot not in self._wheel:
+            self._wheel[slot] = set()
+            heapq.heappush(self._slots, slot)
+        self._wheel[slot].add(key)
+
+    def _unschedule(self, key, expires):
+        if expires <= 0:
+            return
+        slot = self._slot(expires)
+        keys = self._wheel.get(slot)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._wheel[slot]
+
+    def _discard(self, key, expires):
+        """Clean up after the item under ``key`` was removed."""
+        self._unschedule(key, expires)
+        self._untrack(key)
+
+    def _evict(self):
+        """Remove the least recently used item, which is the first one."""
+        (key, (expires, _)) = self._cache.popitem(last=False)
+        self._discard(key, expires)
+        self._count('evictions', key)
+
+    def set(self, key, value, timeout=None):
+        expires = self.get_expiry(timeout)
+        try:
+            (old_expires, _) = self._cache.pop(key)
+        except KeyError:
+            if self.limit and len(self._cache) >= self.limit:
+                self._evict()
+        else:
+            self._discard(key, old_expires)
+        self._cache[key] = (expires, value)
+        self._schedule(key, expires)
+        self._track(key)
+        self._count('sets', key)
+
+    def delete(self, key):
+        try:
+            (expires, _) = self._cache.pop(key)
+        except KeyError:
+            return
+        self._discard(key, expires)
+
+    def clear(self):
+        super(LRUInMemoryCache, self).clear()
+        self._cache = collections.OrderedDict()
+        self._wheel = dict()
+        self._slots = []
+
+    def sweep(self):
+        """Remove expired items from the buckets of the timer wheel which are
+        due, and the items stored under outdated prefix generations.
+        """
+        super(LRUInMemoryCache, self).sweep()
+        now = time.time()
+        current = self._slot(now)
+        pending = []
+        while self._slots and self._slots[0] <= current:
+            slot = heapq.heappop(self._slots)
+            # buckets that became empty are removed from the wheel, but not
+            # from the heap of slots
+            for key in self._wheel.pop(slot, ()):
+                (expires, _) = self._cache[key]
+                if expires < now:
+                    del self._cache[key]
+                    self._discard(key, expires)
+                    self._count('expirations', key)
+                else:
+                    # the current bucket may hold items which are not due yet
+                    pending.append((key, expires))
+        for (key, expires) in pending:
+            self._schedule(key, expires)
+
+    def stats(self):
+        stats = super(LRUInMemoryCache, self).stats()
+        stats.update(limit=self.limit)
+        return stats
+
+
+class SizedLRUInMemoryCache(LRUInMemoryCache):
+    """LRU in-memory cache with a budget on the number of bytes retained by
+    the stored items. The size of an item is measured including all the
+    objects it references, so the budget reflects the real memory usage much
+    more closely than the shallow size used by
+    :py:class:`SizeScoredInMemoryCache`. Items bigger than the whole budget
+    are not stored at all.
+
+    If ``pressure_ratio`` is set, the available memory is checked in every
+    :py:meth:`sweep`, and if it's below that ratio of the total memory, half
+    of the cache is evicted. The number of items is not limited.
+    """
+    identifier = 'sized-lru-in-memory'
+    #: Fraction of the current usage kept when shrinking under pressure
+    SHRINK_RATIO = 0.5
+    #: Location of the kernel memory statistics
+    MEMINFO_PATH = '/proc/meminfo'
+
+    class Config(InMemoryCache.Config):
+        budget = v.istype(float)
+        pressure_ratio = v.istype(float)
+
+    def __init__(self, budget, pressure_ratio=0.0, **kwargs):
+        self.budget = int(budget)
+        self.pressure_ratio = pressure_ratio
+        super(SizedLRUInMemoryCache, self).__init__(lru_items=0, **kwargs)
+
+    def _discard(self, key, expires):
+        super(SizedLRUInMemoryCache, self)._discard(key, expires)
+        self.usage -= self._sizes.pop(key, 0)
+
+    def set(self, key, value, timeout=None):
+        size = deep_size(key) + deep_size(value)
+        self.delete(key)
+        if self.budget and size > self.budget:
+            return
+        while self._cache and self.budget and self.usage + size > self.budget:
+            self._evict()
+        super(SizedLRUInMemoryCache, self).set(key, value, timeout=timeout)
+        self._sizes[key] = size
+        self.usage += size
+
+    def clear(self):
+        super(SizedLRUInMemoryCache, self).clear()
+        self._sizes = dict()
+        self.usage = 0
+
+    def is_under_pressure(self):
+        meminfo = read_meminfo(self.MEMINFO_PATH)
+        try:
+            available = meminfo['MemAvailable']
+            total = meminfo['MemTotal']
+        except KeyError:
+            return False
+        return total > 0 and float(available) / total < self.pressure_ratio
+
+    def shrink(self, ratio=SHRINK_RATIO):
+        """Evict least recently used items until the usage drops to the
+        specified ``ratio`` of the current usage.
+        """
+        target = self.usage * ratio
+        while self._cache and self.usage > target:
+            self._evict()
+
+    def sweep(self):
+        super(SizedLRUInMemoryCache, self).sweep()
+        if self.pressure_ratio and self.is_under_pressure():
+            before = self.usage
+            self.shrink()
+            logging.warning(u"Cache shrunk from %s to %s bytes due to memory "
+                            u"pressure.", before, self.usage)
+
+    def _get_size(self):
+        return self.usage
+
+    def stats(self):
+        stats = super(SizedLRUInMemoryCache, self).stats()
+        stats.update(budget=self.budget)
+        return stats
+
+
+class DiskCache(BaseCache):
+    """Persistent cache backend which keeps the items in an append-only log
+    file, so they survive restarts, and an in-memory index pointing to their
+    location within the log.
+
+    Every change is appended to the log as a record, which is checksummed,
+    so when the log is loaded on startup, a partially written record left
+    behind by a crash is detected, and the log is truncated to the last
+    complete record. Invalidation of a prefix is recorded with a single
+    record as well.
+
+    The log is compacted by rewriting only the live items into a new log,
+    which replaces the old one atomically. It happens in :py:meth:`sweep` if
+    most of the log is taken up by outdated records, or when the size of the
+    log exceeds ``max_bytes``, in which case the least recently used items
+    are evicted first, until they take up at most half of ``max_bytes``.
+
+    :param path:       path to the log file
+    :param max_bytes:  maximum size of the log file in bytes
+    """
+    identifier = 'disk'
+    #: Record header: checksum, expiry, record kind, key and value length
+    HEADER = struct.Struct('<IdBHI')
+    #: Record kinds
+    SET = 0
+    DELETE = 1
+    INVALIDATE = 2
+    #: Fraction of ``limit`` taken up by the items kept after eviction
+    EVICT_RATIO = 0.5
+    #: Fraction of the log taken up by outdated records triggering compaction
+    GARBAGE_RATIO = 0.5
+
+    class Config(BaseCache.Config):
+        path = v.instanceof(basestring)
+        max_bytes = v.istype(float)
+
+    def __init__(self, path, max_bytes, **kwargs):
+        super(DiskCache, self).__init__(**kwargs)
+        self.path = path
+        self.limit = int(max_bytes)
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        self._open()
+        self._load()
+
+    @staticmethod
+    def _encode_key(key):
+        if isinstance(key, unicode):
+            return key.encode('utf-8')
+        return key
+
+    def _open(self):
+        if not os.path.exists(self.path):
+            open(self.path, 'wb').close()
+        self._log = open(self.path, 'r+b')
+        self._log.seek(0, os.SEEK_END)
+        self._end = self._log.tell()
+
+    def _read_record(self, offset):
+        """Return the record at ``offset`` as a tuple of the expiry, kind,
+        key, raw value and total size, or ``None`` if the record is not
+        complete or it's corrupted."""
+        self._log.seek(offset)
+        header = self._log.read(self.HEADER.size)
+        if len(header) < self.HEADER.size:
+            return None
+        (checksum, expires, kind, key_size, value_size) = \
+            self.HEADER.unpack(header)
+        body = self._log.read(key_size + value_size)
+        if len(body) < key_size + value_size:
+            return None
+        if zlib.crc32(header[4:] + body) & 0xffffffff != checksum:
+            return None
+        return (expires,
+                kind,
+                body[:key_size],
+                body[key_size:],
+                self.HEADER.size + key_size + value_size)
+
+    def _load(self):
+        """Rebuild the index by replaying all records of the log."""
+        self._index = collections.OrderedDict()
+        self._live = 0
+        offset = 0
+        while offset < self._end:
+            record = self._read_record(offset)
+            if record is None:
+                logging.warning(u"Cache log %s is damaged at %s, truncating "
+                                u"it.", self.path, offset)
+                self._log.truncate(offset)
+                self._end = offset
+                break
+            (expires, kind, key, _, size) = record
+            if kind == self.INVALIDATE:
+                self._remove_prefixed(key)
+            else:
+                self._remove(key)
+                if kind == self.SET and not self.has_expired(expires):
+                    self._index[key] = (offset, size, expires)
+                    self._live += size
+            offset += size
+
+    def _append(self, kind, key, value='', expires=0):
+        body = key + value
+        header = self.HEADER.pack(0, expires, kind, len(key), len(value))
+        checksum = zlib.crc32(header[4:] + body) & 0xffffffff
+        record = struct.pack('<I', checksum) + header[4:] + body
+        offset = self._end
+        self._log.seek(offset)
+        self._log.write(record)
+        self._log.flush()
+        self._end += len(record)
+        return (offset, len(record))
+
+    def _remove(self, key):
+        try:
+            (_, size, _) = self._index.pop(key)
+        except KeyError:
+            return False
+        self._live -= size
+        return True
+
+    def _remove_prefixed(self, prefix):
+        for key in [k for k in self._index if k.startswith(prefix)]:
+            self._remove(key)
+
+    def get(self, key):
+        key = self._encode_key(key)
+        try:
+            (offset, size, expires) = self._index.pop(key)
+        except KeyError:
+            self._count('misses', key)
+            return None
+        if self.has_expired(expires):
+            self._live -= size
+            self._count('expirations', key)
+            self._count('misses', key)
+            return None
+        # reinserting the item moves it to the most recently used end
+        self._index[key] = (offset, size, expires)
+        record = self._read_record(offset)
+        try:
+            value = pickle.loads(record[3])
+        except Exception:
+            logging.exception(u"Cached value of %s could not be read.", key)
+            self._remove(key)
+            self._count('misses', key)
+            return None
+        self._count('hits', key)
+        return value
+
+    def set(self, key, value, timeout=None):
+        key = self._encode_key(key)
+        expires = self.get_expiry(timeout)
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self._remove(key)
+        (offset, size) = self._append(self.SET, key, data, expires)
+        self._index[key] = (offset, size, expires)
+        self._live += size
+        self._count('sets', key)
+        if self.limit and self._end > self.limit:
+            self._evict()
+
+    def delete(self, key):
+        key = self._encode_key(key)
+        if self._remove(key):
+            self._append(self.DELETE, key)
+
+    def clear(self):
+        self._log.truncate(0)
+        self._end = 0
+        self._index = collections.OrderedDict()
+        self._live = 0
+
+    def parse_prefix(self, prefix):
+        self._prefixes.add(self._encode_key(prefix))
+        return prefix
+
+    def invalidate(self, prefix):
+        prefix = self._encode_key(prefix)
+        self._remove_prefixed(prefix)
+        self._append(self.INVALIDATE, prefix)
+
+    def _evict(self):
+        """Evict the least recently used items until they take up at most
+        ``EVICT_RATIO`` of the limit and compact the log."""
+        target = self.limit * self.EVICT_RATIO
+        while self._index and self._live > target:
+            (key, (_, size, _)) = self._index.popitem(last=False)
+            self._live -= size
+            self._count('evictions', key)
+        self.compact()
+
+    def compact(self):
+        """Rewrite the log so it contains only the live items."""
+        tmp_path = self.path + '.tmp'
+        index = collections.OrderedDict()
+        with open(tmp_path, 'wb') as tmp_log:
+            for (key, (offset, size, expires)) in self._index.items():
+                self._log.seek(offset)
+                index[key] = (tmp_log.tell(), size, expires)
+                tmp_log.write(self._log.read(size))
+            tmp_log.flush()
+            os.fsync(tmp_log.fileno())
+        self._log.close()
+        os.rename(tmp_path, self.path)
+        self._open()
+        self._index = index
+
+    def sweep(self):
+        """Remove expired items and compact the log if most of it is taken
+        up by outdated records."""
+        for (key, (_, _, expires)) in self._index.items():
+            if self.has_expired(expires):
+                self._remove(key)
+                self._count('expirations', key)
+        if self._end - self._live > self._end * self.GARBAGE_RATIO:
+            self.compact()
+
+    def stats(self):
+        stats = super(DiskCache, self).stats()
+        stats.update(items=len(self._index), bytes=self._end, limit=self.limit)
+        return stats
+
 
 class MemcachedCache(BaseCache):
     """Memcached based cache backend
@@ -260,11 +853,14 @@ class MemcachedCache(BaseCache):
             self._cache = pylibmc.Client(servers)
 
     def get(self, key):
-        return self._cache.get(key)
+        value = self._cache.get(key)
+        self._count('misses' if value is None else 'hits', key)
+        return value
 
     def set(self, key, value, timeout=None):
         expires = int(self.get_expiry(timeout))
         self._cache.set(key, value, expires)
+        self._count('sets', key)
 
     def delete(self, key):
         self._cache.delete(key)
@@ -272,6 +868,22 @@ class MemcachedCache(BaseCache):
     def clear(self):
         self._cache.flush_all()
 
+    def get_many(self, keys):
+        keys = list(keys)
+        found = self._cache.get_multi(keys)
+        for key in keys:
+            self._count('hits' if key in found else 'misses', key)
+        return found
+
+    def set_many(self, mapping, timeout=None):
+        expires = int(self.get_expiry(timeout))
+        self._cache.set_multi(mapping, expires)
+        for key in mapping:
+            self._count('sets', key)
+
+    def delete_many(self, keys):
+        self._cache.delete_multi(list(keys))
+
     def _new_prefix(self, prefix):
         prefix_key = '{0}{1}'.format(self.prefixes_key, prefix)
         new_prefix = '{0}{1}'.format(prefix, uuid.uuid4())
@@ -279,8 +891,9 @@ class MemcachedCache(BaseCache):
         return new_prefix
 
     def parse_prefix(self, prefix):
+        self._prefixes.add(prefix)
         prefix_key = '{0}{1}'.format(self.prefixes_key, prefix)
-        actual_prefix = self._cache.get(prefix_key)
+        actual_prefix = self.get(prefix_key)
         if not actual_prefix:
             actual_prefix = self._new_prefix(prefix)
 
@@ -288,3 +901,110 @@ class MemcachedCache(BaseCache):
 
     def invalidate(self, prefix):
         self._new_prefix(prefix)
+
+    def stats(self):
+        """Return the counters of this client, together with the number of
+        items and bytes, and the evictions reported by the servers."""
+        stats = super(MemcachedCache, self).stats()
+        try:
+            server_stats = self._cache.get_stats()
+        except Exception:
+            logging.exception(u"Memcached stats could not be obtained.")
+            return stats
+        totals = dict(curr_items=0, bytes=0, evictions=0)
+        for (_, values) in server_stats:
+            for name in totals:
+                totals[name] += int(values.get(name, 0))
+        stats.update(items=totals['curr_items'],
+                     bytes=totals['bytes'],
+                     evictions=totals['evictions'])
+        return stats
+
+
+class TieredCache(MemcachedCache):
+    """Memcached based cache backend with a small in-process LRU cache in
+    front of it, which keeps recently used items for a short time only, so
+    repeated lookups of the same keys don't have to go over the network.
+
+    Items are written to both tiers. Since other processes sharing the same
+    memcached servers can't update the in-process tier, they may see
+    outdated values for up to ``local_timeout`` seconds.
+
+    :param local_limit:    maximum number of items in the in-process tier
+    :param local_timeout:  maximum time in seconds an item is kept in the
+                           in-process tier
+    """
+    identifier = 'tiered'
+
+    class Config(MemcachedCache.Config):
+        local_limit = v.istype(int)
+        local_timeout = v.istype(int)
+
+    def __init__(self, local_limit, local_timeout, **kwargs):
+        super(TieredCache, self).__init__(**kwargs)
+        self.local_timeout = local_timeout
+        self._local = LRUInMemoryCache(lru_items=local_limit)
+
+    def _get_local_timeout(self, timeout):
+        if timeout is None:
+            timeout = self.default_timeout
+        if timeout > 0:
+            return min(timeout, self.local_timeout)
+        return self.local_timeout
+
+    def get(self, key):
+        value = self._local.get(key)
+        if value is not None:
+            self._count('hits', key)
+            return value
+        value = super(TieredCache, self).get(key)
+        if value is not None:
+            self._local.set(key, value, timeout=self.local_timeout)
+        return value
+
+    def set(self, key, value, timeout=None):
+        super(TieredCache, self).set(key, value, timeout=timeout)
+        self._local.set(key, value, timeout=self._get_local_timeout(timeout))
+
+    def delete(self, key):
+        super(TieredCache, self).delete(key)
+        self._local.delete(key)
+
+    def clear(self):
+        super(TieredCache, self).clear()
+        self._local.clear()
+
+    def get_many(self, keys):
+        keys = list(keys)
+        found = self._local.get_many(keys)
+        for key in found:
+            self._count('hits', key)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            fetched = super(TieredCache, self).get_many(missing)
+            self._local.set_many(fetched, timeout=self.local_timeout)
+            found.update(fetched)
+        return found
+
+    def set_many(self, mapping, timeout=None):
+        super(TieredCache, self).set_many(mapping, timeout=timeout)
+        self._local.set_many(mapping,
+                             timeout=self._get_local_timeout(timeout))
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        super(TieredCache, self).delete_many(keys)
+        self._local.delete_many(keys)
+
+    def sweep(self):
+        self._local.sweep()
+
+    def reset_stats(self):
+        super(TieredCache, self).reset_stats()
+        if hasattr(self, '_local'):
+            self._local.reset_stats()
+
+    def stats(self):
+        stats = super(TieredCache, self).stats()
+        stats.update(local=self._local.stats())
+        return stats
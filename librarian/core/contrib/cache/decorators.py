@@ -1,5 +1,10 @@
+import collections
 import functools
+import logging
+import time
 
+import gevent
+from gevent.event import AsyncResult
 from bottle import request
 
 from ...utils import is_string
@@ -7,7 +12,76 @@ from ...utils import is_string
 from .utils import generate_key
 
 
-def cached(prefix='', timeout=None):
+#: Maximum time in seconds to wait for a value which is being computed by
+#: another greenlet, before computing it independently
+WAIT_TIMEOUT = 10
+
+#: Results of the computations currently in progress, by cache key
+_pending = dict()
+#: Stored return value, together with the time until which it's fresh, or
+#: ``None`` if it doesn't become stale. Wrapping the value distinguishes
+#: ``None`` return values from missing ones.
+Entry = collections.namedtuple('Entry', ('fresh_until', 'value'))
+#: Number of hits, misses, waits and stale hits of ``cached`` by prefix
+_stats = collections.defaultdict(lambda: dict(hits=0,
+                                              misses=0,
+                                              waits=0,
+                                              stale=0))
+
+
+def get_stats():
+    """Return the statistics of cached functions, grouped by prefix."""
+    return dict((prefix, dict(counters))
+                for (prefix, counters) in _stats.items())
+
+
+def reset_stats():
+    _stats.clear()
+
+
+def store(backend, key, value, timeout, stale):
+    """Store ``value`` under ``key``. If ``stale`` is set, the value is kept
+    for that many seconds after it expires, together with the time it expired
+    at, so it can still be served while it's being recomputed."""
+    fresh_until = None
+    if stale:
+        fresh_until = time.time() + timeout
+        timeout += stale
+    backend.set(key, Entry(fresh_until, value), timeout=timeout)
+
+
+def compute(backend, key, func, args, kwargs, timeout, stale):
+    """Call ``func`` and store it's return value. Other greenlets that need
+    the same value in the meantime wait for the result of this call, instead
+    of calling ``func`` themselves."""
+    result = _pending[key] = AsyncResult()
+    try:
+        value = func(*args, **kwargs)
+        store(backend, key, value, timeout, stale)
+    except Exception as exc:
+        result.set_exception(exc)
+        raise
+    else:
+        result.set(value)
+        return value
+    finally:
+        if _pending.get(key) is result:
+            del _pending[key]
+
+
+def refresh(environ, backend, key, func, args, kwargs, timeout, stale):
+    """Recompute a stale value in the background. The request it was served
+    to may be over by then, so a copy of its environment is bound to the
+    greenlet, making ``request`` available to ``func``."""
+    request.bind(environ)
+    try:
+        compute(backend, key, func, args, kwargs, timeout, stale)
+    except Exception:
+        logging.exception(u"Refreshing cached value of %s failed.",
+                          func.__name__)
+
+
+def cached(prefix='', timeout=None, stale=0, wait=WAIT_TIMEOUT):
     """Decorator that caches return values of functions that it wraps. The
     key is generated from the function's name and the parameters passed to
     it. E.g.:
@@ -20,6 +94,13 @@ def cached(prefix='', timeout=None):
     values of: function's name("my_func"), and values of `a`, `b` and in
     case of keyword arguments both argument name "c" and the value of `c`,
     prefix with the value of the `prefix` keyword argument.
+
+    The value is computed only once when multiple greenlets need it at the
+    same time. The rest of them wait for the result at most `wait` seconds.
+
+    If `stale` is specified, expired values are still returned for that many
+    seconds, while a background greenlet computes the new value, with a copy
+    of the current request's environment.
     """
     def decorator(func):
         @functools.wraps(func)
@@ -29,17 +110,37 @@ def cached(prefix='', timeout=None):
 
             backend = request.app.supervisor.exts.cache
             generated = generate_key(func.__name__, *args, **kwargs)
-            parsed_prefix = backend.parse_prefix(prefix)
-            key = '{0}{1}'.format(parsed_prefix, generated)
-            value = backend.get(key)
-            if value is None:
-                # not found in cache, or is expired, recalculate value
-                value = func(*args, **kwargs)
-                expires_in = timeout
-                if expires_in is None:
-                    expires_in = backend.default_timeout
-                backend.set(key, value, timeout=expires_in)
-            return value
+            key = backend.prefixed(prefix, generated)
+            expires_in = timeout
+            if expires_in is None:
+                expires_in = backend.default_timeout
+            # values which never expire can't become stale either
+            keep_stale = stale if expires_in > 0 else 0
+            stats = _stats[prefix]
+            entry = backend.get(key)
+            if isinstance(entry, Entry):
+                if (entry.fresh_until is not None and
+                        entry.fresh_until < time.time()):
+                    stats['stale'] += 1
+                    if key not in _pending:
+                        gevent.spawn(refresh, dict(request.environ), backend,
+                                     key, func, args, kwargs, expires_in,
+                                     keep_stale)
+                    return entry.value
+                stats['hits'] += 1
+                return entry.value
+            pending = _pending.get(key)
+            if pending is not None:
+                stats['waits'] += 1
+                try:
+                    return pending.get(timeout=wait)
+                except gevent.Timeout:
+                    # the greenlet computing the value takes too long
+                    pass
+            # not found in cache, or is expired, recalculate value
+            stats['misses'] += 1
+            return compute(backend, key, func, args, kwargs, expires_in,
+                           keep_stale)
         return wrapper
     return decorator
 
@@ -1,4 +1,5 @@
 from .backends import BaseCache
+from . import decorators
 
 
 class CacheConfigError(Exception):
@@ -36,3 +37,18 @@ def setup(backend, config):
                     raise CacheConfigError(msg)
 
     return backend_cls(**options)
+
+
+def get_stats(cache):
+    """Return the stats of the ``cache`` backend, and the stats of functions
+    cached with the :py:func:`~librarian.core.contrib.cache.decorators.cached`
+    decorator under the ``cached`` key.
+    """
+    stats = cache.stats()
+    stats.update(cached=decorators.get_stats())
+    return stats
+
+
+def reset_stats(cache):
+    cache.reset_stats()
+    decorators.reset_stats()
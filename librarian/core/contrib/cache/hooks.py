@@ -6,3 +6,8 @@ from .helpers import setup
 def initialize(supervisor):
     backend = supervisor.config['cache.backend']
     supervisor.exts.cache = setup(backend, supervisor.config)
+
+
+@hook('background')
+def background(supervisor):
+    supervisor.exts.cache.sweep()
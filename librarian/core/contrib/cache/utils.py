@@ -1,4 +1,8 @@
+import collections
 import hashlib
+import logging
+import sys
+import types
 
 from bottle_utils.common import to_bytes
 
@@ -18,3 +22,64 @@ def generate_key(*args, **kwargs):
 
 def strip_protocol(url, sep='://'):
     return url[url.find(sep) + len(sep):] if sep in url else url
+
+
+#: Types of objects which are shared, rather than owned by cached values
+SHARED_TYPES = (type, types.ClassType, types.ModuleType, types.FunctionType,
+                types.BuiltinFunctionType, types.MethodType)
+#: Methods that identify objects managing resources, such as database
+#: handles, connections, files, locks and greenlets, which are shared by
+#: everything that references them
+RESOURCE_METHODS = ('cursor', 'connect', 'fileno', 'acquire', 'switch')
+
+
+def is_shared(obj):
+    """Return whether ``obj`` is shared with the rest of the application
+    rather than owned by the object that references it."""
+    if isinstance(obj, SHARED_TYPES):
+        return True
+    cls = type(obj)
+    return any(hasattr(cls, name) for name in RESOURCE_METHODS)
+
+
+def deep_size(obj):
+    """Return the approximate number of bytes retained by ``obj``, including
+    all the objects that it references. Each object is counted only once,
+    and shared objects, like classes, modules, functions and database
+    handles are not counted at all, nor the objects they reference, since
+    they are not owned by the object referencing them."""
+    seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if id(current) in seen or is_shared(current):
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset,
+                                  collections.deque)):
+            stack.extend(current)
+        if hasattr(current, '__dict__'):
+            stack.append(current.__dict__)
+        for name in getattr(type(current), '__slots__', ()):
+            if hasattr(current, name):
+                stack.append(getattr(current, name))
+    return size
+
+
+def read_meminfo(path='/proc/meminfo'):
+    """Return the contents of ``/proc/meminfo`` as a dict of values in
+    kilobytes, or an empty dict if it's not available."""
+    meminfo = dict()
+    try:
+        with open(path, 'r') as meminfo_file:
+            for line in meminfo_file:
+                (name, _, value) = line.partition(':')
+                meminfo[name.strip()] = int(value.split()[0])
+    except (IOError, OSError, ValueError, IndexError):
+        logging.debug(u"Memory statistics not available in %s", path)
+    return meminfo
@@ -2,8 +2,14 @@ from ...exports import hook
 from .helpers import close_databases
 
 
+#: Event published on shutdown right before the databases are closed, so any
+#: pending changes can still be written
+DATABASES_CLOSING = 'databases_closing'
+
+
 @hook('shutdown')
 def shutdown(supervisor):
+    supervisor.exts.events.publish(DATABASES_CLOSING, supervisor)
     close_databases()
 
 
@@ -2,10 +2,19 @@ import datetime
 import json
 import re
 
+import pytz
+
 from .utils import to_datetime
 
 
 NUMERIC_RE = re.compile(r'^[\d\.]+$')
+#: Key under which typed payloads are wrapped, to tell them apart from
+#: payloads that were serialized with :py:class:`DateTimeEncoder`
+TYPED_KEY = '__typed__'
+#: Key of the object that represents a tagged datetime value
+DATETIME_KEY = '__datetime__'
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+UTC_SUFFIX = 'Z'
 
 
 class DateTimeEncoder(json.JSONEncoder):
@@ -30,3 +39,62 @@ class DateTimeDecoder(json.JSONDecoder):
             obj[key] = to_datetime(value)
 
         return obj
+
+
+class TypedEncoder(json.JSONEncoder):
+    """
+    Encodes datetime objects as objects tagged with :py:data:`DATETIME_KEY`,
+    so they can be decoded without having to guess which strings are dates.
+    Timezone aware datetimes are stored in UTC.
+    """
+
+    def default(self, obj):
+        if isinstance(obj, datetime.datetime):
+            suffix = ''
+            if obj.tzinfo is not None:
+                obj = obj.astimezone(pytz.utc)
+                suffix = UTC_SUFFIX
+            return {DATETIME_KEY: obj.strftime(DATETIME_FORMAT) + suffix}
+
+        return super(TypedEncoder, self).default(obj)
+
+
+class TypedDecoder(json.JSONDecoder):
+    """
+    Decodes objects tagged by :py:class:`TypedEncoder`, leaving all other
+    values as they are.
+    """
+
+    def __init__(self, *args, **kargs):
+        super(TypedDecoder, self).__init__(object_hook=self.object_hook,
+                                           *args,
+                                           **kargs)
+
+    def object_hook(self, obj):
+        if DATETIME_KEY not in obj:
+            return obj
+        value = obj[DATETIME_KEY]
+        if value.endswith(UTC_SUFFIX):
+            value = datetime.datetime.strptime(value[:-1], DATETIME_FORMAT)
+            return value.replace(tzinfo=pytz.utc)
+        return datetime.datetime.strptime(value, DATETIME_FORMAT)
+
+
+def dumps(obj, **kwargs):
+    """
+    Serialize ``obj`` in the typed format.
+    """
+    return json.dumps({TYPED_KEY: obj}, cls=TypedEncoder, **kwargs)
+
+
+def loads(data):
+    """
+    Deserialize ``data`` written by :py:func:`dumps`. Payloads that were
+    written using :py:class:`DateTimeEncoder`, before the typed format was
+    introduced, are still decoded with :py:class:`DateTimeDecoder`, and are
+    converted when they are serialized again.
+    """
+    obj = json.loads(data, cls=TypedDecoder)
+    if isinstance(obj, dict) and len(obj) == 1 and TYPED_KEY in obj:
+        return obj[TYPED_KEY]
+    return json.loads(data, cls=DateTimeDecoder)
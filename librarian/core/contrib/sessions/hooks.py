@@ -0,0 +1,12 @@
+from ...exports import hook
+from .sessions import Session
+
+
+@hook('background')
+def background(supervisor):
+    Session.flush()
+
+
+@hook('databases_closing')
+def databases_closing(supervisor):
+    Session.flush()
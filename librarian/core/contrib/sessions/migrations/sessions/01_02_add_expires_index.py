@@ -0,0 +1,7 @@
+SQL = """
+create index on sessions (expires);
+"""
+
+
+def up(db, conf):
+    db.executescript(SQL)
@@ -24,9 +24,12 @@ def session_plugin(fn):
     def wrapper(*args, **kwargs):
         cookie_name = exts.config['session.cookie_name']
         secret = exts.config['session.secret']
-        session_id = request.get_cookie(cookie_name, secret=secret)
+        value = request.get_cookie(cookie_name, secret=secret)
         try:
-            request.session = Session.fetch(session_id)
+            if isinstance(value, dict):
+                request.session = Session.from_cookie(value)
+            else:
+                request.session = Session.fetch(value)
         except (SessionExpired, SessionInvalid):
             request.session = Session.create()
         return fn(*args, **kwargs)
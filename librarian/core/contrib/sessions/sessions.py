@@ -10,9 +10,13 @@ file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
 
 import uuid
 import json
+import logging
+import calendar
 import datetime
 import functools
+import collections
 
+import pytz
 from bottle import request, response
 from bottle_utils.common import basestring
 
@@ -46,14 +50,143 @@ def modifies(func):
     return wrapper
 
 
+class SessionStore(object):
+    """
+    In-process store of sessions, which holds the serialized data and expiry
+    of recently used sessions, so they don't have to be fetched from the
+    database on every request, and buffers the changes of sessions until they
+    are written to the database in batches by :py:meth:`flush`.
+
+    Sessions with pending changes are always kept, while the rest of them are
+    evicted in least recently used order once there are more than ``limit``
+    sessions.
+    """
+    #: Default maximum number of sessions kept in memory
+    LIMIT = 1000
+    #: Table in which the sessions are stored
+    TABLE = 'sessions'
+    #: Columns of ``TABLE``
+    COLUMNS = ('session_id', 'data', 'expires')
+
+    def __init__(self, limit=LIMIT):
+        self.limit = limit
+        self.clear()
+
+    def clear(self):
+        self._sessions = collections.OrderedDict()
+        self._pending = dict()
+        # sessions being written by a flush, and the ones among them that
+        # were deleted before the write completed
+        self._flushing = dict()
+        self._deleted = set()
+
+    def get(self, session_id):
+        """
+        Return the serialized data and expiry of the session as a tuple, or
+        ``None`` if it's not in the store.
+        """
+        try:
+            entry = self._sessions.pop(session_id)
+        except KeyError:
+            return None
+        # reinserting the entry moves it to the most recently used end
+        self._sessions[session_id] = entry
+        return entry
+
+    def put(self, session_id, data, expires, dirty=False):
+        """
+        Store the serialized ``data`` and ``expires`` of a session. If
+        ``dirty`` is set, the session is written to the database by the next
+        :py:meth:`flush`.
+        """
+        self._sessions.pop(session_id, None)
+        self._sessions[session_id] = (data, expires)
+        if dirty:
+            self._pending[session_id] = (data, expires)
+        while len(self._sessions) > self.limit:
+            for candidate in self._sessions:
+                if candidate not in self._pending:
+                    del self._sessions[candidate]
+                    break
+            else:
+                # every session has pending changes
+                break
+
+    def discard(self, session_id):
+        """
+        Remove the session from the store, dropping it's pending changes as
+        well.
+        """
+        self._sessions.pop(session_id, None)
+        self._pending.pop(session_id, None)
+        if session_id in self._flushing:
+            self._deleted.add(session_id)
+
+    def is_current(self, session_id, data, expires):
+        """
+        Return whether the stored data and expiry of the session are equal to
+        ``data`` and ``expires``.
+        """
+        return self._sessions.get(session_id) == (data, expires)
+
+    def flush(self, db):
+        """
+        Write all the pending changes to the database at once. Return the
+        number of written sessions.
+        """
+        if not self._pending:
+            return 0
+        # changes made while writing are picked up by the next flush
+        (pending, self._pending) = (self._pending, dict())
+        query = db.Replace(self.TABLE,
+                           constraints=['session_id'],
+                           cols=self.COLUMNS)
+        rows = [dict(session_id=session_id, data=data, expires=expires)
+                for (session_id, (data, expires)) in pending.items()]
+        self._flushing = pending
+        try:
+            db.executemany(query, rows)
+        except Exception:
+            logging.exception(u"Failed to write %s sessions.", len(rows))
+            for (session_id, entry) in pending.items():
+                if session_id in self._sessions:
+                    self._pending.setdefault(session_id, entry)
+            return 0
+        finally:
+            self._flushing = dict()
+            (deleted, self._deleted) = (self._deleted, set())
+        if deleted:
+            # the write yields to other greenlets, so sessions deleted in
+            # the meantime may have been written back, and are deleted again
+            query = db.Delete(self.TABLE, where='session_id IN %s')
+            db.execute(query, (tuple(deleted),))
+        return len(rows)
+
+
 class Session(object):
-    """ Represents a user session """
+    """ Represents a user session
+
+    Sessions are kept in :py:attr:`store`, and changes are only written to the
+    database when the store is flushed. Saving a session whose serialized
+    data did not change has no effect.
+
+    Anonymous sessions are not stored on the server at all. Their data is
+    kept in the signed session cookie instead, until they are upgraded to
+    regular sessions by :py:meth:`upgrade`, which happens on login, or when
+    their data outgrows :py:attr:`COOKIE_LIMIT`.
+    """
     modifiable_attributes = ('id', 'expires', 'data')
+    store = SessionStore()
+    #: Maximum size of serialized data kept in the cookie of anonymous
+    #: sessions
+    COOKIE_LIMIT = 2048
 
-    def __init__(self, session_id, data, expires, modified=False):
+    def __init__(self, session_id, data, expires, modified=False,
+                 anonymous=False):
         self.id = session_id
         self.expires = expires
         self.data = self._load(data)
+        self.anonymous = anonymous
         self.modified = modified
 
     # Serialization
@@ -69,22 +202,35 @@ class Session(object):
         return {}
 
     def _dump(self):
-        return json.dumps(self.data)
+        # keys are sorted, so equal data is always serialized the same way
+        return json.dumps(self.data, sort_keys=True)
 
     # Session management
 
     def save(self):
-        db = exts.databases.librarian
-        query = db.Replace('sessions',
-                           constraints=['session_id'],
-                           cols=['session_id', 'data', 'expires'])
-        db.execute(query, dict(session_id=self.id,
-                               data=self._dump(),
-                               expires=self.expires))
+        data = self._dump()
+        if self.anonymous and len(data) > self.COOKIE_LIMIT:
+            self.upgrade()
+        if self.anonymous:
+            # the data is stored in the cookie
+            self.modified = False
+            return self
+        if not self.store.is_current(self.id, data, self.expires):
+            self.store.put(self.id, data, self.expires, dirty=True)
         self.modified = False
         return self
 
+    def upgrade(self):
+        """Turn an anonymous session into a session stored on the server."""
+        if self.anonymous:
+            self.anonymous = False
+            self.modified = True
+        return self
+
     def delete(self):
+        if self.anonymous:
+            return self
+        self.store.discard(self.id)
         db = exts.databases.librarian
         q = db.Delete('sessions', where='session_id = %s')
         db.execute(q, (self.id,))
@@ -93,6 +239,7 @@ class Session(object):
     def rotate(self):
         self.delete()
         self.id = self.generate_session_id()
+        self.upgrade()
         self.set_cookie(request.app.config['session.cookie_name'],
                         request.app.config['session.secret'])
         return self.save()
@@ -107,11 +254,19 @@ class Session(object):
         self.id = self.generate_session_id()
         self.data = {}
         self.expires = self.get_expiry()
+        self.anonymous = self.is_anonymous_default()
         return self
 
+    def to_cookie(self):
+        """Return the value of the session cookie."""
+        if not self.anonymous:
+            return self.id
+        expires = calendar.timegm(self.expires.utctimetuple())
+        return dict(id=self.id, data=self.data, expires=expires)
+
     def set_cookie(self, name, secret):
         max_age = (self.expires - utcnow()).seconds
-        response.set_cookie(name, self.id, path='/', secret=secret,
+        response.set_cookie(name, self.to_cookie(), path='/', secret=secret,
                             max_age=max_age)
 
     # Session data manipulation
@@ -220,26 +375,54 @@ class Session(object):
         :param session_id:  unique session ID
         :returns:           valid `Session` instance.
         """
-        db = exts.databases.librarian
-        q = db.Select(sets='sessions', where='session_id = %s')
-        session_data = db.fetchone(q, (session_id,))
-        if not session_data:
-            raise SessionInvalid(session_id)
-        sess = cls(**session_data)
+        stored = cls.store.get(session_id)
+        if stored:
+            (data, expires) = stored
+            sess = cls(session_id, data, expires)
+        else:
+            db = exts.databases.librarian
+            q = db.Select(sets='sessions', where='session_id = %s')
+            session_data = db.fetchone(q, (session_id,))
+            if not session_data:
+                raise SessionInvalid(session_id)
+            sess = cls(**session_data)
+            cls.store.put(sess.id, sess._dump(), sess.expires)
         return sess.expire()  # deletes and raises if session has expired
 
+    @classmethod
+    def from_cookie(cls, value):
+        """Restore an anonymous session from the value of it's cookie.
+
+        :param value:  the value returned by :py:meth:`to_cookie`
+        :returns:      valid `Session` instance.
+        """
+        try:
+            expires = datetime.datetime.fromtimestamp(value['expires'],
+                                                      tz=pytz.utc)
+            sess = cls(value['id'], value['data'], expires, anonymous=True)
+        except (KeyError, TypeError, ValueError):
+            raise SessionInvalid(None)
+        return sess.expire()
+
     @classmethod
     def create(cls):
-        """Create a new session.
+        """Create a new session, which is anonymous if anonymous sessions
+        are enabled.
 
         :returns:         Valid `Session` instance.
         """
         session_id = cls.generate_session_id()
         data = {}
         expires = cls.get_expiry()
-        sess = cls(session_id, data, expires, modified=True).save()
+        sess = cls(session_id, data, expires, modified=True,
+                   anonymous=cls.is_anonymous_default()).save()
         return sess
 
+    @classmethod
+    def flush(cls):
+        """Write the pending changes of all sessions to the database."""
+        return cls.store.flush(exts.databases.librarian)
+
     # Utility methods
 
     @staticmethod
@@ -250,3 +433,7 @@ class Session(object):
     def get_expiry():
         life = request.app.config['session.lifetime']
         return utcnow() + datetime.timedelta(seconds=life)
+
+    @staticmethod
+    def is_anonymous_default():
+        return request.app.config.get('session.anonymous', False)
@@ -0,0 +1,30 @@
+"""
+Dashboard plugin that presents the cache statistics
+
+Copyright 2014-2015, Outernet Inc.
+Some rights reserved.
+
+This software is free software licensed under the terms of GPLv3. See COPYING
+file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
+"""
+
+from bottle import request
+from bottle_utils.i18n import lazy_gettext as _
+
+from ..core.contrib.cache.helpers import get_stats
+from ..presentation.dashboard.dashboard import DashboardPlugin
+
+
+class CacheDashboardPlugin(DashboardPlugin):
+    # Translators, used as dashboard section title
+    heading = _('Cache')
+    name = 'cache'
+
+    def get_template(self):
+        return self.name + '/dashboard.tpl'
+
+    def get_context(self):
+        stats = get_stats(request.app.supervisor.exts.cache)
+        total = stats['hits'] + stats['misses']
+        hit_rate = stats['hits'] * 100.0 / total if total else None
+        return dict(stats=stats, hit_rate=hit_rate)
@@ -15,6 +15,9 @@ from ...core.exts import ext_container as exts
 from ...core.utils import batched, as_iterable
 from .contenttypes import ContentTypes
 from .processors import Processor, DIRECTORY_TYPE, FILE_TYPE
+from .rebuild import ShadowRebuild
+from .scheduler import AnalysisScheduler
+from .snapshot import SnapshotExport, SnapshotImport
 from .utils import ancestors_of
 from .wrapper import MetaWrapper
 
@@ -42,6 +45,7 @@ class FSWriter(object):
     def __init__(self, data, db, cache):
         self._db = db
         self._cache = cache
+        self._prefix = cache.parse_prefix(self.CACHE_PREFIX)
         # unpack data
         self._path = data['path']
         if self._path:
@@ -51,12 +55,11 @@ class FSWriter(object):
         self._mime_type = data['mime_type']
         self._content_types = data['content_types']
 
-    @classmethod
-    def key(cls, path):
+    def key(self, path):
         """
         Return the unique key under which the file system object can be cached.
         """
-        return cls.CACHE_PREFIX + path
+        return self._prefix + path
 
     def _get_chain(self):
         """
@@ -67,8 +70,9 @@ class FSWriter(object):
         ancestors = []
         missing = []
         path_chain = list(ancestors_of(self._path))
+        cached = self._cache.get_many([self.key(path) for path in path_chain])
         for (i, path) in enumerate(path_chain):
-            entry = self._cache.get(self.key(path))
+            entry = cached.get(self.key(path))
             # in the event of the first missing entry from cache, abort
             # further lookup in it, since it's not possible to have a child
             # whithout it's parent stored, so none of the children would
@@ -85,13 +89,13 @@ class FSWriter(object):
         query = self._db.Select(sets=self.FS_TABLE,
                                 where=self._db.sqlin('path', missing),
                                 order='length(path)')
+        fetched = dict()
         for entry in self._db.fetchiter(query, missing):
             path = entry['path']
-            self._cache.set(self.key(path),
-                            dict(entry),
-                            timeout=self.CACHE_TIMEOUT)
+            fetched[self.key(path)] = dict(entry)
             ancestors.append(entry)
             missing.remove(path)
+        self._cache.set_many(fetched, timeout=self.CACHE_TIMEOUT)
         # if missing is still not empty, those entries need to be created
         return (ancestors, missing)
 
@@ -224,11 +228,16 @@ class Archive(object):
     Processor = Processor
     MetaWrapper = MetaWrapper
     FSWriter = FSWriter
+    AnalysisScheduler = AnalysisScheduler
+    ShadowRebuild = ShadowRebuild
+    SnapshotExport = SnapshotExport
+    SnapshotImport = SnapshotImport
     #: Database name
     DATABASE_NAME = 'librarian'
     #: Database tables
     FS_TABLE = 'fs'
     META_TABLE = 'meta'
+    DELETED_TABLE = 'fs_deleted'
     #: Database colums
     META_COLUMNS = ('fs_id', 'language', 'key', 'value')
     #: Default root path, relative to FSAL's base directory
@@ -237,6 +246,19 @@ class Archive(object):
     ENTRY_POINT_FOUND = 'entry_point_found'
     #: Special metadata type that originates from automatic analysis
     AUTO_DEDUCED = '__auto__'
+    #: Store metadata of an fs entry, and stamp the entry with a new revision
+    #: once, if any of the metadata actually changed
+    SAVE_METADATA_QUERY = """
+        WITH changed AS (
+            INSERT INTO {meta} ({columns}) VALUES {values}
+            ON CONFLICT (fs_id, language, key) DO UPDATE
+            SET value = excluded.value
+            WHERE {meta}.value IS DISTINCT FROM excluded.value
+            RETURNING fs_id
+        )
+        UPDATE {fs} SET rev = nextval('archive_rev_seq')
+        WHERE id = %s AND EXISTS (SELECT 1 FROM changed);
+    """
 
     def __init__(self, **kwargs):
         self._db = kwargs.get('db', exts.databases[self.DATABASE_NAME])
@@ -245,24 +267,32 @@ class Archive(object):
         self._cache = kwargs.get('cache', exts.cache)
         self._tasks = kwargs.get('tasks', exts.tasks)
         self._events = kwargs.get('events', exts.events)
+        self._analysis = kwargs.get('analysis', exts.analysis)
         self._events.subscribe(self.ENTRY_POINT_FOUND, self._entry_point_found)
         # Select what from meta table
         self._meta_what = ','.join('{}.{}'.format(self.META_TABLE, c)
                                    for c in self.META_COLUMNS)
 
-    def _analyze(self, path, partial):
+    def _analyze(self, path, partial, links=None):
         """
         Return found metadata for ``path``.
 
         Called by the public py:meth:`~Archive.analyze` method and performs
-        the heavy lifting to obtain and return metadata.
+        the heavy lifting to obtain and return metadata. If ``links`` is
+        specified, found links are put into it instead of being stored, and
+        found entry points are not announced, so nothing is written into the
+        database.
         """
         logging.debug(u"Analyze[%s] %s", ('FULL', 'PARTIAL')[partial], path)
         data = dict()
         for proc_cls in self.Processor.for_path(path):
-            proc = proc_cls(path, data=data, partial=partial, fsal=self._fsal)
+            proc = proc_cls(path,
+                            data=data,
+                            partial=partial,
+                            fsal=self._fsal,
+                            links=links)
             # store entry point on parent folder if available
-            if proc_cls.is_entry_point(path):
+            if links is None and proc_cls.is_entry_point(path):
                 content_type = self.ContentTypes.to_bitmask(proc_cls.name)
                 self._events.publish(self.ENTRY_POINT_FOUND,
                                      path=path,
@@ -275,7 +305,7 @@ class Archive(object):
 
     @as_iterable(params=[1])
     @batched(arg=1, batch_size=100, aggregator=batched.updater)
-    def analyze(self, paths, partial=False, callback=None):
+    def analyze(self, paths, partial=False, callback=None, links=None):
         """
         Analyze ``paths`` to determine their content type and metadata.
 
@@ -285,17 +315,41 @@ class Archive(object):
         basic information about the paths. The optional ``callback`` argument
         determines if the analysis will run asynchronously, invoking the
         ``callback`` function with the obtained data, or in blocking mode,
-        returning the data.
+        returning the data. If a ``links`` dict is passed, the analysis is
+        detached from the database: links found in each path are put into it
+        instead of being stored, and entry points are not recorded.
         """
         if not callback:
             ret_val = dict()
             for path in paths:
-                ret_val.update(self._analyze(path, partial))
+                ret_val.update(self._analyze(path, partial, links))
             return ret_val
         # schedule background task to perform analysis of ``paths``
-        self._tasks.schedule(lambda: callback(self.analyze(paths, partial)))
+        self._tasks.schedule(
+            lambda: callback(self.analyze(paths, partial, links=links)))
         return {}
 
+    def process(self, paths):
+        """
+        Perform a comprehensive analysis of ``paths`` in blocking mode and
+        store the found metadata. It is invoked by the analysis scheduler for
+        each batch of paths that it consumes.
+        """
+        self.save_many(self.analyze(paths))
+
+    def schedule_analysis(self, paths, interactive=False):
+        """
+        Schedule ``paths`` for comprehensive analysis through the shared
+        analysis scheduler. Paths that a user is waiting for should be marked
+        as ``interactive``, which makes them jump ahead of any queued
+        background work, promoting them if they were already queued.
+        """
+        if interactive:
+            priority = self.AnalysisScheduler.INTERACTIVE
+        else:
+            priority = self.AnalysisScheduler.BACKGROUND
+        return self._analysis.schedule(paths, priority=priority)
+
     def _scan(self, path, partial, callback, maxdepth, depth, delay):
         """
         Recursively scan ``path`` and analyze all found entries.
@@ -391,6 +445,7 @@ class Archive(object):
                             type=row['type'],
                             mime_type=row['mime_type'],
                             content_types=row['content_types'],
+                            rev=row['rev'],
                             metadata={})
             # put meta key/value pairs into fs data element
             key = row['key']
@@ -449,8 +504,9 @@ class Archive(object):
         # schedule missing entries to be analyzed asynchronously and their
         # meta information stored in database, but while that information
         # becomes available, return quickly attainable basic information for
-        # them as placeholders
-        self.analyze(missing, callback=self.save_many)
+        # them as placeholders. a user is waiting for these, so they are
+        # analyzed ahead of any background work
+        self.schedule_analysis(missing, interactive=True)
         # fetch partials quickly
         partials = self.analyze(missing, partial=True)
         data.update(partials)
@@ -577,6 +633,42 @@ class Archive(object):
         return dict((meta.path, meta)
                     for meta in self._reconstruct_meta(row_iter))
 
+    def revision(self):
+        """
+        Return the current revision of the archive, which is the revision of
+        the most recent change of any of its entries.
+        """
+        query = ('SELECT greatest((SELECT max(rev) FROM {}),'
+                 ' (SELECT max(rev) FROM {})) AS rev')
+        row = self._db.fetchone(query.format(self.FS_TABLE,
+                                             self.DELETED_TABLE))
+        return row['rev'] or 0
+
+    def changes_since(self, rev, limit=100):
+        """
+        Return a list of changes that happened after revision ``rev``, ordered
+        by their revision, and limited to at most ``limit`` changes. Each
+        change is a dict containing the ``path``, ``type`` and ``rev`` of the
+        changed entry, and a ``deleted`` flag. Each path appears only once,
+        with its latest revision, so to follow the changes incrementally, the
+        caller should pass in the ``rev`` of the last change it received.
+
+        Revisions are assigned when a change is made, not when it's committed,
+        so a change from a slow transaction may show up with a revision lower
+        than the one already seen.
+        """
+        query = ('SELECT path, type, rev, false AS deleted FROM {fs} '
+                 'WHERE rev > %(rev)s '
+                 'UNION ALL '
+                 'SELECT d.path, d.type, d.rev, true AS deleted '
+                 'FROM {deleted} d '
+                 'LEFT OUTER JOIN {fs} ON {fs}.path = d.path '
+                 'WHERE d.rev > %(rev)s AND {fs}.id IS NULL '
+                 'ORDER BY rev LIMIT %(limit)s')
+        query = query.format(fs=self.FS_TABLE, deleted=self.DELETED_TABLE)
+        rows = self._db.fetchiter(query, dict(rev=rev, limit=limit))
+        return [dict(row) for row in rows]
+
     def _entry_point_found(self, path, content_type, processor):
         """
         Store on the parent directory of ``path`` the filename of the found
@@ -605,17 +697,23 @@ class Archive(object):
         Store the passed in ``metadata`` associated with the fs object under
         ``fs_id``.
         """
-        query = self._db.Replace(self.META_TABLE,
-                                 constraints=['fs_id', 'language', 'key'],
-                                 cols=self.META_COLUMNS)
         cleaned = dict()
+        params = []
         for (language, section) in metadata.items():
             cleaned[language] = self._strip(section)
-            # transform dict of metadata section into a sequence of dicts with
-            # key-value pairs representing each pair from ``cleaned_section``
-            seq = (dict(key=key, value=value, language=language, fs_id=fs_id)
-                   for (key, value) in cleaned[language].items())
-            self._db.executemany(query, seq)
+            for (key, value) in cleaned[language].items():
+                params.extend((fs_id, language, key, value))
+        if params:
+            # all rows are written at once, so the fs object gets a single
+            # new revision, no matter how many of them changed
+            width = len(self.META_COLUMNS)
+            template = '({})'.format(', '.join(['%s'] * width))
+            query = self.SAVE_METADATA_QUERY.format(
+                meta=self.META_TABLE,
+                fs=self.FS_TABLE,
+                columns=', '.join(self.META_COLUMNS),
+                values=', '.join([template] * (len(params) // width)))
+            self._db.execute(query, params + [fs_id])
         # stripped / cleaned version of passed in ``metadata`` will be returned
         return cleaned
 
@@ -659,7 +757,8 @@ class Archive(object):
             for proc_cls in self.Processor.for_path(path):
                 proc_cls(path, fsal=self._fsal).deprocess()
             # invalidate cached entries
-            self._cache.delete(self.FSWriter.key(path))
+            self._cache.delete(self._cache.prefixed(
+                self.FSWriter.CACHE_PREFIX, path))
         # first delete metadata by joining on fs table
         query = self._db.Delete('{} USING {}'.format(self.META_TABLE,
                                                      self.FS_TABLE),
@@ -689,6 +788,54 @@ class Archive(object):
             for metas in self.scan():
                 self.save_many(metas)
 
+    def rebuild(self):
+        """
+        Reconstruct the metadata database from scratch while the existing
+        data remains available, replacing it only once the new data is
+        complete. Changes made while the rebuild was running are carried
+        over into the new data.
+        """
+        rebuild = self.ShadowRebuild(self, db=self._db, fsal=self._fsal)
+        rebuild.run()
+        # cached fs entries refer to the ids of the replaced tables
+        self._cache.invalidate(prefix=self.FSWriter.CACHE_PREFIX)
+
+    def export_snapshot(self, path):
+        """
+        Write a snapshot of the metadata database into ``path``, that can be
+        imported on another device with py:meth:`~Archive.import_snapshot`.
+        """
+        snapshot = self.SnapshotExport(db=self._db,
+                                       fsal=self._fsal,
+                                       config=self._config)
+        return snapshot.run(path)
+
+    def import_snapshot(self, path):
+        """
+        Replace the metadata database with the snapshot found at ``path``.
+        Instead of analyzing the files, the imported entries are verified by
+        comparing the size and modification time of the files with the ones
+        stored in the snapshot. Missing files are removed, while changed ones
+        are analyzed in blocking mode, as the import runs right before the
+        process exits. Return a dict with the number of imported, missing and
+        changed files.
+        """
+        snapshot = self.SnapshotImport(self,
+                                       db=self._db,
+                                       fsal=self._fsal,
+                                       path=path)
+        snapshot.run()
+        # cached fs entries refer to the ids of the replaced tables
+        self._cache.invalidate(prefix=self.FSWriter.CACHE_PREFIX)
+        (missing, changed, _) = snapshot.verify()
+        if missing:
+            self.remove(missing)
+        if changed:
+            self.process(changed)
+        return dict(imported=len(snapshot.stats),
+                    missing=len(missing),
+                    changed=len(changed))
+
     def clear(self):
         """
         Empty meta database. It deletes all data. Really everything.
@@ -0,0 +1,316 @@
+"""
+Resumable background crawler of the content library.
+
+Copyright 2014-2015, Outernet Inc.
+Some rights reserved.
+
+This software is free software licensed under the terms of GPLv3. See COPYING
+file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
+"""
+
+from __future__ import division
+
+import collections
+import json
+import logging
+import os
+import time
+
+import gevent
+
+from ...core.exts import ext_container as exts
+from ...utils.load import IOWait, request_load
+
+
+class Crawler(object):
+    """
+    Traverses the content library breadth-first and schedules the files that
+    it encounters for analysis at background priority, so they never hold up
+    paths that a user is waiting for, in short slices of work driven by a
+    periodic task.
+
+    The list of directories that are yet to be visited (the frontier) and the
+    progress counters are periodically written into a checkpoint file, so an
+    interrupted crawl resumes from the last checkpoint after a restart instead
+    of starting over. At most the directories visited since the last
+    checkpoint are analyzed twice, which is harmless. Directories that fail
+    to be crawled are moved to the end of the frontier and retried a limited
+    number of times, so a single broken directory cannot stall the crawl.
+
+    The pause between two slices adapts to the load of the system: it doubles
+    while requests are being served or the CPU spends too much time waiting
+    for I/O, and halves while the system is quiet, within the configured
+    bounds.
+
+    Progress is published through the ``crawler`` state provider.
+    """
+    #: Version of the checkpoint file format
+    CHECKPOINT_VERSION = 1
+    #: Name of the state provider progress is published through
+    PROVIDER_NAME = 'crawler'
+    #: Path to start crawling from, relative to FSAL's base directory
+    ROOT_PATH = ''
+    #: Crawler statuses
+    IDLE = 'idle'
+    RUNNING = 'running'
+    #: Default values of the tunable parameters
+    SLICE_DURATION = 2
+    CHECKPOINT_INTERVAL = 20
+    MIN_DELAY = 1
+    MAX_DELAY = 60
+    IDLE_DELAY = 60
+    MAX_REQUEST_RATE = 0.5
+    MAX_IOWAIT = 0.3
+    MAX_RETRIES = 3
+
+    def __init__(self, archive_factory, checkpoint_path, **kwargs):
+        self._archive_factory = archive_factory
+        self._archive = None
+        self._checkpoint_path = os.path.abspath(checkpoint_path)
+        self._fsal = kwargs.get('fsal', exts.fsal)
+        self._state = kwargs.get('state')
+        self._load = kwargs.get('load', request_load)
+        self._iowait = kwargs.get('iowait', IOWait())
+        self._slice_duration = kwargs.get('slice_duration',
+                                          self.SLICE_DURATION)
+        self._checkpoint_interval = kwargs.get('checkpoint_interval',
+                                               self.CHECKPOINT_INTERVAL)
+        self._min_delay = kwargs.get('min_delay', self.MIN_DELAY)
+        self._max_delay = kwargs.get('max_delay', self.MAX_DELAY)
+        self._idle_delay = kwargs.get('idle_delay', self.IDLE_DELAY)
+        self._max_request_rate = kwargs.get('max_request_rate',
+                                            self.MAX_REQUEST_RATE)
+        self._max_iowait = kwargs.get('max_iowait', self.MAX_IOWAIT)
+        self._max_retries = kwargs.get('max_retries', self.MAX_RETRIES)
+        self._delay = self._min_delay
+        self._loaded = False
+        self._reset()
+
+    def _reset(self, root=ROOT_PATH, refresh=False):
+        """
+        Reset the frontier and all the progress counters.
+        """
+        self._root = root
+        self._refresh = refresh
+        self._frontier = collections.deque()
+        # number of failed attempts per directory
+        self._failures = dict()
+        self._dirs_done = 0
+        self._files_done = 0
+        self._started_at = None
+        # counters of the current process only, used for rate estimation
+        self._session_started_at = time.time()
+        self._session_files = 0
+
+    def _get_archive(self):
+        if self._archive is None:
+            self._archive = self._archive_factory()
+        return self._archive
+
+    # Checkpoint
+
+    def _read_checkpoint(self):
+        """
+        Restore the state of an interrupted crawl from the checkpoint file if
+        it's present. It is performed only once, the first time the crawler
+        state is accessed.
+        """
+        if self._loaded:
+            return
+        self._loaded = True
+        if not os.path.exists(self._checkpoint_path):
+            return
+        try:
+            with open(self._checkpoint_path, 'r') as checkpoint_file:
+                data = json.load(checkpoint_file)
+        except (IOError, ValueError):
+            logging.exception(u"Crawler checkpoint could not be read.")
+            return
+        if data.get('version') != self.CHECKPOINT_VERSION:
+            logging.warning(u"Crawler checkpoint version mismatch, ignored.")
+            return
+        self._reset(root=data['root'], refresh=data['refresh'])
+        self._frontier.extend(data['frontier'])
+        self._failures = data.get('failures', {})
+        self._dirs_done = data['dirs_done']
+        self._files_done = data['files_done']
+        self._started_at = data['started_at']
+        logging.info(u"Crawler resuming with %s directories in frontier.",
+                     len(self._frontier))
+
+    def checkpoint(self):
+        """
+        Write the current frontier and progress counters into the checkpoint
+        file. The file is replaced atomically, so a crash while writing it
+        leaves the previous checkpoint intact.
+        """
+        data = dict(version=self.CHECKPOINT_VERSION,
+                    root=self._root,
+                    refresh=self._refresh,
+                    frontier=list(self._frontier),
+                    failures=self._failures,
+                    dirs_done=self._dirs_done,
+                    files_done=self._files_done,
+                    started_at=self._started_at)
+        tmp_path = self._checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as checkpoint_file:
+            json.dump(data, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.rename(tmp_path, self._checkpoint_path)
+
+    def _remove_checkpoint(self):
+        if os.path.exists(self._checkpoint_path):
+            os.remove(self._checkpoint_path)
+
+    # Crawling
+
+    @property
+    def is_active(self):
+        self._read_checkpoint()
+        return bool(self._frontier)
+
+    def start(self, path=ROOT_PATH, refresh=False):
+        """
+        Start a fresh crawl from ``path``, discarding any earlier progress.
+        By default only files which have no metadata stored yet are analyzed,
+        unless ``refresh`` is set, in which case every file is reanalyzed.
+        """
+        self._loaded = True
+        self._reset(root=path, refresh=refresh)
+        self._frontier.append(path)
+        self._started_at = time.time()
+        self._delay = self._min_delay
+        self.checkpoint()
+        self._publish()
+        logging.info(u"Crawler started at '%s'.", path)
+
+    def stop(self):
+        """
+        Abandon the current crawl and remove its checkpoint.
+        """
+        self._loaded = True
+        self._frontier.clear()
+        self._remove_checkpoint()
+        self._publish()
+        logging.info(u"Crawler stopped.")
+
+    def _crawl(self, path):
+        """
+        Schedule the files found directly in ``path`` for background analysis
+        and add its subdirectories to the frontier.
+        """
+        (success, dirs, files) = self._fsal.list_dir(path or '.')
+        if not success:
+            logging.warning(u"Crawler skipping invalid path: '%s'", path)
+            return
+        paths = [fso.rel_path for fso in files]
+        archive = self._get_archive()
+        if paths and not self._refresh:
+            existing = archive.get(paths, ignore_missing=True)
+            paths = [p for p in paths if p not in existing]
+        if paths:
+            archive.schedule_analysis(paths)
+        self._frontier.extend(fso.rel_path for fso in dirs)
+        self._dirs_done += 1
+        self._files_done += len(files)
+        self._session_files += len(files)
+
+    def _fail(self, path):
+        """
+        Move ``path``, which could not be crawled, to the end of the frontier,
+        unless it failed too many times already, in which case it's dropped.
+        """
+        failures = self._failures.get(path, 0) + 1
+        if failures > self._max_retries:
+            self._failures.pop(path, None)
+            logging.error(u"Crawler giving up on '%s' after %s attempts.",
+                          path,
+                          failures)
+            return
+        self._failures[path] = failures
+        self._frontier.append(path)
+
+    def run_slice(self):
+        """
+        Crawl directories from the frontier for roughly the configured slice
+        duration. Return whether there is any work left.
+        """
+        self._read_checkpoint()
+        if not self._frontier:
+            return False
+        deadline = time.time() + self._slice_duration
+        uncommitted = 0
+        while self._frontier and time.time() < deadline:
+            # the directory is removed from the frontier only once it's fully
+            # processed, so it's still in the checkpoint if the process dies
+            path = self._frontier[0]
+            try:
+                self._crawl(path)
+            except Exception:
+                logging.exception(u"Crawler failed to crawl '%s'", path)
+                self._frontier.popleft()
+                self._fail(path)
+            else:
+                self._frontier.popleft()
+                self._failures.pop(path, None)
+            uncommitted += 1
+            if uncommitted >= self._checkpoint_interval:
+                self.checkpoint()
+                uncommitted = 0
+            gevent.sleep(0)
+        if self._frontier:
+            self.checkpoint()
+        else:
+            self._remove_checkpoint()
+            logging.info(u"Crawler finished: %s directories, %s files.",
+                         self._dirs_done,
+                         self._files_done)
+        self._publish()
+        return bool(self._frontier)
+
+    # Throttling
+
+    def get_delay(self):
+        """
+        Return the number of seconds to wait before the next slice.
+        """
+        if not self.is_active:
+            return self._idle_delay
+        is_busy = self._load.is_busy(self._max_request_rate)
+        if is_busy or self._iowait.sample() > self._max_iowait:
+            self._delay = min(self._delay * 2, self._max_delay)
+        else:
+            self._delay = max(self._delay / 2, self._min_delay)
+        return self._delay
+
+    # Progress
+
+    def progress(self):
+        """
+        Return a dict describing the progress of the current crawl. ``rate``
+        is the number of files per second processed since the process started
+        including the pauses between slices, while ``eta`` is an estimate of
+        the remaining seconds, based on the average number of files per
+        directory seen so far.
+        """
+        self._read_checkpoint()
+        elapsed = time.time() - self._session_started_at
+        rate = self._session_files / elapsed if elapsed > 0 else 0
+        eta = None
+        if rate and self._dirs_done:
+            files_per_dir = self._files_done / self._dirs_done
+            eta = int(len(self._frontier) * files_per_dir / rate)
+        return dict(status=self.RUNNING if self._frontier else self.IDLE,
+                    root=self._root,
+                    dirs_done=self._dirs_done,
+                    files_done=self._files_done,
+                    pending=len(self._frontier),
+                    rate=round(rate, 2),
+                    eta=eta,
+                    started_at=self._started_at,
+                    delay=self._delay)
+
+    def _publish(self):
+        state = self._state or exts.state
+        state.provider(self.PROVIDER_NAME).set(self.progress())
@@ -90,6 +90,9 @@ class Processor(object):
         # container into which metadata will be put
         self.data = kwargs.get('data', {})
         self.fsal = kwargs.get('fsal', exts.fsal)
+        # container into which found links will be put instead of storing
+        # them, if specified
+        self.links = kwargs.get('links')
         self.keys = ContentTypes.keys(self.name)
         if self.metadata_class:
             self.metadata_extractor = self.metadata_class(self.path, self.fsal)
@@ -339,8 +342,11 @@ class HtmlProcessor(Processor):
         if not self.partial:
             # assets won't be available for partial processing anyway, and
             # update involves a lot of queries, so skip it
-            assets = self.metadata_extractor.assets
-            links.update_links(self.path, assets or (), clear=True)
+            assets = self.metadata_extractor.assets or ()
+            if self.links is not None:
+                self.links[self.path] = sorted(set(assets))
+            else:
+                links.update_links(self.path, assets, clear=True)
 
     def deprocess(self):
         links.remove_links(self.path)
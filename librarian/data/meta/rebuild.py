@@ -0,0 +1,420 @@
+"""
+Online reconstruction of the metadata archive.
+
+Copyright 2014-2015, Outernet Inc.
+Some rights reserved.
+
+This software is free software licensed under the terms of GPLv3. See COPYING
+file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
+"""
+import collections
+import itertools
+import logging
+import os
+import re
+
+import gevent
+
+from .contenttypes import ContentTypes
+from .processors import DIRECTORY_TYPE, FILE_TYPE
+
+
+class ShadowRebuild(object):
+    """
+    Rebuild the ``fs``, ``meta`` and ``links`` tables from scratch without
+    taking them offline.
+
+    The content library is traversed and analyzed into empty shadow copies of
+    the live tables, which keep serving reads and writes in the meantime.
+    Shadow tables are created without indexes and constraints, and rows are
+    loaded into them with multi-row ``INSERT`` statements. ``COPY`` would be
+    faster, but it cannot be used while the gevent wait callback of the
+    database pool is installed. Indexes and constraints of the live tables are
+    recreated on the shadow tables once all the data is in, after which the
+    shadow tables replace the live ones in a single short transaction.
+
+    The files are analyzed without writing anything into the live tables, and
+    the live tables keep being written to during the rebuild. Every change of
+    an ``fs`` entry or its metadata stamps it with a new revision, and deleted
+    entries leave a tombstone with a revision too, so all the changes made
+    after the rebuild started are replayed onto the shadow tables right
+    before the swap, with the live data taking precedence.
+
+    If anything fails before the swap, the live tables are left untouched and
+    the leftover shadow tables are dropped by the next rebuild.
+    """
+    #: Tables which are rebuilt, ordered so that referenced tables come first
+    TABLES = ('fs', 'meta', 'links')
+    #: Serial columns whose sequences must survive dropping the old tables
+    SERIAL_COLUMNS = (('fs', 'id'), ('meta', 'id'))
+    #: Suffixes of the tables that are being built and being replaced
+    SHADOW_SUFFIX = '_shadow'
+    OLD_SUFFIX = '_old'
+    #: Columns that are loaded into the shadow tables
+    FS_COLUMNS = ('id', 'parent_id', 'path', 'type', 'mime_type',
+                  'content_types')
+    META_COLUMNS = ('fs_id', 'language', 'key', 'value')
+    #: Number of ids reserved from the ``fs`` sequence at once
+    ID_BLOCK_SIZE = 500
+    #: Maximum number of rows written by a single ``INSERT``
+    INSERT_BATCH_SIZE = 500
+    #: Default root path, relative to FSAL's base directory
+    ROOT_PATH = ''
+    #: Id of the parent of the root entry
+    ROOT_PARENT_ID = 0
+    #: Default content type (applies for all fs entries)
+    DEFAULT_CONTENT_TYPE = ContentTypes.to_bitmask(ContentTypes.GENERIC)
+    #: Special metadata type that originates from automatic analysis
+    AUTO_DEDUCED = '__auto__'
+    #: Catalog queries used to replicate the live table definitions
+    SEQUENCE_QUERY = "SELECT pg_get_serial_sequence(%s, %s) AS name"
+    CONSTRAINTS_QUERY = """
+        SELECT pg_get_constraintdef(oid) AS definition
+        FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype IN ('p', 'u', 'f')
+        ORDER BY contype DESC
+    """
+    INDEXES_QUERY = """
+        SELECT pg_get_indexdef(i.indexrelid) AS definition
+        FROM pg_index i
+        WHERE i.indrelid = %s::regclass AND NOT EXISTS (
+            SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid
+        )
+    """
+    TRIGGERS_QUERY = """
+        SELECT pg_get_triggerdef(oid) AS definition
+        FROM pg_trigger
+        WHERE tgrelid = %s::regclass AND NOT tgisinternal
+    """
+    INDEX_NAME_RX = re.compile(r'^(CREATE (?:UNIQUE )?INDEX) \S+ ON \S+ ')
+    TRIGGER_TABLE_RX = re.compile(r' ON \S+ (FOR EACH )')
+    REFERENCES_RX = re.compile(r'REFERENCES (\w+)\(')
+
+    def __init__(self, archive, db, fsal):
+        self._archive = archive
+        self._db = db
+        self._fsal = fsal
+        self._dirs = dict()
+        self._ids = collections.deque()
+        self._sequence = None
+        self._start_rev = 0
+        self._keys = ContentTypes.keys()
+
+    @classmethod
+    def shadow(cls, table):
+        return table + cls.SHADOW_SUFFIX
+
+    @classmethod
+    def old(cls, table):
+        return table + cls.OLD_SUFFIX
+
+    # Preparation
+
+    def _prepare(self, cursor):
+        """
+        Create empty shadow tables, dropping any leftovers of an earlier
+        rebuild, and remember the revision at which the rebuild started, so
+        the changes made to the live tables while it runs can be replayed.
+        Writes in progress are waited for, so no change with a lower revision
+        can show up afterwards.
+        """
+        cursor.execute('LOCK TABLE fs, meta IN SHARE MODE')
+        for table in reversed(self.TABLES):
+            shadow = self.shadow(table)
+            cursor.execute('DROP TABLE IF EXISTS {}'.format(shadow))
+        for table in self.TABLES:
+            shadow = self.shadow(table)
+            cursor.execute('CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS)'
+                           .format(shadow, table))
+        cursor.execute(self.SEQUENCE_QUERY, ('fs', 'id'))
+        self._sequence = cursor.fetchone()['name']
+        cursor.execute("SELECT nextval('archive_rev_seq') AS rev")
+        self._start_rev = cursor.fetchone()['rev']
+
+    # Loading
+
+    def _next_id(self):
+        """
+        Return the next id for an ``fs`` entry. Ids are taken from the same
+        sequence the live table uses, so they never clash with ids of entries
+        created in the live table during the rebuild.
+        """
+        if not self._ids:
+            query = 'SELECT nextval(%s) AS id FROM generate_series(1, %s)'
+            rows = self._db.fetchall(query, (self._sequence,
+                                             self.ID_BLOCK_SIZE))
+            self._ids.extend(row['id'] for row in rows)
+        return self._ids.popleft()
+
+    def _get_dir(self, path):
+        """
+        Return the in-memory entry of the directory under ``path``, creating
+        it and its missing ancestors on first access. Directories are kept in
+        memory until the whole library is traversed, as their content types
+        and metadata accumulate from their children.
+        """
+        entry = self._dirs.get(path)
+        if entry:
+            return entry
+        if path == self.ROOT_PATH:
+            parent_id = self.ROOT_PARENT_ID
+        else:
+            parent_id = self._get_dir(os.path.dirname(path))['id']
+        entry = dict(id=self._next_id(),
+                     parent_id=parent_id,
+                     path=path,
+                     type=DIRECTORY_TYPE,
+                     mime_type=None,
+                     content_types=self.DEFAULT_CONTENT_TYPE,
+                     metadata={})
+        self._dirs[path] = entry
+        return entry
+
+    def _clean(self, metadata):
+        """
+        Return a copy of ``metadata`` without the keys that are not in the
+        specification.
+        """
+        return dict((language, dict((k, v) for (k, v) in section.items()
+                                    if k in self._keys))
+                    for (language, section) in metadata.items())
+
+    def _elect_entry_point(self, path, parent):
+        """
+        Store ``path`` as the entry point of its ``parent`` directory if it's
+        a better candidate than the existing one.
+        """
+        for proc_cls in self._archive.Processor.for_path(path):
+            if not proc_cls.is_entry_point(path):
+                continue
+            auto = parent['metadata'].setdefault(self.AUTO_DEDUCED, {})
+            if proc_cls.is_entry_point(old=auto.get('main'), new=path):
+                auto['main'] = os.path.basename(path)
+
+    @staticmethod
+    def _meta_rows(fs_id, metadata):
+        for (language, section) in metadata.items():
+            for (key, value) in section.items():
+                yield (fs_id, language, key, value)
+
+    def _insert(self, table, columns, rows):
+        """
+        Bulk load ``rows`` into ``table`` using multi-row ``INSERT``
+        statements.
+        """
+        rows = iter(rows)
+        template = '({})'.format(', '.join(['%s'] * len(columns)))
+        while True:
+            batch = list(itertools.islice(rows, self.INSERT_BATCH_SIZE))
+            if not batch:
+                return
+            query = 'INSERT INTO {} ({}) VALUES {}'.format(
+                table,
+                ', '.join(columns),
+                ', '.join([template] * len(batch)))
+            self._db.execute(query, [value for row in batch
+                                     for value in row])
+
+    def _load(self, paths, metas, links):
+        """
+        Load the analysis results ``metas`` and the found ``links`` of the
+        files found under ``paths`` into the shadow tables. File entries are
+        written out right away, while results redirected to directories (e.g.
+        ``.dirinfo``) are merged into the in-memory directory entries.
+        """
+        fs_rows = []
+        meta_rows = []
+        for (path, meta) in metas.items():
+            data = meta.unwrap()
+            content_types = data.get('content_types', 0)
+            metadata = self._clean(data.get('metadata', {}))
+            if path not in paths:
+                entry = self._get_dir(path)
+                entry['content_types'] |= content_types
+                for (language, section) in metadata.items():
+                    entry['metadata'].setdefault(language, {}).update(section)
+                continue
+            parent = self._get_dir(os.path.dirname(path))
+            parent['content_types'] |= content_types
+            self._elect_entry_point(path, parent)
+            fs_id = self._next_id()
+            fs_rows.append((fs_id,
+                            parent['id'],
+                            path,
+                            FILE_TYPE,
+                            data.get('mime_type'),
+                            content_types | self.DEFAULT_CONTENT_TYPE))
+            meta_rows.extend(self._meta_rows(fs_id, metadata))
+        self._insert(self.shadow('fs'), self.FS_COLUMNS, fs_rows)
+        self._insert(self.shadow('meta'), self.META_COLUMNS, meta_rows)
+        self._insert(self.shadow('links'),
+                     ('source', 'target'),
+                     ((source, target) for (source, targets) in links.items()
+                      for target in targets))
+
+    def _ingest(self):
+        """
+        Traverse the content library breadth-first and load the analysis
+        results of all the found files into the shadow tables. The analysis
+        is detached from the live tables: found links are collected instead
+        of stored, and entry points are elected by the rebuild itself.
+        """
+        frontier = collections.deque([self.ROOT_PATH])
+        while frontier:
+            path = frontier.popleft()
+            (success, dirs, files) = self._fsal.list_dir(path or '.')
+            if not success:
+                logging.warning(u"Rebuild skipping invalid path: '%s'", path)
+                continue
+            paths = set(fso.rel_path for fso in files)
+            if paths:
+                links = dict()
+                metas = self._archive.analyze(paths, links=links)
+                self._load(paths, metas, links)
+            frontier.extend(fso.rel_path for fso in dirs)
+            # let requests against the live tables through
+            gevent.sleep(0)
+        # directory entries are complete only now
+        dirs = sorted(self._dirs.values(), key=lambda e: e['id'])
+        self._insert(self.shadow('fs'),
+                     self.FS_COLUMNS,
+                     ([e[c] for c in self.FS_COLUMNS] for e in dirs))
+        self._insert(self.shadow('meta'),
+                     self.META_COLUMNS,
+                     (row for e in dirs
+                      for row in self._meta_rows(e['id'], e['metadata'])))
+
+    # Finalization
+
+    def _shadow_definition(self, definition):
+        """
+        Return the index or constraint ``definition`` of a live table adapted
+        to its shadow table.
+        """
+        def replace(match):
+            table = match.group(1)
+            if table in self.TABLES:
+                table = self.shadow(table)
+            return 'REFERENCES {}('.format(table)
+        return self.REFERENCES_RX.sub(replace, definition)
+
+    def _index(self, cursor):
+        """
+        Recreate the indexes and constraints of the live tables on the
+        shadow tables. Indexes are left unnamed so postgres picks names which
+        do not clash with the ones of the live tables.
+        """
+        for table in self.TABLES:
+            shadow = self.shadow(table)
+            cursor.execute(self.CONSTRAINTS_QUERY, (table,))
+            for row in cursor.fetchall():
+                definition = self._shadow_definition(row['definition'])
+                cursor.execute('ALTER TABLE {} ADD {}'.format(shadow,
+                                                             definition))
+            cursor.execute(self.INDEXES_QUERY, (table,))
+            for row in cursor.fetchall():
+                prefix = r'\1 ON {} '.format(shadow)
+                cursor.execute(self.INDEX_NAME_RX.sub(prefix,
+                                                      row['definition']))
+            cursor.execute('ANALYZE {}'.format(shadow))
+
+    def _replay(self, cursor):
+        """
+        Apply the changes made to the live tables since the rebuild started
+        onto the shadow tables. Entries deleted in the meantime are removed,
+        while changed and added entries are copied over together with their
+        metadata and links. Shadow entries keep their ids, so metadata is
+        matched by path.
+        """
+        params = dict(rev=self._start_rev)
+        deleted = ('SELECT d.path FROM fs_deleted d WHERE d.rev > %(rev)s '
+                   'AND NOT EXISTS (SELECT 1 FROM fs o WHERE o.path = d.path)')
+        changed = 'SELECT o.path FROM fs o WHERE o.rev > %(rev)s'
+        for paths in (deleted, changed):
+            cursor.execute('DELETE FROM meta_shadow m USING fs_shadow f '
+                           'WHERE f.id = m.fs_id AND f.path IN '
+                           '({})'.format(paths), params)
+            cursor.execute('DELETE FROM links_shadow WHERE source IN '
+                           '({})'.format(paths), params)
+        cursor.execute('DELETE FROM fs_shadow WHERE path IN '
+                       '({})'.format(deleted), params)
+        cursor.execute('UPDATE fs_shadow f SET type = o.type, '
+                       'mime_type = o.mime_type, '
+                       'content_types = o.content_types, rev = o.rev '
+                       'FROM fs o WHERE o.path = f.path AND o.rev > %(rev)s',
+                       params)
+        # parents of added entries are looked up by path as well, unless they
+        # were added themselves, in which case they keep their live ids
+        cursor.execute('INSERT INTO fs_shadow ({}, rev) '
+                       'SELECT o.id, coalesce(p.id, o.parent_id), o.path, '
+                       'o.type, o.mime_type, o.content_types, o.rev '
+                       'FROM fs o '
+                       'LEFT OUTER JOIN fs lp ON lp.id = o.parent_id '
+                       'LEFT OUTER JOIN fs_shadow p ON p.path = lp.path '
+                       'WHERE o.rev > %(rev)s AND NOT EXISTS ('
+                       'SELECT 1 FROM fs_shadow n WHERE n.path = o.path) '
+                       'ORDER BY o.id'.format(', '.join(self.FS_COLUMNS)),
+                       params)
+        cursor.execute('INSERT INTO meta_shadow ({}) '
+                       'SELECT f.id, m.language, m.key, m.value FROM meta m '
+                       'JOIN fs o ON o.id = m.fs_id '
+                       'JOIN fs_shadow f ON f.path = o.path '
+                       'WHERE o.rev > %(rev)s'.format(
+                           ', '.join(self.META_COLUMNS)),
+                       params)
+        cursor.execute('INSERT INTO links_shadow (source, target) '
+                       'SELECT l.source, l.target FROM links l '
+                       'WHERE l.source IN ({})'.format(changed), params)
+
+    def _swap(self, cursor):
+        """
+        Replay the changes made to the live tables during the rebuild onto
+        the shadow tables, then replace the live tables with them and drop
+        the old ones. Entries missing from the rebuilt archive are recorded
+        as deleted. Triggers of the live tables are recreated only after all
+        the data is in, so they do not fire for it.
+        """
+        cursor.execute('LOCK TABLE {} IN ACCESS EXCLUSIVE MODE'.format(
+            ', '.join(self.TABLES)))
+        self._replay(cursor)
+        cursor.execute('INSERT INTO fs_deleted (path, type) '
+                       'SELECT o.path, o.type FROM fs o '
+                       'LEFT OUTER JOIN fs_shadow n ON n.path = o.path '
+                       'WHERE n.id IS NULL '
+                       'ON CONFLICT (path) DO UPDATE '
+                       'SET type = excluded.type, rev = excluded.rev')
+        for table in self.TABLES:
+            cursor.execute(self.TRIGGERS_QUERY, (table,))
+            for row in cursor.fetchall():
+                suffix = r' ON {} \1'.format(self.shadow(table))
+                cursor.execute(self.TRIGGER_TABLE_RX.sub(suffix,
+                                                         row['definition']))
+        for table in self.TABLES:
+            cursor.execute('ALTER TABLE {} RENAME TO {}'.format(
+                table, self.old(table)))
+            cursor.execute('ALTER TABLE {} RENAME TO {}'.format(
+                self.shadow(table), table))
+        # sequences are owned by the old tables at this point and would be
+        # dropped together with them
+        for (table, column) in self.SERIAL_COLUMNS:
+            cursor.execute(self.SEQUENCE_QUERY, (self.old(table), column))
+            sequence = cursor.fetchone()['name']
+            cursor.execute('ALTER SEQUENCE {} OWNED BY {}.{}'.format(
+                sequence, table, column))
+        for table in reversed(self.TABLES):
+            cursor.execute('DROP TABLE {}'.format(self.old(table)))
+
+    def run(self):
+        """
+        Perform the rebuild.
+        """
+        with self._db.transaction() as cursor:
+            self._prepare(cursor)
+        logging.info(u"Rebuild started.")
+        self._ingest()
+        logging.info(u"Rebuild data loaded.")
+        with self._db.transaction() as cursor:
+            self._index(cursor)
+        with self._db.transaction() as cursor:
+            self._swap(cursor)
+        logging.info(u"Rebuild finished.")
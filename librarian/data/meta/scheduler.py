@@ -0,0 +1,178 @@
+"""
+Prioritized scheduling of metadata analysis.
+
+Copyright 2014-2015, Outernet Inc.
+Some rights reserved.
+
+This software is free software licensed under the terms of GPLv3. See COPYING
+file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
+"""
+import collections
+import logging
+
+import gevent
+
+
+class AnalysisScheduler(object):
+    """
+    Keeps a separate queue of paths waiting for analysis for each priority
+    class, and processes them in batches within a single background greenlet,
+    always draining the higher priority queues first.
+
+    A path can be present in only one of the queues at any given time.
+    Scheduling a path that is already waiting in a lower priority queue
+    promotes it into the requested one, while scheduling it again with the
+    same or lower priority has no effect. Paths that are being processed at
+    the moment are not scheduled again either.
+
+    The actual work is delegated to an archive object created by
+    ``archive_factory`` the first time it's needed, which must provide a
+    ``process`` method that accepts a list of paths.
+    """
+    #: Priority classes, the lower the value the sooner the paths are served.
+    #: Interactive priority is meant for paths that a user requested just now.
+    INTERACTIVE = 0
+    #: Background priority is meant for crawls and file system events.
+    BACKGROUND = 1
+    #: All priority classes, in the order they are served
+    PRIORITIES = (INTERACTIVE, BACKGROUND)
+    #: Maximum number of paths passed to the archive in a single batch
+    BATCH_SIZE = 20
+    #: Delay in seconds between two consecutive background batches
+    BACKGROUND_DELAY = 0.5
+
+    def __init__(self, archive_factory, batch_size=BATCH_SIZE,
+                 delay=BACKGROUND_DELAY):
+        self._archive_factory = archive_factory
+        self._archive = None
+        self._batch_size = batch_size
+        self._delay = delay
+        # ordered dicts are used as ordered sets, so that a path can be
+        # removed from the middle of a queue in constant time on promotion
+        self._queues = dict((priority, collections.OrderedDict())
+                            for priority in self.PRIORITIES)
+        # path -> priority mapping of all the queued paths
+        self._queued = dict()
+        self._processing = set()
+        self._processed = 0
+        self._greenlet = None
+
+    def _enqueue(self, path, priority):
+        """
+        Put ``path`` into the queue of ``priority``, removing it from any
+        lower priority queue if needed. Return whether the state of the queues
+        changed or not.
+        """
+        if path in self._processing:
+            return False
+        current = self._queued.get(path)
+        if current is not None and current <= priority:
+            # already waiting with the same or higher priority
+            return False
+        if current is not None:
+            # promote path by removing it from the lower priority queue
+            del self._queues[current][path]
+        self._queues[priority][path] = None
+        self._queued[path] = priority
+        return True
+
+    def _next_batch(self):
+        """
+        Remove and return the next batch of paths along with their priority
+        from the highest priority non-empty queue. If all queues are empty,
+        ``(None, [])`` is returned.
+        """
+        for priority in self.PRIORITIES:
+            queue = self._queues[priority]
+            batch = []
+            while queue and len(batch) < self._batch_size:
+                (path, _) = queue.popitem(last=False)
+                del self._queued[path]
+                batch.append(path)
+            if batch:
+                return (priority, batch)
+        return (None, [])
+
+    def _get_archive(self):
+        if self._archive is None:
+            self._archive = self._archive_factory()
+        return self._archive
+
+    def _process(self, batch):
+        self._processing.update(batch)
+        try:
+            self._get_archive().process(batch)
+        except Exception:
+            logging.exception(u"Analysis of %s paths failed.", len(batch))
+        finally:
+            self._processing.difference_update(batch)
+            self._processed += len(batch)
+
+    def _consume(self):
+        """
+        Keep processing batches of paths until all the queues are empty. After
+        each batch the greenlet yields, and in case of background batches it
+        sleeps for the configured delay as well, so that request handlers are
+        not starved by a long running crawl.
+        """
+        try:
+            while True:
+                (priority, batch) = self._next_batch()
+                if not batch:
+                    break
+                self._process(batch)
+                if priority == self.INTERACTIVE or self.has_interactive():
+                    gevent.sleep(0)
+                else:
+                    gevent.sleep(self._delay)
+        finally:
+            self._greenlet = None
+
+    def _wakeup(self):
+        """
+        Start the consumer greenlet if it's not running already.
+        """
+        if self._greenlet is None:
+            self._greenlet = gevent.spawn(self._consume)
+
+    def schedule(self, paths, priority=BACKGROUND):
+        """
+        Schedule ``paths`` to be analyzed with the given ``priority`` and
+        return the number of paths that were either newly added or promoted.
+        """
+        if priority not in self.PRIORITIES:
+            raise ValueError("Invalid priority: {}".format(priority))
+        count = sum(self._enqueue(path, priority) for path in paths)
+        if count:
+            self._wakeup()
+        return count
+
+    def is_scheduled(self, path):
+        """
+        Return whether ``path`` is waiting to be, or being analyzed.
+        """
+        return path in self._queued or path in self._processing
+
+    def has_interactive(self):
+        """
+        Return whether there are any paths of interactive priority waiting.
+        """
+        return bool(self._queues[self.INTERACTIVE])
+
+    def pending(self, priority=None):
+        """
+        Return the number of paths waiting in the queue of ``priority``, or in
+        all of the queues if ``priority`` is not specified.
+        """
+        if priority is None:
+            return len(self._queued)
+        return len(self._queues[priority])
+
+    def stats(self):
+        """
+        Return a dict of counters describing the state of the scheduler.
+        """
+        return dict(interactive=self.pending(self.INTERACTIVE),
+                    background=self.pending(self.BACKGROUND),
+                    processing=len(self._processing),
+                    processed=self._processed)
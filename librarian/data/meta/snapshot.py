@@ -0,0 +1,255 @@
+"""
+Export and import of meta archive snapshots.
+
+Copyright 2014-2015, Outernet Inc.
+Some rights reserved.
+
+This software is free software licensed under the terms of GPLv3. See COPYING
+file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
+"""
+import gzip
+import json
+import logging
+import os
+import time
+
+import gevent
+
+from .processors import Processor, ThumbProcessorMixin, FILE_TYPE
+from .rebuild import ShadowRebuild
+
+
+#: Identifier of the snapshot file format
+FORMAT = 'librarian-meta'
+#: Version of the snapshot file format
+VERSION = 1
+#: Record kinds
+FS = 'fs'
+META = 'meta'
+LINKS = 'links'
+THUMB = 'thumb'
+END = 'end'
+
+
+class SnapshotError(Exception):
+    """
+    Raised when a snapshot file is not valid or complete.
+    """
+    pass
+
+
+def get_roots(fsal):
+    (success, base_paths) = fsal.list_base_paths()
+    return base_paths if success else []
+
+
+def stat(roots, path):
+    """
+    Return a ``[size, mtime]`` pair describing the file under ``path``, which
+    is looked up in all of the ``roots``, or ``None`` if it does not exist.
+    """
+    for root in roots:
+        try:
+            result = os.stat(os.path.join(root, path))
+        except OSError:
+            continue
+        return [result.st_size, int(result.st_mtime)]
+    return None
+
+
+def exists(roots, path):
+    return any(os.path.exists(os.path.join(root, path)) for root in roots)
+
+
+class SnapshotExport(object):
+    """
+    Write the contents of the ``fs``, ``meta`` and ``links`` tables into a
+    gzip compressed snapshot file, together with the size and modification
+    time of each file, and the list of existing thumbnails.
+
+    The snapshot consists of a header line, followed by one JSON encoded
+    record per line, and is terminated by an ``end`` record which holds the
+    number of records of each kind, so a truncated snapshot can be detected.
+    """
+    FS_QUERY = ('SELECT id, parent_id, path, type, mime_type, content_types '
+                'FROM fs ORDER BY id')
+    META_QUERY = 'SELECT fs_id, language, key, value FROM meta ORDER BY id'
+    LINKS_QUERY = 'SELECT source, target FROM links'
+
+    def __init__(self, db, fsal, config):
+        self._db = db
+        self._roots = get_roots(fsal)
+        self._thumbs_dirname = config['thumbs.dirname']
+        self._thumbs_extension = config['thumbs.extension']
+
+    def _thumb(self, path):
+        """
+        Return the path of the existing thumbnail of ``path`` if there is
+        one.
+        """
+        for proc_cls in Processor.for_path(path):
+            if not issubclass(proc_cls, ThumbProcessorMixin):
+                continue
+            thumb = proc_cls.determine_thumb_path(path,
+                                                  self._thumbs_dirname,
+                                                  self._thumbs_extension)
+            if exists(self._roots, thumb):
+                return thumb
+        return None
+
+    def _records(self):
+        for row in self._db.fetchiter(self.FS_QUERY):
+            path = row['path']
+            file_stat = [None, None]
+            if row['type'] == FILE_TYPE:
+                file_stat = stat(self._roots, path) or file_stat
+            yield [FS, row['id'], row['parent_id'], path, row['type'],
+                   row['mime_type'], row['content_types']] + file_stat
+            if row['type'] == FILE_TYPE:
+                thumb = self._thumb(path)
+                if thumb:
+                    yield [THUMB, thumb]
+            gevent.sleep(0)
+        for row in self._db.fetchiter(self.META_QUERY):
+            yield [META, row['fs_id'], row['language'], row['key'],
+                   row['value']]
+        for row in self._db.fetchiter(self.LINKS_QUERY):
+            yield [LINKS, row['source'], row['target']]
+
+    def run(self, path):
+        """
+        Write the snapshot into ``path`` and return the number of records of
+        each kind that were written. The file is replaced atomically.
+        """
+        counts = dict((kind, 0) for kind in (FS, META, LINKS, THUMB))
+        header = dict(format=FORMAT, version=VERSION, created=time.time())
+        tmp_path = path + '.tmp'
+        with gzip.open(tmp_path, 'wb') as snapshot_file:
+            snapshot_file.write(json.dumps(header) + '\n')
+            for record in self._records():
+                snapshot_file.write(json.dumps(record) + '\n')
+                counts[record[0]] += 1
+            snapshot_file.write(json.dumps([END, counts]) + '\n')
+        os.rename(tmp_path, path)
+        logging.info(u"Meta snapshot exported to %s: %s", path, counts)
+        return counts
+
+
+class SnapshotImport(ShadowRebuild):
+    """
+    Replace the contents of the ``fs``, ``meta`` and ``links`` tables with
+    the contents of a snapshot file, bulk loading it into shadow tables, which
+    are swapped with the live tables afterwards.
+
+    Ids of the imported entries are reassigned, as they are taken from the
+    sequence of the local database. The size and modification time of each
+    imported file are kept, so the snapshot can be verified against the
+    files that are actually present, using py:meth:`~SnapshotImport.verify`.
+    """
+    #: Number of rows collected before they're loaded
+    BATCH_SIZE = 1000
+
+    def __init__(self, archive, db, fsal, path):
+        super(SnapshotImport, self).__init__(archive, db=db, fsal=fsal)
+        self._path = path
+        self._idmap = dict()
+        self._roots = get_roots(fsal)
+        self.stats = dict()
+        self.thumbs = []
+
+    def _map_id(self, snapshot_id):
+        """
+        Return the local id of the entry under ``snapshot_id``.
+        """
+        if snapshot_id == self.ROOT_PARENT_ID:
+            return self.ROOT_PARENT_ID
+        local_id = self._idmap.get(snapshot_id)
+        if local_id is None:
+            local_id = self._idmap[snapshot_id] = self._next_id()
+        return local_id
+
+    def _records(self):
+        """
+        Yield the records of the snapshot, after validating its header, and
+        raise py:class:`SnapshotError` if it turns out to be incomplete.
+        """
+        counts = dict((kind, 0) for kind in (FS, META, LINKS, THUMB))
+        try:
+            with gzip.open(self._path, 'rb') as snapshot_file:
+                header = json.loads(snapshot_file.readline() or 'null')
+                if (not isinstance(header, dict) or
+                        header.get('format') != FORMAT):
+                    raise SnapshotError("Not a meta snapshot.")
+                if header.get('version') != VERSION:
+                    raise SnapshotError("Unsupported snapshot version: "
+                                        "{}".format(header.get('version')))
+                for line in snapshot_file:
+                    record = json.loads(line)
+                    if record[0] == END:
+                        if record[1] != counts:
+                            raise SnapshotError("Snapshot is inconsistent.")
+                        return
+                    counts[record[0]] += 1
+                    yield record
+        except (IOError, ValueError, KeyError, IndexError) as exc:
+            raise SnapshotError("Snapshot could not be read: {}".format(exc))
+        raise SnapshotError("Snapshot is incomplete.")
+
+    def _ingest(self):
+        rows = dict(fs=[], meta=[], links=[])
+        columns = dict(fs=self.FS_COLUMNS,
+                       meta=self.META_COLUMNS,
+                       links=('source', 'target'))
+
+        def flush(kind):
+            self._insert(self.shadow(kind), columns[kind], rows[kind])
+            rows[kind] = []
+
+        for record in self._records():
+            kind = record[0]
+            if kind == FS:
+                (snapshot_id, parent_id, path, fs_type, mime_type,
+                 content_types, size, mtime) = record[1:]
+                if size is not None:
+                    self.stats[path] = [size, mtime]
+                rows[FS].append((self._map_id(snapshot_id),
+                                 self._map_id(parent_id),
+                                 path,
+                                 fs_type,
+                                 mime_type,
+                                 content_types))
+            elif kind == META:
+                (fs_id, language, key, value) = record[1:]
+                rows[META].append((self._map_id(fs_id), language, key, value))
+            elif kind == LINKS:
+                rows[LINKS].append(tuple(record[1:]))
+            elif kind == THUMB:
+                self.thumbs.append(record[1])
+            if kind in rows and len(rows[kind]) >= self.BATCH_SIZE:
+                flush(kind)
+                gevent.sleep(0)
+        # rows are flushed out of order, which is fine as the foreign keys
+        # are added only once everything is loaded
+        for kind in self.TABLES:
+            flush(kind)
+
+    def verify(self):
+        """
+        Compare the imported files with the files that are actually present,
+        using only their size and modification time. Return a tuple of lists
+        of paths to files that are missing, files that have changed, and
+        thumbnails that exist.
+        """
+        missing = []
+        changed = []
+        for (i, (path, expected)) in enumerate(self.stats.items()):
+            actual = stat(self._roots, path)
+            if actual is None:
+                missing.append(path)
+            elif actual != expected:
+                changed.append(path)
+            if i % self.BATCH_SIZE == 0:
+                gevent.sleep(0)
+        thumbs = [thumb for thumb in self.thumbs
+                  if exists(self._roots, thumb)]
+        return (missing, changed, thumbs)
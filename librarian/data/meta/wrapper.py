@@ -81,6 +81,14 @@ class MetaWrapper(object):
         """
         return self._data['content_types']
 
+    @property
+    def rev(self):
+        """
+        Return the revision of the last change of the file system object, or
+        ``None`` if it was not stored yet.
+        """
+        return self._data.get('rev')
+
     @property
     def content_type_names(self):
         """
@@ -47,6 +47,247 @@ def to_dict(row):
     return dict((key, row[key]) for key in row.keys())
 
 
+class SharedReadState(object):
+    """
+    Read state of shared notifications of a single user, stored in the user's
+    options. All dismissable notifications created at or before the
+    watermark are read. Notifications that were read individually after it
+    are kept as exceptions, which are pruned once the watermark covers them,
+    or once the notifications they refer to expire. Which of the read
+    notifications still exist is tracked by :py:class:`NotificationCounts`.
+
+    The state is stored as::
+
+        {'watermark': <datetime or None>,
+         'read': {<notification_id>: [<created_at>, <read_at>, <expires>]}}
+    """
+    #: Name of the option that holds the read state
+    OPTION = 'notifications_read'
+    #: Name of the option that held ``{notification_id: read_at}`` mappings
+    #: before the read state was introduced
+    LEGACY_OPTION = 'notifications'
+    #: Lifetime of notifications without explicit expiry, unless configured
+    DEFAULT_EXPIRY = 86400
+
+    def __init__(self, options):
+        self.options = options
+        state = options.get(self.OPTION)
+        if state is None:
+            state = self._convert(options.get(self.LEGACY_OPTION) or {})
+        self.watermark = state['watermark']
+        self.read = state['read']
+
+    def _convert(self, legacy):
+        # the creation time of notifications is not known, but it's never
+        # later than the time they were read at
+        expiry = self.get_default_expiry()
+        read = dict((notification_id, [read_at, read_at, read_at + expiry])
+                    for (notification_id, read_at) in legacy.items())
+        return dict(watermark=None, read=read)
+
+    @classmethod
+    def get_default_expiry(cls):
+        seconds = exts.config.get('notifications.default_expiry',
+                                  cls.DEFAULT_EXPIRY)
+        return datetime.timedelta(seconds=seconds)
+
+    @classmethod
+    def get_expiry(cls, notification):
+        return (notification.expires_at or
+                notification.created_at + cls.get_default_expiry())
+
+    def _save(self):
+        # expired notifications are deleted by the cleanup task, which runs
+        # at intervals of the default expiry, so entries are kept until the
+        # notifications they refer to are surely gone
+        cutoff = utcnow() - self.get_default_expiry()
+        watermark = self.watermark
+        self.read = dict(
+            (notification_id, entry)
+            for (notification_id, entry) in self.read.items()
+            if entry[2] > cutoff and (watermark is None or
+                                      entry[0] > watermark)
+        )
+        self.options[self.OPTION] = dict(watermark=watermark,
+                                         read=self.read)
+        if self.LEGACY_OPTION in self.options:
+            del self.options[self.LEGACY_OPTION]
+
+    def get(self, notification):
+        """
+        Return the time ``notification`` was read at, or ``None`` if it was
+        not read yet.
+        """
+        if (notification.dismissable and self.watermark is not None and
+                notification.created_at <= self.watermark):
+            return self.watermark
+        entry = self.read.get(notification.notification_id)
+        return entry[1] if entry else None
+
+    def mark(self, notification, read_at):
+        expires = self.get_expiry(notification)
+        self.read[notification.notification_id] = [notification.created_at,
+                                                    read_at,
+                                                    expires]
+        self._save()
+
+    def mark_all(self, notifications, read_at):
+        """
+        Mark all dismissable ``notifications`` as read by moving the watermark
+        to the newest one among them.
+        """
+        newest = self.watermark
+        for notification in notifications:
+            created_at = notification.created_at
+            if not notification.dismissable or (self.watermark is not None and
+                                                created_at <= self.watermark):
+                continue
+            self.read.pop(notification.notification_id, None)
+            if newest is None or created_at > newest:
+                newest = created_at
+        if newest == self.watermark:
+            return
+        self.watermark = newest
+        self._save()
+
+
+class NotificationCounts(object):
+    """
+    Number of unread notifications per target, kept in the
+    ``notification_counts`` table. Shared notifications are counted until
+    they are deleted, as they are read by each user separately, which is
+    tracked by :py:class:`SharedReadState`.
+
+    So the read ones can be subtracted without looking them up, each
+    existing dismissable shared notification has a row of its own, with
+    ``notification`` target type, and the ``notification_marks`` table holds
+    the number of dismissable notifications of each group that were created
+    at or before the read watermarks of users.
+    """
+    INCREMENT_QUERY = """
+        INSERT INTO notification_counts (target_type, target, unread)
+        VALUES (%(target_type)s, %(target)s, %(delta)s)
+        ON CONFLICT (target_type, target)
+        DO UPDATE SET unread = notification_counts.unread + %(delta)s;
+    """
+    # notifications matching ``{where}`` are deleted together with their
+    # targets, and the counts of the targets are decremented by the number of
+    # deleted notifications they are counted for, all in a single statement
+    DELETE_QUERY = """
+        WITH targets AS (
+            DELETE FROM notification_targets t USING notifications n
+            WHERE t.notification_id = n.notification_id AND ({where})
+            RETURNING t.target_type, t.target, n.created_at, n.read_at,
+                      n.dismissable
+        ), deleted AS (
+            DELETE FROM notifications n WHERE {where}
+            RETURNING n.notification_id
+        ), counts AS (
+            UPDATE notification_counts c SET unread = c.unread - d.count
+            FROM (SELECT target_type, target, count(*) AS count
+                  FROM targets
+                  WHERE target_type = 'group' OR read_at IS NULL
+                  GROUP BY target_type, target) d
+            WHERE c.target_type = d.target_type AND c.target = d.target
+        ), marks AS (
+            UPDATE notification_marks m SET covered = m.covered - d.count
+            FROM (SELECT k.target, k.boundary, count(*) AS count
+                  FROM targets t
+                  JOIN notification_marks k ON k.target = t.target AND
+                                               k.boundary >= t.created_at
+                  WHERE t.target_type = 'group' AND t.dismissable
+                  GROUP BY k.target, k.boundary) d
+            WHERE m.target = d.target AND m.boundary = d.boundary
+        ), notification_rows AS (
+            DELETE FROM notification_counts c USING deleted d
+            WHERE c.target_type = 'notification' AND
+                  c.target = d.notification_id
+        )
+        SELECT count(*) AS count FROM deleted;
+    """
+    MARK_QUERY = """
+        INSERT INTO notification_marks (target, boundary, covered)
+        SELECT t.target, %(boundary)s, count(*)
+        FROM notification_targets t
+        JOIN notifications n ON n.notification_id = t.notification_id
+        WHERE t.target_type = 'group' AND n.dismissable AND
+              n.created_at <= %(boundary)s
+        GROUP BY t.target
+        ON CONFLICT (target, boundary) DO NOTHING;
+    """
+    PRUNE_QUERY = "DELETE FROM notification_marks WHERE covered <= 0"
+    LOOKUP_QUERY = """
+        SELECT target_type, unread AS count FROM notification_counts
+        WHERE (target_type = 'user' AND target = %(username)s) OR
+              (target_type = 'group' AND target IN %(groups)s) OR
+              (target_type = 'notification' AND target = ANY(%(read)s))
+        UNION ALL
+        SELECT 'mark', covered FROM notification_marks
+        WHERE target IN %(groups)s AND boundary = %(watermark)s;
+    """
+
+    @classmethod
+    def increment(cls, target_type, target, delta=1, db=None):
+        db = db or exts.databases.librarian
+        db.execute(cls.INCREMENT_QUERY, dict(target_type=target_type,
+                                             target=target,
+                                             delta=delta))
+
+    @classmethod
+    def delete(cls, where, params, db=None):
+        """
+        Delete the notifications matching the ``where`` clause, in which the
+        ``notifications`` table is aliased as ``n``, along with their targets,
+        and update the counts of the targets accordingly. Return the number
+        of deleted notifications.
+        """
+        db = db or exts.databases.librarian
+        query = cls.DELETE_QUERY.format(where=where)
+        return db.fetchone(query, params)['count']
+
+    @classmethod
+    def mark(cls, boundary, db=None):
+        """
+        Count the dismissable notifications of each group that were created
+        at or before ``boundary``, unless they're counted already.
+        """
+        db = db or exts.databases.librarian
+        db.execute(cls.MARK_QUERY, dict(boundary=boundary))
+
+    @classmethod
+    def prune(cls, db=None):
+        """
+        Remove counts of notifications created before boundaries that no
+        longer cover any notifications.
+        """
+        db = db or exts.databases.librarian
+        db.execute(cls.PRUNE_QUERY)
+
+    @classmethod
+    def get(cls, username, groups, watermark=None, read=(), db=None):
+        """
+        Return a tuple of the number of unread private notifications of
+        ``username``, the number of existing shared notifications of
+        ``groups``, and the number of those that were read, either by being
+        created at or before ``watermark``, or by having their ids in
+        ``read``.
+        """
+        db = db or exts.databases.librarian
+        private = shared = read_count = 0
+        for row in db.fetchiter(cls.LOOKUP_QUERY,
+                                dict(username=username,
+                                     groups=tuple(groups),
+                                     watermark=watermark,
+                                     read=list(read))):
+            if row['target_type'] == 'user':
+                private += row['count']
+            elif row['target_type'] == 'group':
+                shared += row['count']
+            else:
+                read_count += row['count']
+        return (private, shared, read_count)
+
+
 class Notification(object):
     NORMAL = 0
     URGENT = 1
@@ -58,6 +299,7 @@ class Notification(object):
         CRITICAL: 'critical',
     }
     on_send_callbacks = []
+    on_retract_callbacks = []
 
     def __init__(self, notification_id, message, created_at, category=None,
                  icon=None, priority=NORMAL, expires_at=None, dismissable=True,
@@ -87,6 +329,10 @@ class Notification(object):
     def on_send(cls, callback):
         cls.on_send_callbacks.append(callback)
 
+    @classmethod
+    def on_retract(cls, callback):
+        cls.on_retract_callbacks.append(callback)
+
     @classmethod
     def send(cls, message, category=None, icon=None, priority=NORMAL,
              expiration=0, dismissable=True, groupable=True, username=None,
@@ -125,12 +371,18 @@ class Notification(object):
                        username=username,
                        db=db)
         instance.save()
+        target = username or group or 'all'
+        target_type = 'user' if username else 'group'
         NotificationTarget.create(
             notification_id,
-            target=username or group or 'all',
-            target_type='user' if username else 'group',
+            target=target,
+            target_type=target_type,
             db=db,
         )
+        NotificationCounts.increment(target_type, target, db=db)
+        if dismissable and target_type == 'group':
+            NotificationCounts.increment('notification', notification_id,
+                                         db=db)
         # when notification is sent, invoke subscribers of on_send with
         # notification instance as their only argument
         for callback in cls.on_send_callbacks:
@@ -149,8 +401,7 @@ class Notification(object):
     @property
     def read_at(self):
         if self.is_shared:
-            read_data = request.user.options.get('notifications', {})
-            return read_data.get(self.notification_id, None)
+            return SharedReadState(request.user.options).get(self)
 
         return self._read_at
 
@@ -159,9 +410,7 @@ class Notification(object):
         return self.read_at is not None
 
     def _mark_shared_read(self, read_at):
-        notifications = request.user.options.get('notifications', {})
-        notifications[self.notification_id] = read_at
-        request.user.options['notifications'] = notifications
+        SharedReadState(request.user.options).mark(self, read_at)
 
     def _mark_private_read(self, read_at):
         query = self.db.Update('notifications',
@@ -169,6 +418,7 @@ class Notification(object):
                                where='notification_id = %(notification_id)s')
         self.db.execute(query, dict(notification_id=self.notification_id,
                                     read_at=read_at))
+        NotificationCounts.increment('user', self.username, -1, db=self.db)
         self._read_at = read_at
 
     def mark_read(self, read_at=None):
@@ -184,6 +434,23 @@ class Notification(object):
 
         return self
 
+    @classmethod
+    def mark_all_read(cls, notifications, read_at=None):
+        """Mark all of the passed in notifications as read. Shared ones are
+        marked in a single step, by moving the user's read watermark."""
+        read_at = utcnow() if read_at is None else read_at
+        shared = []
+        for notification in notifications:
+            if notification.is_shared:
+                shared.append(notification)
+            elif not notification.is_read:
+                notification._mark_private_read(read_at)
+        if shared:
+            state = SharedReadState(request.user.options)
+            state.mark_all(shared, read_at)
+            if state.watermark is not None:
+                NotificationCounts.mark(state.watermark, db=shared[0].db)
+
     def safe_message(self, *key_chain):
         """Attempt retrieveng the value under the passed in keys if message is
         a JSON object, otherwise just return the message itself."""
@@ -219,12 +486,9 @@ class Notification(object):
         return self
 
     def delete(self):
-        target_query = self.db.Delete('notification_targets',
-                                      where='notification_id = %s')
-        query = self.db.Delete('notifications', where='notification_id = %s')
-        with self.db.transaction() as cursor:
-            cursor.execute(target_query.serialize(), (self.notification_id,))
-            cursor.execute(query.serialize(), (self.notification_id,))
+        NotificationCounts.delete('n.notification_id = %(notification_id)s',
+                                  dict(notification_id=self.notification_id),
+                                  db=self.db)
         return self
 
     @staticmethod
@@ -240,16 +504,89 @@ class Notification(object):
 
     @classmethod
     def delete_by_category(cls, category, db):
-        query = db.Delete('notifications',
-                          where='notifications.category = %s')
-        where = ('notifications.category = %s AND '
-                 'notification_targets.notification_id = '
-                 'notifications.notification_id')
-        target_query = db.Delete('notification_targets USING notifications',
-                                 where=where)
-        with db.transaction() as cursor:
-            cursor.execute(target_query.serialize(), [category])
-            cursor.execute(query.serialize(), [category])
+        NotificationCounts.delete('n.category = %(category)s',
+                                  dict(category=category),
+                                  db=db)
+
+    @classmethod
+    def find(cls, category, group=None, db=None):
+        """Return the list of notifications under ``category``, limited to the
+        ones targeted at ``group`` if it is specified."""
+        db = db or exts.databases.librarian
+        where = ('t.notification_id = n.notification_id AND '
+                 'n.category = %(category)s')
+        if group is not None:
+            where += (" AND t.target_type = 'group' AND "
+                      "t.target = %(group)s")
+        query = db.Select(sets='notification_targets t, notifications n',
+                          what=['n.' + c for c in NOTIFICATION_COLS],
+                          where=where)
+        rows = db.fetchall(query, dict(category=category, group=group))
+        return [cls(db=db, **to_dict(row)) for row in rows]
+
+    @classmethod
+    def delete_many(cls, notification_ids, db):
+        NotificationCounts.delete('n.notification_id IN %(ids)s',
+                                  dict(ids=tuple(notification_ids)),
+                                  db=db)
+
+    def is_same(self, message, category, icon, priority, dismissable,
+                groupable):
+        if not isinstance(message, basestring):
+            message = json.loads(json.dumps(message))
+        return (self.message == message and
+                self.category == category and
+                self.icon == icon and
+                self.priority == priority and
+                self.dismissable == dismissable and
+                self.groupable == groupable)
+
+    @classmethod
+    def ensure(cls, category, group, message, icon=None, priority=NORMAL,
+               expiration=0, dismissable=True, groupable=True, db=None):
+        """Make sure that exactly one notification under ``category`` is
+        targeted at ``group``, having the passed in message and attributes.
+        Nothing is written if such a notification already exists, otherwise
+        the notifications under ``category`` that target ``group`` are
+        replaced with a newly sent one. Meant for notifications that reflect
+        some ongoing state, and are refreshed periodically. Returns the
+        notification either way."""
+        db = db or exts.databases.librarian
+        existing = cls.find(category, group, db=db)
+        if len(existing) == 1 and existing[0].is_same(message,
+                                                      category,
+                                                      icon,
+                                                      priority,
+                                                      dismissable,
+                                                      groupable):
+            return existing[0]
+
+        if existing:
+            cls.delete_many([n.notification_id for n in existing], db)
+        return cls.send(message,
+                        category=category,
+                        icon=icon,
+                        priority=priority,
+                        expiration=expiration,
+                        dismissable=dismissable,
+                        groupable=groupable,
+                        group=group,
+                        db=db)
+
+    @classmethod
+    def retract(cls, category, group=None, db=None):
+        """Delete the notifications under ``category``, limited to the ones
+        targeted at ``group`` if it is specified. Nothing is written if there
+        are no such notifications. Returns whether anything was deleted."""
+        db = db or exts.databases.librarian
+        existing = cls.find(category, group, db=db)
+        if not existing:
+            return False
+
+        cls.delete_many([n.notification_id for n in existing], db)
+        for callback in cls.on_retract_callbacks:
+            callback(category)
+        return True
 
 
 class NotificationTarget(object):
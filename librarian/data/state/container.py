@@ -1,6 +1,9 @@
 import functools
+import time
 import uuid
 
+from gevent.event import Event
+
 from ...core.exts import ext_container as exts
 
 
@@ -15,13 +18,25 @@ class StateContainer(object):
     name = 'state'
     #: Template used to generate cache keys for each provider
     key_template = '{name}-{id}-{provider}'
+    #: Template of versions handed out to clients
+    version_template = '{id}-{seq}'
 
     def __init__(self, **kwargs):
         self._registry = kwargs.get('registry', dict())
         self._cache = kwargs.get('cache', exts.cache)
         self._events = kwargs.get('events', exts.events)
         self._id = uuid.uuid4().hex
-        self._changed = set()
+        # sequence number of the latest change, and the sequence numbers of
+        # the latest change of each provider
+        self._seq = 0
+        self._versions = dict()
+        # replaced on each change, so greenlets waiting on the previous one
+        # are all woken up
+        self._changed = Event()
+        # time of the latest fetch and the number of clients waiting for
+        # changes, used to tell whether anyone is interested in the state
+        self._last_fetch = None
+        self._waiting = 0
 
     def __get_key(self, provider):
         """
@@ -32,12 +47,31 @@ class StateContainer(object):
                                         id=self._id,
                                         provider=provider)
 
-    def __get(self, key, default):
+    def __parse_version(self, version):
+        """
+        Return the sequence number of a ``version`` handed out by this
+        container, or ``None`` if it's invalid, or it was handed out by
+        another container, for example before a restart.
+        """
+        try:
+            (epoch, seq) = version.rsplit('-', 1)
+            seq = int(seq)
+        except (AttributeError, ValueError):
+            return None
+        if epoch != self._id or seq > self._seq:
+            return None
+        return seq
+
+    def __get(self, key, default, prefetched=None):
         """
         Callback function invoked by :py:class:`StorageProvider` instances when
-        they query for their data.
+        they query for their data. If the data was fetched ahead of time, it
+        is looked up in ``prefetched`` instead of the cache.
         """
-        data = self._cache.get(key)
+        try:
+            data = prefetched[key]
+        except (TypeError, KeyError):
+            data = self._cache.get(key)
         if data is None:
             return default
         return data
@@ -48,8 +82,11 @@ class StateContainer(object):
         they store their data.
         """
         self._cache.set(key, data, timeout=timeout)
-        # add key to set of keys that were changed since last synchronization
-        self._changed.add(provider_name)
+        # record the version of the change and wake up waiting clients
+        self._seq += 1
+        self._versions[provider_name] = self._seq
+        (changed, self._changed) = (self._changed, Event())
+        changed.set()
         # emit event notifying potential subscribers about a single change.
         # subscriber is passed only the provider object, not the data itself,
         # to enforce the same access methods and permissions as with getters
@@ -111,12 +148,65 @@ class StateContainer(object):
                                 onchange=onchange)
         self._registry[provider_cls.name] = instance
 
-    def fetch_changes(self):
+    def get_many(self, names):
+        """
+        Return a dict containing the data of the providers specified by
+        ``names``, fetching all of it from the cache in a single query. The
+        access checks of each provider are performed the same way as with
+        their ``get`` method.
+        """
+        keys = [self.__get_key(name) for name in names]
+        found = self._cache.get_many(keys)
+        # passed down to the getters, so concurrent calls don't see each
+        # other's data
+        prefetched = dict((key, found.get(key)) for key in keys)
+        return dict((name, self._registry[name].get(prefetched=prefetched))
+                    for name in names)
+
+    @property
+    def version(self):
+        """
+        Version of the latest change, which consists of the id of the
+        container and the sequence number of the change.
+        """
+        return self.version_template.format(id=self._id, seq=self._seq)
+
+    def fetch_changes(self, since=None):
+        """
+        Return a tuple of the current version and a list of names of the
+        providers which data has changed after version ``since``. All
+        providers are returned if ``since`` is not specified, or if it was
+        not handed out by this container, which happens when clients keep
+        versions handed out before a restart.
+        """
+        self._last_fetch = time.time()
+        since = self.__parse_version(since)
+        if since is None:
+            return (self.version, list(self._registry.keys()))
+        return (self.version, [name for (name, seq) in self._versions.items()
+                               if seq > since])
+
+    def wait_for_changes(self, since, timeout=None):
+        """
+        Like :py:meth:`fetch_changes`, but if there were no changes after
+        version ``since``, block the calling greenlet until the next change
+        happens, or ``timeout`` seconds pass.
+        """
+        if self.__parse_version(since) == self._seq:
+            self._waiting += 1
+            try:
+                self._changed.wait(timeout)
+            finally:
+                self._waiting -= 1
+        return self.fetch_changes(since)
+
+    def has_clients(self, timeout):
         """
-        Return a dict containing references to the providers which data has
-        changed since the last call to it.
+        Return whether any client is waiting for changes, or fetched the state
+        within the last ``timeout`` seconds.
         """
-        changed = self._changed
-        # ensure atomicity
-        self._changed = set()
-        return dict((k, self._registry[k]) for k in changed)
+        if self._waiting:
+            return True
+        if self._last_fetch is None:
+            return False
+        return time.time() - self._last_fetch < timeout
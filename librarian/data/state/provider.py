@@ -84,9 +84,11 @@ class StateProvider(object):
         """
         return self.default_value
 
-    def get(self):
+    def get(self, prefetched=None):
         """
-        Return data (if possible) that is managed by this provider.
+        Return data (if possible) that is managed by this provider. The
+        optional ``prefetched`` dict holds data that was already fetched for
+        multiple providers at once.
         """
         # check access mode
         if not self.is_readable():
@@ -98,7 +100,7 @@ class StateProvider(object):
                                          " access".format(self.name))
         # read and return data
         default = self.get_default_value()
-        return self._getter(default)
+        return self._getter(default, prefetched=prefetched)
 
     def set(self, data):
         """
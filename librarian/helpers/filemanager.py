@@ -105,8 +105,12 @@ def find_root(path):
 
 
 def thumb_exists(root, thumbpath):
+    known = getattr(request, 'known_thumbs', {})
+    if known.get(thumbpath):
+        return True
+
     cache = request.app.supervisor.exts(onfail=None).cache
-    if cache.get(thumbpath):
+    if thumbpath not in known and cache.get(thumbpath):
         return True
 
     exists = os.path.exists(os.path.join(root, thumbpath))
@@ -115,6 +119,45 @@ def thumb_exists(root, thumbpath):
     return exists
 
 
+def determine_thumb(srcpath):
+    """
+    Return the processor class responsible for creating the thumbnail of
+    ``srcpath`` and the path of the thumbnail, or a pair of ``None`` values if
+    it has no thumbnail.
+    """
+    config = request.app.config
+    processors = Processor.for_path(srcpath)
+    try:
+        proc_cls = filter(lambda p: p.name != 'generic', processors)[0]
+    except IndexError:
+        return (None, None)
+    thumbpath = proc_cls.determine_thumb_path(srcpath,
+                                              config['thumbs.dirname'],
+                                              config['thumbs.extension'])
+    return (proc_cls, thumbpath)
+
+
+def prefetch_thumbs(fsobjs):
+    """
+    Look up whether the thumbnails of all images among ``fsobjs`` exist using
+    a single cache query, so :py:func:`thumb_exists` does not have to query
+    the cache for each image separately while rendering a listing.
+    """
+    thumbpaths = []
+    for fsobj in fsobjs:
+        ext = fsobj.rel_path.rsplit('.', 1)[-1].lower()
+        if EXTENSION_VIEW_MAPPING.get(ext) != 'image':
+            continue
+        (_, thumbpath) = determine_thumb(fsobj.rel_path)
+        if thumbpath:
+            thumbpaths.append(thumbpath)
+    if not thumbpaths:
+        return
+    cache = request.app.supervisor.exts(onfail=None).cache
+    found = cache.get_many(thumbpaths)
+    request.known_thumbs = dict((path, path in found) for path in thumbpaths)
+
+
 def thumb_created(cache, srcpath, thumbpath):
     if thumbpath:
         cache.set(thumbpath, True)
@@ -227,14 +270,9 @@ def get_thumb_path(srcpath, default=None):
         return srcpath
     else:
         config = request.app.config
-        processors = Processor.for_path(srcpath)
-        try:
-            proc_cls = filter(lambda p: p.name != 'generic', processors)[0]
-        except IndexError:
+        (proc_cls, thumbpath) = determine_thumb(srcpath)
+        if not proc_cls:
             return None
-        thumbpath = proc_cls.determine_thumb_path(srcpath,
-                                                  config['thumbs.dirname'],
-                                                  config['thumbs.extension'])
         if thumb_exists(root, thumbpath):
             return thumbpath
 
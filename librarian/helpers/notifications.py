@@ -4,18 +4,20 @@ from ..core.contrib.templates.decorators import template_helper
 from ..core.exts import ext_container as exts
 from ..data.notifications import (to_dict,
                                   Notification,
+                                  NotificationCounts,
                                   NotificationGroup,
+                                  SharedReadState,
                                   NOTIFICATION_COLS)
 
 
 FIXED_COLS = ['n.' + c for c in NOTIFICATION_COLS]
+GROUPS_CACHE_PREFIX = 'notification_group_'
 
 
 def invalidate_notification_cache(notification):
     # for now jsut invalidate the whole cache, no matter if it's a
     # private notification
-    for key in ('notification_group', 'notification_count'):
-        exts.cache.invalidate(key)
+    exts.cache.invalidate(GROUPS_CACHE_PREFIX)
 
 
 def get_user_groups(user):
@@ -46,28 +48,30 @@ def get_notifications(db=None):
 
 
 def get_notification_groups():
-    key = 'notification_group_{0}'.format(request.session.id)
-    groups = request.app.supervisor.exts(onfail=None).cache.get(key)
+    cache = request.app.supervisor.exts(onfail=None).cache
+    key = cache.prefixed(GROUPS_CACHE_PREFIX, request.session.id)
+    groups = cache.get(key)
     if groups:
         return groups
 
     groups = NotificationGroup.group_by(get_notifications(),
                                         by=('category', 'read_at'))
-    request.app.supervisor.exts.cache.set(key, groups)
+    cache.set(key, groups)
     return groups
 
 
-def _get_notification_count(db):
-    return len(get_notification_groups())
-
-
 @template_helper()
 def get_notification_count(db=None):
-    key = 'notification_count_{0}'.format(request.session.id)
-    count = request.app.supervisor.exts(onfail=None).cache.get(key)
-    if count:
-        return count
-
-    count = _get_notification_count(db)
-    request.app.supervisor.exts.cache.set(key, count)
-    return count
+    """
+    Return the number of unread notifications of the current user, using the
+    precomputed counts of their targets.
+    """
+    user = request.user.username if request.user.is_authenticated else None
+    user, groups = get_user_groups(user)
+    state = SharedReadState(request.user.options)
+    (private, shared, read) = NotificationCounts.get(user,
+                                                     groups + ('all',),
+                                                     watermark=state.watermark,
+                                                     read=state.read.keys(),
+                                                     db=db)
+    return private + max(shared - read, 0)
@@ -3,6 +3,9 @@ from ondd_ipc.ipc import ONDDClient
 
 from .core.exports import hook
 from .core.exts import ext_container as exts
+from .data.meta.archive import Archive
+from .data.meta.crawler import Crawler
+from .data.meta.scheduler import AnalysisScheduler
 from .data.notifications import Notification
 from .helpers.notifications import invalidate_notification_cache
 
@@ -18,7 +21,23 @@ def initialize(supervisor):
     exts.fsal = FSAL(exts.config['fsal.socket'])
     exts.notifications = Notification
     exts.notifications.on_send(invalidate_notification_cache)
+    exts.notifications.on_retract(invalidate_notification_cache)
     exts.ondd = ONDDClient(exts.config['ondd.socket'])
+    exts.analysis = AnalysisScheduler(
+        archive_factory=Archive,
+        batch_size=exts.config['facets.analysis_batch_size'],
+        delay=exts.config['facets.analysis_delay'])
+    exts.crawler = Crawler(
+        archive_factory=Archive,
+        checkpoint_path=exts.config['crawler.checkpoint'],
+        fsal=exts.fsal,
+        slice_duration=exts.config['crawler.slice_duration'],
+        checkpoint_interval=exts.config['crawler.checkpoint_interval'],
+        min_delay=exts.config['crawler.min_delay'],
+        max_delay=exts.config['crawler.max_delay'],
+        idle_delay=exts.config['crawler.idle_delay'],
+        max_request_rate=exts.config['crawler.max_request_rate'],
+        max_iowait=exts.config['crawler.max_iowait'])
     # register error handler routes
     supervisor.app.error(403)(system.error_403)
     supervisor.app.error(404)(system.error_404)
@@ -0,0 +1,58 @@
+SQL = """
+create sequence archive_rev_seq;
+alter table fs add column rev bigint not null
+    default nextval('archive_rev_seq');
+create index on fs (rev);
+create table fs_deleted
+(
+    path varchar primary key,
+    type smallint not null,
+    rev bigint not null default nextval('archive_rev_seq')
+);
+create index on fs_deleted (rev);
+
+-- any change of an fs entry gets a new revision, unless the revision itself
+-- was just changed
+create function fs_stamp_rev() returns trigger as $$
+begin
+    new.rev := nextval('archive_rev_seq');
+    return new;
+end;
+$$ language plpgsql;
+create trigger fs_stamp_rev before update on fs
+    for each row when (old.rev = new.rev and old.* is distinct from new.*)
+    execute procedure fs_stamp_rev();
+
+-- deleted fs entries leave a tombstone behind, one per path
+create function fs_record_deleted() returns trigger as $$
+begin
+    insert into fs_deleted (path, type) values (old.path, old.type)
+        on conflict (path) do update set type = excluded.type,
+                                         rev = excluded.rev;
+    return old;
+end;
+$$ language plpgsql;
+create trigger fs_record_deleted after delete on fs
+    for each row execute procedure fs_record_deleted();
+
+-- metadata changes are changes of the fs entry they belong to
+create function meta_stamp_rev() returns trigger as $$
+begin
+    if tg_op = 'DELETE' then
+        update fs set rev = nextval('archive_rev_seq') where id = old.fs_id;
+        return old;
+    end if;
+    update fs set rev = nextval('archive_rev_seq') where id = new.fs_id;
+    return new;
+end;
+$$ language plpgsql;
+create trigger meta_stamp_rev after insert or delete on meta
+    for each row execute procedure meta_stamp_rev();
+create trigger meta_stamp_rev_update after update on meta
+    for each row when (old.* is distinct from new.*)
+    execute procedure meta_stamp_rev();
+"""
+
+
+def up(db, conf):
+    db.executescript(SQL)
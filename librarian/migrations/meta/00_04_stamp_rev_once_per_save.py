@@ -0,0 +1,11 @@
+SQL = """
+-- metadata of an fs entry is written by a single statement which stamps the
+-- entry with a new revision itself, instead of once per metadata row
+drop trigger meta_stamp_rev on meta;
+drop trigger meta_stamp_rev_update on meta;
+drop function meta_stamp_rev();
+"""
+
+
+def up(db, conf):
+    db.executescript(SQL)
@@ -0,0 +1,23 @@
+SQL = """
+create index on notification_targets (target_type, target);
+create index on notification_targets (notification_id);
+create table notification_counts
+(
+    target_type varchar not null,           -- type of target, empty for the cleanup row
+    target varchar not null,                -- identifying charactaristic of recipient
+    unread integer not null default 0,      -- number of unread notifications of the target
+    cleaned_at timestamptz,                 -- time of the last cleanup, set only in the cleanup row
+    primary key (target_type, target)
+);
+insert into notification_counts (target_type, target) values ('', '');
+insert into notification_counts (target_type, target, unread)
+    select t.target_type, t.target, count(*)
+    from notification_targets t
+    join notifications n on n.notification_id = t.notification_id
+    where n.read_at is null
+    group by t.target_type, t.target;
+"""
+
+
+def up(db, conf):
+    db.executescript(SQL)
@@ -0,0 +1,22 @@
+SQL = """
+create index on notifications (created_at);
+create table notification_marks
+(
+    target varchar not null,                -- group targeted by the notifications
+    boundary timestamptz not null,          -- read watermark of one or more users
+    covered integer not null default 0,     -- number of dismissable notifications created at or before the boundary
+    primary key (target, boundary)
+);
+delete from notification_counts where target_type = '';
+alter table notification_counts drop column cleaned_at;
+insert into notification_counts (target_type, target, unread)
+    select 'notification', t.notification_id, 1
+    from notification_targets t
+    join notifications n on n.notification_id = t.notification_id
+    where t.target_type = 'group' and n.dismissable
+    on conflict do nothing;
+"""
+
+
+def up(db, conf):
+    db.executescript(SQL)
@@ -0,0 +1,19 @@
+import functools
+
+from ..utils.load import request_load
+
+
+def request_load_plugin(fn):
+    """
+    Keep track of the number of requests being handled, so that background
+    jobs, such as the library crawler, can back off while users are active.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        request_load.begin()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            request_load.end()
+    return wrapper
+request_load_plugin.name = 'request_load_plugin'
@@ -91,7 +91,8 @@ class Wizard(object):
 
     def save_state(self):
         request.session[self.id] = self.state
-        request.session.save()
+        # wizard state is kept on the server, not in anonymous session cookies
+        request.session.upgrade().save()
 
     def clear_needed_steps(self):
         if self.state is None:
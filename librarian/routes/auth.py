@@ -14,6 +14,7 @@ from bottle_utils.i18n import i18n_url, lazy_gettext as _
 from streamline import RouteBase, XHRPartialFormRoute
 
 from ..core.contrib.auth.users import User
+from ..core.contrib.sessions.sessions import Session
 from ..core.contrib.templates.renderer import template
 from ..core.exts import ext_container as exts
 from ..forms.auth import LoginForm, PasswordResetForm, EmergencyResetForm
@@ -99,6 +100,7 @@ class EmergencyReset(CSRFRouteMixin, RedirectRouteMixin, XHRPartialFormRoute):
         db = exts.databases.librarian
         db.execute(db.Delete('users'))
         db.execute(db.Delete('sessions'))
+        Session.store.clear()
 
     def recreate_user(self, username, password):
         return User.create(username,
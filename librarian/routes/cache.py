@@ -0,0 +1,23 @@
+from bottle_utils.i18n import i18n_url
+from streamline import NonIterableRouteBase
+
+from ..core.contrib.cache.helpers import get_stats, reset_stats
+from ..core.exts import ext_container as exts
+from ..decorators.auth import login_required
+from ..utils.route_mixins import JSONResponseMixin
+
+
+class CacheStats(JSONResponseMixin, NonIterableRouteBase):
+    name = 'cache:stats'
+    path = '/cache/stats/'
+
+    @login_required(superuser_only=True)
+    def get(self):
+        return get_stats(exts.cache)
+
+    @login_required(superuser_only=True)
+    def post(self):
+        reset_stats(exts.cache)
+        if not self.request.is_xhr:
+            self.redirect(i18n_url('dashboard:main'))
+        return get_stats(exts.cache)
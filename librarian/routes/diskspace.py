@@ -33,8 +33,8 @@ class Notifier(object):
     }
 
     def clear(self):
-        exts.notifications.delete_by_category('consolidate_storage',
-                                              exts.databases.librarian)
+        exts.notifications.retract('consolidate_storage',
+                                   db=exts.databases.librarian)
 
     def notify(self, message, priority):
         exts.notifications.send(message,
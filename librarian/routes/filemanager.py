@@ -19,7 +19,8 @@ from ..core.contrib.templates.renderer import template
 from ..data.manager import Manager
 from ..data.meta.contenttypes import ContentTypes
 from ..forms.filemanager import DeleteForm
-from ..helpers.filemanager import get_parent_url, find_root, get_thumb_path
+from ..helpers.filemanager import (get_parent_url, find_root, get_thumb_path,
+                                   prefetch_thumbs)
 from ..presentation.paginator import Paginator
 from ..utils.route_mixins import CSRFRouteMixin
 
@@ -124,6 +125,7 @@ class List(FileRouteMixin, XHRPartialRoute):
             result = self.updates(path, show_hidden)
         else:
             result = self.list(path, show_hidden, view, selected)
+        prefetch_thumbs(result.get('files', []))
         # perform view promotion, if available
         view = self.promote_view(view, result['current'])
         result.update(is_search=is_search,
@@ -13,9 +13,11 @@ from streamline import XHRPartialFormRoute
 from ..core.contrib.templates.renderer import template
 from ..core.exts import ext_container as exts
 from ..core.utils import utcnow
-from ..data.notifications import NotificationGroup
+from ..data.notifications import Notification, NotificationGroup
 from ..forms.notifications import NotificationForm
-from ..helpers.notifications import get_notifications, get_notification_groups
+from ..helpers.notifications import (get_notifications,
+                                     get_notification_groups,
+                                     GROUPS_CACHE_PREFIX)
 
 
 class List(XHRPartialFormRoute):
@@ -35,9 +37,8 @@ class List(XHRPartialFormRoute):
                 notification.mark_read(now)
 
     def invalidate_cache(self):
-        for key_tmpl in ('notification_group_{}', 'notification_count_{}'):
-            key = key_tmpl.format(self.request.session.id)
-            exts.cache.delete(key)
+        key = exts.cache.prefixed(GROUPS_CACHE_PREFIX, self.request.session.id)
+        exts.cache.delete(key)
 
     def get_markable_groups(self):
         first_id = self.form.processed_data['notification_id']
@@ -54,9 +55,16 @@ class List(XHRPartialFormRoute):
 
     def form_valid(self):
         groups = self.get_markable_groups()
-        # loop through the groups and mark them as read
-        for group in groups:
-            self.mark_read(group.notifications)
+        if self.form.should_mark_all():
+            # all shared notifications are marked at once by moving the read
+            # watermark of the user
+            Notification.mark_all_read([n for grp in groups
+                                        for n in grp.notifications
+                                        if n.dismissable], utcnow())
+        else:
+            # loop through the groups and mark them as read
+            for group in groups:
+                self.mark_read(group.notifications)
         # invalidate cached notifications under current session, since their
         # state has changed now
         self.invalidate_cache()
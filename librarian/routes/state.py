@@ -5,10 +5,36 @@ from ..utils.route_mixins import JSONResponseMixin
 
 
 class StateRoute(JSONResponseMixin, NonIterableRouteBase):
+    """
+    Return the data of providers that have changed after the version
+    specified by the ``since`` parameter, along with the current version,
+    which should be passed as ``since`` in the next request.
+    """
     name = 'state:handler'
     path = '/state/'
     exclude_plugins = ['setup_plugin']
 
+    def get_since(self):
+        return self.request.params.get('since')
+
+    def fetch_changes(self, since):
+        return exts.state.fetch_changes(since)
+
     def get(self):
-        providers = exts.state.fetch_changes()
-        return dict((key, prov.get()) for (key, prov) in providers.items())
+        (version, names) = self.fetch_changes(self.get_since())
+        return dict(version=version, changes=exts.state.get_many(names))
+
+
+class StatePollRoute(StateRoute):
+    """
+    Same as :py:class:`StateRoute`, but the response is held back until some
+    state changes, or the configured timeout expires.
+    """
+    name = 'state:poll'
+    path = '/state/poll/'
+    # waiting clients should not count as load on the system
+    exclude_plugins = ['setup_plugin', 'request_load_plugin']
+
+    def fetch_changes(self, since):
+        timeout = exts.config['state.poll_timeout']
+        return exts.state.wait_for_changes(since, timeout=timeout)
@@ -0,0 +1,18 @@
+from ..data.state.provider import StateProvider
+
+
+class CrawlerProvider(StateProvider):
+    name = 'crawler'
+
+    def get_default_value(self):
+        return {
+            'status': 'idle',
+            'root': '',
+            'dirs_done': 0,
+            'files_done': 0,
+            'pending': 0,
+            'rate': 0,
+            'eta': None,
+            'started_at': None,
+            'delay': 0,
+        }
@@ -2,10 +2,12 @@
 var bind = function(fn, me){ return function(){ return fn.apply(me, arguments); }; };
 
 (function(window, $, templates) {
-  var FETCH_INTERVAL, fetch, locale, provider, registry, stateUrl, update;
-  FETCH_INTERVAL = 3000;
+  var RETRY_INTERVAL, fetch, locale, poll, pollUrl, provider, registry, stateUrl, update, version;
+  RETRY_INTERVAL = 3000;
   locale = (window.location.pathname.split('/'))[1];
   stateUrl = "/" + locale + "/state/";
+  pollUrl = "/" + locale + "/state/poll/";
+  version = null;
   window.state = {};
   registry = {};
   window.state.provider = function(name) {
@@ -97,26 +99,34 @@ var bind = function(fn, me){ return function(){ return fn.apply(me, arguments);
 
   })();
   update = function(data) {
-    var instance, key, results, value;
+    var instance, key, ref, results, value;
+    version = data.version;
+    ref = data.changes;
     results = [];
-    for (key in data) {
-      value = data[key];
+    for (key in ref) {
+      value = ref[key];
       instance = window.state.provider(key);
       results.push(instance.set(value));
     }
     return results;
   };
-  fetch = function() {
-    var res;
-    res = $.get(stateUrl);
+  fetch = function(url) {
+    var params, res;
+    params = version != null ? {
+      since: version
+    } : {};
+    res = $.get(url, params);
     res.done(function(data) {
       update(data);
-      return setTimeout(fetch, FETCH_INTERVAL);
+      return poll();
     });
     return res.fail(function() {
       console.log('State synchronization failed.');
-      return setTimeout(fetch, FETCH_INTERVAL);
+      return setTimeout(poll, RETRY_INTERVAL);
     });
   };
-  return setTimeout(fetch, FETCH_INTERVAL);
+  poll = function() {
+    return fetch(pollUrl);
+  };
+  return fetch(stateUrl);
 })(this, this.jQuery, this.templates);
@@ -0,0 +1,20 @@
+from greentasks import Task
+
+from ..core.exts import ext_container as exts
+
+
+class CrawlTask(Task):
+    name = 'crawler'
+    periodic = True
+
+    def get_start_delay(self):
+        # give the rest of the system some time to settle down before an
+        # interrupted crawl is resumed
+        return exts.config['crawler.start_delay']
+
+    def get_delay(self, previous_delay):
+        # the crawler adapts the delay to the current load of the system
+        return exts.crawler.get_delay()
+
+    def run(self):
+        exts.crawler.run_slice()
@@ -53,4 +53,4 @@ class CheckNewContentTask(Task):
         if removable:
             self.archive.remove(removable)
         if analyzable:
-            self.archive.analyze(analyzable, callback=self.archive.save_many)
+            self.archive.schedule_analysis(analyzable)
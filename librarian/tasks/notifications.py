@@ -5,6 +5,7 @@ from greentasks import Task
 
 from ..core.exts import ext_container as exts
 from ..core.utils import utcnow
+from ..data.notifications import NotificationCounts
 
 
 class NotificationCleanupTask(Task):
@@ -23,16 +24,11 @@ class NotificationCleanupTask(Task):
         logging.debug("Notification cleanup started.")
         now = utcnow()
         auto_expires_at = now - datetime.timedelta(seconds=default_expiry)
-        where = '''notifications.dismissable = true AND (
-                    (notifications.expires_at IS NULL AND
-                     notifications.created_at <= %(auto_expires_at)s) OR
-                     notifications.expires_at <= %(now)s)'''
-        query = db.Delete('notifications', where=where)
-        target_query = db.Delete('notification_targets USING notifications',
-                                 where=where)
-        target_query.where += ('notification_targets.notification_id = '
-                               'notifications.notification_id')
+        where = '''n.dismissable = true AND (
+                    (n.expires_at IS NULL AND
+                     n.created_at <= %(auto_expires_at)s) OR
+                     n.expires_at <= %(now)s)'''
         params = dict(now=now, auto_expires_at=auto_expires_at)
-        db.execute(target_query, params)
-        rows = db.execute(query, params)
+        rows = NotificationCounts.delete(where, params, db=db)
+        NotificationCounts.prune(db=db)
         logging.debug("{} expired notifications deleted.".format(rows))
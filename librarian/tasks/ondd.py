@@ -1,3 +1,7 @@
+import logging
+import time
+
+import gevent
 from greentasks import Task
 from ondd_ipc import consts as c_ondd
 
@@ -13,35 +17,43 @@ class ONDDQueryTask(Task):
 
     #: Maximum signal strength usable by the indicator
     MAX_STRENGTH = 4
+    #: Last published data, kept on the class as the scheduler creates a new
+    #: instance of the task for each run
+    snapshot = None
 
     def get_start_delay(self):
         return exts.config['ondd.refresh_rate']
 
     def get_delay(self, previous_delay):
-        return exts.config['ondd.refresh_rate']
+        # when nobody is looking at the state, there's no point in querying
+        # ondd as often
+        timeout = exts.config['state.poll_timeout']
+        if exts.state.has_clients(timeout):
+            return exts.config['ondd.refresh_rate']
+        return exts.config['ondd.idle_refresh_rate']
 
     def send_cache_warning(self):
         db = exts.databases.librarian
-        exts.notifications.send(
+        exts.notifications.ensure(
+            'ondd_cache',
+            'guest',
             # Translators, notification displayed when internal cache storage
             # is running out of disk space
             _('Download capacity is getting low. '
               'Please ask the administrator to take action.'),
-            category='ondd_cache',
             dismissable=False,
             priority=exts.notifications.CRITICAL,
-            group='guest',
             db=db)
-        exts.notifications.send(
+        exts.notifications.ensure(
+            'ondd_cache',
+            'superuser',
             # Translators, notification displayed when internal cache storage
             # is running out of disk space
             _('Download cache capacity is getting low. You will stop receiving'
               ' new content if you run out of storage space. Please move some '
               'content from the internal storage to an external one.'),
-            category='ondd_cache',
             dismissable=False,
             priority=exts.notifications.CRITICAL,
-            group='superuser',
             db=db)
 
     def query_cache(self):
@@ -78,13 +90,12 @@ class ONDDQueryTask(Task):
         # Sanity check
         assert virt_free + cache_used == cache_max
 
-        # First clean any notifications
-        db = exts.databases.librarian
-        exts.notifications.delete_by_category('ondd_cache', db)
-
         if cache_critical:
             # Now we also need to warn the user about low cache capacity
             self.send_cache_warning()
+        else:
+            db = exts.databases.librarian
+            exts.notifications.retract('ondd_cache', db=db)
 
         return dict(total=cache_max,
                     free=virt_free,
@@ -127,13 +138,22 @@ class ONDDQueryTask(Task):
         return exts.ondd.get_transfers()
 
     def run(self):
-        cache = self.query_cache()
-        status = self.query_status()
-        transfers = self.query_transfers()
-        # update global state through provider
-        data = dict(cache=cache,
-                    status=status,
-                    transfers=transfers)
-        provider = exts.state.provider('ondd')
-        provider.set(data)
+        start = time.time()
+        # the queries are independent, so they are all sent at once
+        jobs = dict(cache=gevent.spawn(self.query_cache),
+                    status=gevent.spawn(self.query_status),
+                    transfers=gevent.spawn(self.query_transfers))
+        gevent.joinall(jobs.values())
+        data = dict((key, job.get()) for (key, job) in jobs.items())
+        elapsed = time.time() - start
+        # update global state through provider, only if anything changed, so
+        # clients are not notified needlessly
+        changed = data != ONDDQueryTask.snapshot
+        if changed:
+            ONDDQueryTask.snapshot = data
+            exts.state.provider('ondd').set(data)
+        logging.debug(u"ONDD queried in %.3fs, state %s.",
+                      elapsed,
+                      'changed' if changed else 'unchanged')
+        return dict(elapsed=elapsed, changed=changed)
 
@@ -0,0 +1,50 @@
+import logging
+import time
+
+from greentasks import Task
+
+from ..core.exts import ext_container as exts
+from ..core.utils import utcnow
+from ..utils.load import request_load
+
+
+class SessionCleanupTask(Task):
+    """
+    Deletes expired sessions in batches of limited size, so the sessions table
+    is not locked for long. The cleanup is interrupted as soon as the system
+    becomes busy serving requests, and it's resumed by the next run.
+    """
+    name = 'sessions'
+    periodic = True
+    #: Maximum number of batches deleted in a single run
+    MAX_BATCHES = 100
+
+    def get_start_delay(self):
+        return exts.config['session.cleanup_interval']
+
+    def get_delay(self, previous_delay):
+        return exts.config['session.cleanup_interval']
+
+    def run(self):
+        db = exts.databases.librarian
+        batch_size = exts.config['session.cleanup_batch_size']
+        max_request_rate = exts.config['session.cleanup_max_request_rate']
+        query = db.Delete('sessions', where='''session_id IN (
+            SELECT session_id FROM sessions
+            WHERE expires < %(now)s
+            LIMIT %(limit)s)''')
+        logging.debug("Session cleanup started.")
+        started = time.time()
+        reclaimed = 0
+        for _ in range(self.MAX_BATCHES):
+            if request_load.is_busy(max_request_rate):
+                logging.debug("Session cleanup interrupted, system is busy.")
+                break
+            rows = db.execute(query, dict(now=utcnow(), limit=batch_size))
+            reclaimed += rows
+            if rows < batch_size:
+                break
+        elapsed = time.time() - started
+        logging.info("%s expired sessions deleted in %.2f seconds.",
+                     reclaimed, elapsed)
+        return dict(reclaimed=reclaimed, elapsed=elapsed)
@@ -0,0 +1,97 @@
+"""
+load.py: Lightweight system and request load monitoring
+
+Copyright 2014-2015, Outernet Inc.
+Some rights reserved.
+
+This software is free software licensed under the terms of GPLv3. See COPYING
+file that comes with the source code, or http://www.gnu.org/licenses/gpl.txt.
+"""
+
+from __future__ import division
+
+import collections
+import logging
+import time
+
+
+class RequestLoad(object):
+    """
+    Keeps track of the number of requests being handled at the moment and
+    the timestamps of the most recently started requests, which can be used
+    to calculate the recent request rate.
+    """
+    #: Maximum number of request timestamps remembered
+    HISTORY_SIZE = 256
+
+    def __init__(self):
+        self.active = 0
+        self._history = collections.deque(maxlen=self.HISTORY_SIZE)
+
+    def begin(self):
+        self.active += 1
+        self._history.append(time.time())
+
+    def end(self):
+        self.active = max(self.active - 1, 0)
+
+    def rate(self, window=10):
+        """
+        Return the average number of requests per second that were started in
+        the last ``window`` seconds.
+        """
+        since = time.time() - window
+        count = sum(1 for started in self._history if started >= since)
+        return count / window
+
+    def is_busy(self, max_rate):
+        """
+        Return whether there are requests being handled right now, or the
+        recent request rate exceeds ``max_rate``.
+        """
+        return self.active > 0 or self.rate() > max_rate
+
+
+class IOWait(object):
+    """
+    Samples ``/proc/stat`` and calculates the fraction of CPU time spent
+    waiting for I/O since the previous sample. On platforms where the file is
+    not available, it always reports zero.
+    """
+    #: Location of the kernel CPU statistics
+    PROC_STAT = '/proc/stat'
+    #: Index of the iowait column in the cpu line (after the label)
+    IOWAIT_COLUMN = 4
+
+    def __init__(self, path=PROC_STAT):
+        self._path = path
+        self._previous = None
+
+    def _read(self):
+        try:
+            with open(self._path, 'r') as stat_file:
+                for line in stat_file:
+                    if line.startswith('cpu '):
+                        values = [int(v) for v in line.split()[1:]]
+                        return (sum(values), values[self.IOWAIT_COLUMN])
+        except (IOError, OSError, ValueError, IndexError):
+            logging.debug(u"CPU statistics not available in %s", self._path)
+        return None
+
+    def sample(self):
+        """
+        Return the fraction (0 - 1) of CPU time spent in iowait since the last
+        time this method was invoked.
+        """
+        current = self._read()
+        (previous, self._previous) = (self._previous, current)
+        if not current or not previous:
+            return 0
+        total = current[0] - previous[0]
+        if total <= 0:
+            return 0
+        return (current[1] - previous[1]) / total
+
+
+#: Request load shared between the request counter plugin and its consumers
+request_load = RequestLoad()
@@ -0,0 +1,61 @@
+<%def name="counters_row(label, counters)">
+    <tr>
+        <td>${label | h}</td>
+        <td class="value">${counters['hits']}</td>
+        <td class="value">${counters['misses']}</td>
+        <td class="value">${counters['sets']}</td>
+        <td class="value">${counters['evictions']}</td>
+        <td class="value">${counters['expirations']}</td>
+    </tr>
+</%def>
+
+<div class="cache-stats-panel">
+    <table>
+        <tr>
+            ## Translators, used as label for the name of the cache backend
+            <td>${_("Backend")}</td>
+            <td class="value">${stats['backend']}</td>
+        </tr>
+        <tr>
+            ## Translators, used as label for the percentage of cache lookups
+            ## which found the requested item
+            <td>${_("Hit rate")}</td>
+            <td class="value">${'{:.1f}%'.format(hit_rate) if hit_rate is not None else '-'}</td>
+        </tr>
+        <tr>
+            ## Translators, used as label for the number of items in cache
+            <td>${_("Items")}</td>
+            <td class="value">${stats['items'] if stats['items'] is not None else '-'}</td>
+        </tr>
+        <tr>
+            ## Translators, used as label for the memory or disk space used by
+            ## cached items
+            <td>${_("Size")}</td>
+            <td class="value">${h.hsize(stats['bytes']) if stats['bytes'] is not None else '-'}</td>
+        </tr>
+    </table>
+    <table>
+        <tr>
+            ## Translators, used as column heading in cache statistics
+            <th>${_("Prefix")}</th>
+            ## Translators, used as column heading in cache statistics
+            <th>${_("Hits")}</th>
+            ## Translators, used as column heading in cache statistics
+            <th>${_("Misses")}</th>
+            ## Translators, used as column heading in cache statistics
+            <th>${_("Sets")}</th>
+            ## Translators, used as column heading in cache statistics
+            <th>${_("Evictions")}</th>
+            ## Translators, used as column heading in cache statistics
+            <th>${_("Expirations")}</th>
+        </tr>
+        ${counters_row(_("Total"), stats)}
+        % for prefix, counters in sorted(stats['prefixes'].items()):
+            ${counters_row(prefix or _("Other"), counters)}
+        % endfor
+    </table>
+    <form action="${i18n_url('cache:stats')}" method="POST">
+        ## Translators, button label that resets cache statistics
+        <button type="submit">${_('Reset statistics')}</button>
+    </form>
+</div>
@@ -0,0 +1,48 @@
+"""
+Compare the decoding speed of the typed JSON format with the legacy format,
+using a payload shaped like the user data that is stored in sessions.
+"""
+import argparse
+import json
+import timeit
+
+from librarian.core.contrib.databases import serializers
+from librarian.core.contrib.databases.utils import utcnow
+
+
+def make_payload(size):
+    options = dict(('option{}'.format(i), 'value {}'.format(i))
+                   for i in range(size))
+    options['notifications'] = ['notification-{}'.format(i)
+                                for i in range(size)]
+    options['last_visit'] = utcnow()
+    return dict(username='someone',
+                password='$p5k2$1000$salt$hash',
+                reset_token=None,
+                created=utcnow(),
+                options=options,
+                groups='superuser')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', '-s', type=int, default=20,
+                        help='number of options in the payload')
+    parser.add_argument('--number', '-n', type=int, default=1000,
+                        help='number of decodings to time')
+    args = parser.parse_args()
+    payload = make_payload(args.size)
+    legacy = json.dumps(payload, cls=serializers.DateTimeEncoder)
+    typed = serializers.dumps(payload)
+    legacy_time = timeit.timeit(
+        lambda: json.loads(legacy, cls=serializers.DateTimeDecoder),
+        number=args.number)
+    typed_time = timeit.timeit(lambda: serializers.loads(typed),
+                               number=args.number)
+    print('legacy: {:.3f}s'.format(legacy_time))
+    print('typed:  {:.3f}s'.format(typed_time))
+    print('speedup: {:.1f}x'.format(legacy_time / typed_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import mock
+import pytest
+
+import librarian.core.contrib.auth.permissions as mod
+
+
+GRANTS = {
+    'docs': mod.ACLPermission.READ,
+    'docs/private': mod.ACLPermission.NO_PERMISSION,
+    'docs/shared/notes.txt': mod.ACLPermission.READ | mod.ACLPermission.WRITE,
+    'media/video': mod.ACLPermission.READ,
+}
+
+
+@pytest.fixture(autouse=True)
+def invalidate():
+    mod.ACLPermission.invalidate()
+    yield
+    mod.ACLPermission.invalidate()
+
+
+@pytest.fixture
+def acl():
+    db = mock.Mock()
+    db.fetchone.return_value = dict(data=mod.serializers.dumps(GRANTS))
+    return mod.ACLPermission('someone', db=db)
+
+
+@pytest.mark.parametrize('path,bitmask', [
+    ('', 0),
+    ('docs', 4),
+    ('docs/a.txt', 4),
+    ('docs/shared', 4),
+    ('docs/shared/notes.txt', 6),
+    ('docs/private/b.txt', 0),
+    ('media', 0),
+    ('media/video/c.mp4', 4),
+    ('/docs/a.txt', 4),
+])
+def test_trie_get(path, bitmask):
+    assert mod.ACLTrie(GRANTS).get(path) == bitmask
+
+
+def test_trie_filter():
+    paths = ['docs/a.txt', 'docs/private', 'docs/private/b.txt',
+             'docs/shared/notes.txt', 'media/audio', 'media/video/c.mp4',
+             'readme.txt']
+    trie = mod.ACLTrie(GRANTS)
+    assert trie.filter(paths, mod.ACLPermission.READ) == [
+        'docs/a.txt', 'docs/shared/notes.txt', 'media/video/c.mp4']
+    assert trie.filter(paths, mod.ACLPermission.WRITE) == [
+        'docs/shared/notes.txt']
+
+
+def test_is_granted_inherited(acl):
+    assert acl.is_granted('docs/a.txt', 'r')
+    assert not acl.is_granted('docs/a.txt', 'w')
+    assert not acl.is_granted('docs/private/b.txt', 'r')
+
+
+def test_filter_paths(acl):
+    assert acl.filter_paths(['docs/a.txt', 'readme.txt'], 'r') == [
+        'docs/a.txt']
+
+
+def test_trie_cached_per_user(acl):
+    assert acl.trie is mod.ACLPermission('someone', db=acl.db).trie
+    assert acl.trie is not mod.ACLPermission('other', db=acl.db).trie
+
+
+def test_grant_rebuilds_trie(acl):
+    trie = acl.trie
+    acl.grant('readme.txt', 'r')
+    assert acl.trie is not trie
+    assert acl.filter_paths(['readme.txt'], 'r') == ['readme.txt']
+
+
+def test_revoke_overrides_ancestor(acl):
+    acl.grant('a', 'r')
+    acl.revoke('a/b', 'r')
+    assert acl.is_granted('a', 'r')
+    assert not acl.is_granted('a/b', 'r')
+    assert not acl.is_granted('a/b/c.txt', 'r')
+    assert acl.data['a/b'] == mod.ACLPermission.NO_PERMISSION
+
+
+def test_revoke_prunes_inherited(acl):
+    acl.grant('docs/private', 'r')
+    # same as inherited from ``docs``
+    assert 'docs/private' not in acl.data
+    assert acl.is_granted('docs/private/b.txt', 'r')
+    acl.revoke('docs/private', 'r')
+    assert acl.data['docs/private'] == mod.ACLPermission.NO_PERMISSION
+
+
+def test_grant_keeps_inherited(acl):
+    acl.grant('docs/a.txt', 'w')
+    assert acl.is_granted('docs/a.txt', 'rw')
@@ -0,0 +1,80 @@
+import mock
+import pytest
+
+import librarian.core.contrib.auth.base as base
+import librarian.core.contrib.auth.groups as groups
+import librarian.core.contrib.auth.permissions as permissions
+
+
+@pytest.fixture(autouse=True)
+def registries():
+    groups.Group.invalidate()
+    permissions.ACLPermission.invalidate()
+    yield
+    groups.Group.invalidate()
+    permissions.ACLPermission.invalidate()
+
+
+@pytest.fixture
+def db():
+    db = mock.Mock()
+    db.fetchall.return_value = [
+        dict(name='superuser', permissions='', has_superpowers=True),
+        dict(name='guest', permissions='acl', has_superpowers=False),
+    ]
+    db.fetchone.return_value = None
+    return db
+
+
+def test_cast():
+    assert base.BasePermission.cast('acl') is permissions.ACLPermission
+    with pytest.raises(ValueError):
+        base.BasePermission.cast('missing')
+
+
+def test_cast_new_subclass():
+    class CustomPermission(base.BasePermission):
+        name = 'custom'
+    assert base.BasePermission.cast('custom') is CustomPermission
+
+
+def test_group_from_name_loads_once(db):
+    guest = groups.Group.from_name('guest', db=db)
+    superuser = groups.Group.from_name('superuser', db=db)
+    assert guest.permission_classes == [permissions.ACLPermission]
+    assert superuser.has_superpowers
+    assert db.fetchall.call_count == 1
+    with pytest.raises(groups.GroupNotFound):
+        groups.Group.from_name('missing', db=db)
+    assert db.fetchall.call_count == 1
+
+
+def test_group_from_name_returns_copies(db):
+    guest = groups.Group.from_name('guest', db=db)
+    guest.remove_permission(permissions.ACLPermission)
+    assert groups.Group.from_name('guest', db=db).permissions == ['acl']
+
+
+def test_group_save_invalidates(db):
+    groups.Group.from_name('guest', db=db)
+    groups.Group(db=db, name='editor').save()
+    groups.Group.from_name('guest', db=db)
+    assert db.fetchall.call_count == 2
+
+
+def test_dynamic_permission_loads_once(db):
+    db.fetchone.return_value = dict(data='{"/": 4}')
+    acl = permissions.ACLPermission('guest', db=db)
+    assert acl.is_granted('/', 'r')
+    acl = permissions.ACLPermission('guest', db=db)
+    assert acl.is_granted('/', 'r')
+    assert db.fetchone.call_count == 1
+
+
+def test_dynamic_permission_save_updates_cache(db):
+    acl = permissions.ACLPermission('guest', db=db)
+    acl.grant('/docs', 'rw')
+    acl.data['/docs'] = 0
+    acl = permissions.ACLPermission('guest', db=db)
+    assert acl.is_granted('/docs', 'rw')
+    assert db.fetchone.call_count == 1
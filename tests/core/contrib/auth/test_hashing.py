@@ -0,0 +1,50 @@
+import mock
+import pytest
+
+import librarian.core.contrib.auth.hashing as mod
+
+
+@pytest.fixture(autouse=True)
+def config():
+    with mock.patch.object(mod, 'exts') as exts:
+        exts.config = {'auth.hash_pool_size': 2, 'auth.hash_iterations': 10}
+        with mock.patch.object(mod, '_pool', None):
+            yield exts.config
+
+
+def test_encrypt_uses_configured_iterations():
+    assert mod.encrypt('secret').startswith('$p5k2$a$')
+
+
+def test_verify():
+    encrypted = mod.encrypt('secret')
+    assert mod.verify('secret', encrypted)
+    assert not mod.verify('wrong', encrypted)
+
+
+def test_verify_keeps_stored_iterations(config):
+    encrypted = mod.encrypt('secret')
+    config['auth.hash_iterations'] = 20
+    assert mod.verify('secret', encrypted)
+
+
+@pytest.mark.parametrize('salt,iterations', [
+    (None, 400),
+    (None, 10),
+    ('abcdef', 400),
+    ('$p5k2$$abcdef$hash', 10),
+    ('$p5k2$a$abcdef$hash', 400),
+])
+def test_pbkdf2_crypt_matches_pbkdf2(salt, iterations):
+    with mock.patch.object(mod.pbkdf2, '_makesalt', return_value='xyz123'):
+        expected = mod.pbkdf2.crypt(u'secr\xe9t', salt, iterations)
+        assert mod.pbkdf2_crypt(u'secr\xe9t', salt, iterations) == expected
+
+
+@mock.patch.object(mod, 'ThreadPool')
+def test_crypt_runs_in_pool(ThreadPool):
+    ThreadPool.return_value.apply.return_value = 'hash'
+    assert mod.crypt('secret') == 'hash'
+    ThreadPool.assert_called_once_with(2)
+    ThreadPool.return_value.apply.assert_called_once_with(
+        mod.pbkdf2_crypt, ('secret', None, 10))
@@ -0,0 +1,42 @@
+import mock
+
+import librarian.core.contrib.auth.options as mod
+
+
+def test_change_invokes_callback():
+    onchange = mock.Mock()
+    options = mod.Options({}, onchange=onchange)
+    options['language'] = 'en'
+    del options['language']
+    assert onchange.call_count == 2
+
+
+def test_deferred_changes_flushed_once():
+    onchange = mock.Mock()
+    options = mod.Options({'notifications': {}}, onchange=onchange)
+    options.defer()
+    for i in range(40):
+        notifications = options.get('notifications')
+        notifications[str(i)] = i
+        options['notifications'] = notifications
+    assert not onchange.called
+    options.flush()
+    onchange.assert_called_once_with()
+    options.flush()
+    onchange.assert_called_once_with()
+
+
+def test_deferred_unchanged_not_flushed():
+    onchange = mock.Mock()
+    options = mod.Options('{"language": "en"}', onchange=onchange)
+    options.defer()
+    options['language'] = 'en'
+    options.flush()
+    assert not onchange.called
+
+
+def test_flush_without_defer():
+    onchange = mock.Mock()
+    options = mod.Options({}, onchange=onchange)
+    options.flush()
+    assert not onchange.called
@@ -0,0 +1,355 @@
+import mock
+import pytest
+
+import librarian.core.contrib.cache.backends as mod
+
+
+@pytest.fixture
+def lru():
+    return mod.LRUInMemoryCache(lru_items=3)
+
+
+def test_lru_get_set(lru):
+    lru.set('a', 1)
+    assert lru.get('a') == 1
+    assert lru.get('b') is None
+    assert lru.stats()['hits'] == 1
+    assert lru.stats()['misses'] == 1
+
+
+def test_lru_evicts_least_recently_used(lru):
+    for key in 'abc':
+        lru.set(key, key)
+    # access makes "a" the most recently used item
+    lru.get('a')
+    lru.set('d', 'd')
+    assert lru.get('b') is None
+    assert [lru.get(key) for key in 'acd'] == ['a', 'c', 'd']
+    assert lru.stats()['evictions'] == 1
+    assert lru.stats()['items'] == 3
+
+
+def test_lru_update_does_not_evict(lru):
+    for key in 'abc':
+        lru.set(key, key)
+    lru.set('a', 'x')
+    assert lru.stats()['evictions'] == 0
+    assert lru.get('a') == 'x'
+
+
+@mock.patch.object(mod.time, 'time')
+def test_lru_expired_on_get(time, lru):
+    time.return_value = 100
+    lru.set('a', 1, timeout=10)
+    time.return_value = 111
+    assert lru.get('a') is None
+    assert lru.stats()['expirations'] == 1
+    assert lru._wheel == {}
+
+
+@mock.patch.object(mod.time, 'time')
+def test_lru_sweep(time):
+    lru = mod.LRUInMemoryCache(lru_items=10)
+    time.return_value = 100
+    lru.set('a', 1, timeout=10)
+    lru.set('b', 2, timeout=12)
+    lru.set('c', 3, timeout=100)
+    lru.set('d', 4)
+    time.return_value = 111
+    lru.sweep()
+    # "b" is in the same bucket as "a", but not expired yet
+    assert lru.stats()['expirations'] == 1
+    assert lru.stats()['items'] == 3
+    time.return_value = 113
+    lru.sweep()
+    assert lru.stats()['expirations'] == 2
+    assert lru.get('c') == 3
+    assert lru.get('d') == 4
+
+
+@mock.patch.object(mod.time, 'time')
+def test_lru_sweep_skips_updated(time, lru):
+    time.return_value = 100
+    lru.set('a', 1, timeout=10)
+    lru.set('a', 2, timeout=100)
+    time.return_value = 120
+    lru.sweep()
+    assert lru.get('a') == 2
+    assert lru.stats()['expirations'] == 0
+
+
+def test_lru_delete_and_invalidate(lru):
+    lru.set(lru.prefixed('pre_', 'a'), 1, timeout=10)
+    lru.set(lru.prefixed('pre_', 'b'), 2)
+    lru.set('other', 3)
+    lru.invalidate('pre_')
+    lru.sweep()
+    assert lru.get(lru.prefixed('pre_', 'a')) is None
+    assert lru.get('other') == 3
+    lru.delete('other')
+    assert lru.stats()['items'] == 0
+    assert lru._wheel == {}
+
+
+@pytest.mark.parametrize('cls,kwargs', [
+    (mod.InMemoryCache, {}),
+    (mod.ScoredInMemoryCache, {'limit': 10}),
+    (mod.LRUInMemoryCache, {'lru_items': 10}),
+])
+def test_in_memory_invalidate_generation(cls, kwargs):
+    cache = cls(**kwargs)
+    cache.set(cache.prefixed('pre_', 'a'), 1)
+    cache.set(cache.prefixed('other_', 'a'), 2)
+    old_key = cache.prefixed('pre_', 'a')
+    cache.invalidate('pre_')
+    # new keys are built with the next generation of the prefix
+    assert cache.prefixed('pre_', 'a') != old_key
+    assert cache.get(cache.prefixed('pre_', 'a')) is None
+    assert cache.get(cache.prefixed('other_', 'a')) == 2
+    # outdated items are removed from memory only when swept
+    assert old_key in cache._cache
+    cache.sweep()
+    assert old_key not in cache._cache
+    assert cache.get(cache.prefixed('other_', 'a')) == 2
+
+
+def test_in_memory_index_follows_deletes():
+    cache = mod.InMemoryCache()
+    key = cache.prefixed('pre_', 'a')
+    cache.set(key, 1)
+    assert cache._index[cache.parse_prefix('pre_')] == set([key])
+    cache.delete(key)
+    assert cache._index[cache.parse_prefix('pre_')] == set()
+
+
+@pytest.fixture
+def sized():
+    return mod.SizedLRUInMemoryCache(budget=1000.0)
+
+
+def test_sized_lru_tracks_usage(sized):
+    sized.set('a', 'x' * 100)
+    usage = sized.usage
+    assert usage >= 100
+    sized.set('a', 'y' * 100)
+    assert sized.usage == usage
+    sized.delete('a')
+    assert sized.usage == 0
+    assert sized.stats()['bytes'] == 0
+
+
+def test_sized_lru_evicts_over_budget(sized):
+    for key in 'abcde':
+        sized.set(key, key * 250)
+    assert sized.usage <= sized.budget
+    assert sized.get('a') is None
+    assert sized.get('e') == 'e' * 250
+    assert sized.stats()['evictions'] > 0
+
+
+def test_sized_lru_skips_too_big(sized):
+    sized.set('a', 1)
+    sized.set('a', 'x' * 2000)
+    assert sized.get('a') is None
+    assert sized.usage == 0
+
+
+def test_sized_lru_charges_nested_values(sized):
+    sized.set('a', ['x' * 100, 'y' * 100])
+    assert sized.usage > 200
+
+
+@mock.patch.object(mod, 'read_meminfo')
+def test_sized_lru_shrinks_under_pressure(read_meminfo):
+    cache = mod.SizedLRUInMemoryCache(budget=10000.0, pressure_ratio=0.1)
+    for key in 'abcd':
+        cache.set(key, key * 100)
+    read_meminfo.return_value = dict(MemTotal=1000, MemAvailable=500)
+    cache.sweep()
+    assert cache.stats()['items'] == 4
+    read_meminfo.return_value = dict(MemTotal=1000, MemAvailable=50)
+    cache.sweep()
+    assert cache.stats()['items'] == 2
+    assert cache.get('d') == 'd' * 100
+
+
+def test_base_get_many(lru):
+    lru.set_many({'a': 1, 'b': 2})
+    assert lru.get_many(['a', 'b', 'c']) == {'a': 1, 'b': 2}
+    lru.delete_many(['a', 'c'])
+    assert lru.get_many(['a', 'b']) == {'b': 2}
+
+
+@pytest.fixture
+def tiered():
+    with mock.patch.dict('sys.modules', pylibmc=mock.Mock()):
+        cache = mod.TieredCache(servers=['127.0.0.1:11211'],
+                                local_limit=10,
+                                local_timeout=5)
+    cache._cache.get.return_value = None
+    cache._cache.get_multi.return_value = {}
+    return cache
+
+
+def test_tiered_get_served_locally(tiered):
+    tiered._cache.get.return_value = 1
+    assert tiered.get('a') == 1
+    assert tiered.get('a') == 1
+    tiered._cache.get.assert_called_once_with('a')
+
+
+def test_tiered_set_writes_both(tiered):
+    tiered.set('a', 1, timeout=60)
+    assert tiered._cache.set.called
+    assert tiered.get('a') == 1
+    assert not tiered._cache.get.called
+    tiered.delete('a')
+    tiered._cache.delete.assert_called_once_with('a')
+    assert tiered.get('a') is None
+
+
+@mock.patch.object(mod.time, 'time')
+def test_tiered_local_timeout(time, tiered):
+    time.return_value = 100
+    tiered.set('a', 1, timeout=60)
+    time.return_value = 106
+    tiered._cache.get.return_value = 2
+    assert tiered.get('a') == 2
+
+
+def test_tiered_get_many(tiered):
+    tiered.set('a', 1)
+    tiered._cache.get_multi.return_value = {'b': 2}
+    assert tiered.get_many(['a', 'b', 'c']) == {'a': 1, 'b': 2}
+    tiered._cache.get_multi.assert_called_once_with(['b', 'c'])
+    # fetched items are kept locally
+    assert tiered.get_many(['b']) == {'b': 2}
+    assert tiered._cache.get_multi.call_count == 1
+
+
+def test_tiered_set_many_and_delete_many(tiered):
+    tiered.set_many({'a': 1, 'b': 2}, timeout=0)
+    tiered._cache.set_multi.assert_called_once_with({'a': 1, 'b': 2}, 0)
+    tiered.delete_many(['a'])
+    tiered._cache.delete_multi.assert_called_once_with(['a'])
+    assert tiered.get_many(['a', 'b']) == {'b': 2}
+
+
+@pytest.fixture
+def disk_path(tmpdir):
+    return str(tmpdir.join('cache', 'cache.log'))
+
+
+def test_disk_get_set(disk_path):
+    cache = mod.DiskCache(path=disk_path, max_bytes=0.0)
+    cache.set('a', {'id': 1})
+    cache.set(u'\u0161', [1, 2])
+    assert cache.get('a') == {'id': 1}
+    assert cache.get(u'\u0161') == [1, 2]
+    assert cache.get('b') is None
+    assert cache.stats()['hits'] == 2
+
+
+def test_disk_persistent(disk_path):
+    cache = mod.DiskCache(path=disk_path, max_bytes=0.0)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.set('a', 3)
+    cache.set('pre_x', 4)
+    cache.set('other', 5)
+    cache.delete('b')
+    cache.invalidate('pre_')
+    reopened = mod.DiskCache(path=disk_path, max_bytes=0.0)
+    assert reopened.get('a') == 3
+    assert reopened.get('b') is None
+    assert reopened.get('pre_x') is None
+    assert reopened.get('other') == 5
+
+
+@mock.patch.object(mod.time, 'time')
+def test_disk_expiry(time, disk_path):
+    time.return_value = 100
+    cache = mod.DiskCache(path=disk_path, max_bytes=0.0)
+    cache.set('a', 1, timeout=10)
+    cache.set('b', 2, timeout=10)
+    time.return_value = 111
+    assert cache.get('a') is None
+    cache.sweep()
+    assert cache.stats()['expirations'] == 2
+    assert cache.stats()['items'] == 0
+    # log is compacted once it consists of expired records only
+    assert cache.stats()['bytes'] == 0
+    time.return_value = 100
+    assert mod.DiskCache(path=disk_path, max_bytes=0.0).get('a') is None
+
+
+def test_disk_recovers_from_partial_write(disk_path):
+    cache = mod.DiskCache(path=disk_path, max_bytes=0.0)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    size = cache.stats()['bytes']
+    with open(disk_path, 'r+b') as log:
+        log.truncate(size - 3)
+    reopened = mod.DiskCache(path=disk_path, max_bytes=0.0)
+    assert reopened.get('a') == 1
+    assert reopened.get('b') is None
+    reopened.set('c', 3)
+    assert mod.DiskCache(path=disk_path, max_bytes=0.0).get('c') == 3
+
+
+def test_disk_limit(disk_path):
+    cache = mod.DiskCache(path=disk_path, max_bytes=2000.0)
+    for i in range(100):
+        cache.set('key{}'.format(i), 'x' * 50)
+        # recently used item is not evicted
+        assert cache.get('key0') == 'x' * 50
+    assert cache.stats()['bytes'] <= 2000
+    assert cache.stats()['evictions'] > 0
+    assert cache.get('key99') == 'x' * 50
+    reopened = mod.DiskCache(path=disk_path, max_bytes=2000.0)
+    assert reopened.get('key0') == 'x' * 50
+    assert reopened.get('key99') == 'x' * 50
+
+
+@pytest.mark.parametrize('cls,kwargs', [
+    (mod.InMemoryCache, {}),
+    (mod.ScoredInMemoryCache, {'limit': 10}),
+    (mod.SizeScoredInMemoryCache, {'limit': 10000}),
+    (mod.LRUInMemoryCache, {'lru_items': 10}),
+    (mod.SizedLRUInMemoryCache, {'budget': 10000.0}),
+])
+def test_stats_per_prefix(cls, kwargs):
+    cache = cls(**kwargs)
+    cache.set(cache.prefixed('fs_', 'a'), 1)
+    cache.set(cache.prefixed('fs_other_', 'a'), 1)
+    cache.set('plain', 2)
+    cache.get(cache.prefixed('fs_', 'a'))
+    cache.get(cache.prefixed('fs_', 'b'))
+    cache.get('plain')
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['sets']) == (2, 1, 3)
+    assert stats['items'] == 3
+    assert stats['bytes'] > 0
+    assert stats['prefixes']['fs_'] == dict(hits=1, misses=1, sets=1,
+                                            evictions=0, expirations=0)
+    assert stats['prefixes']['fs_other_']['sets'] == 1
+    assert stats['prefixes']['']['hits'] == 1
+    cache.reset_stats()
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['sets']) == (0, 0, 0)
+    assert stats['prefixes'] == {}
+    assert stats['items'] == 3
+
+
+def test_memcached_stats(tiered):
+    tiered._cache.get_stats.return_value = [
+        ('s1', {'curr_items': '2', 'bytes': '100', 'evictions': '1'}),
+        ('s2', {'curr_items': '3', 'bytes': '50', 'evictions': '0'}),
+    ]
+    tiered.set('a', 1)
+    tiered.get('a')
+    tiered.get('b')
+    stats = tiered.stats()
+    assert (stats['hits'], stats['misses'], stats['sets']) == (1, 1, 1)
+    assert (stats['items'], stats['bytes'], stats['evictions']) == (5, 150, 1)
+    assert stats['local']['items'] == 1
@@ -0,0 +1,41 @@
+import os
+
+import confloader
+import pytest
+from backports import configparser
+
+import librarian
+import librarian.core.contrib.cache.helpers as mod
+
+
+@pytest.fixture
+def config():
+    path = os.path.join(os.path.dirname(librarian.__file__), 'config.ini')
+    parser = configparser.RawConfigParser(strict=False)
+    parser.read(path)
+    return dict(('cache.{}'.format(key), confloader.parse_value(value))
+                for (key, value) in parser.items('cache'))
+
+
+@pytest.mark.parametrize('backend,limits', [
+    ('scored-in-memory', dict(limit=1000)),
+    ('lru-in-memory', dict(limit=1000)),
+    ('sized-lru-in-memory', dict(limit=0, budget=32 * 1024 * 1024)),
+])
+def test_setup_defaults(backend, limits, config):
+    cache = mod.setup(backend, config)
+    assert cache.identifier == backend
+    for (name, value) in limits.items():
+        assert getattr(cache, name) == value
+
+
+def test_setup_disk_defaults(config, tmpdir):
+    config['cache.path'] = str(tmpdir.join('cache.log'))
+    cache = mod.setup('disk', config)
+    assert cache.limit == 64 * 1024 * 1024
+
+
+def test_setup_invalid(config):
+    config['cache.lru_items'] = '1000'
+    with pytest.raises(mod.CacheConfigError):
+        mod.setup('lru-in-memory', config)
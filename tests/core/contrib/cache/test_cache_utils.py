@@ -0,0 +1,50 @@
+import sys
+import threading
+
+import librarian.core.contrib.cache.utils as mod
+
+
+class Item(object):
+
+    def __init__(self, value):
+        self.value = value
+
+
+class Handle(object):
+
+    def __init__(self):
+        self.payload = 'y' * 100000
+
+    def cursor(self):
+        pass
+
+
+def test_deep_size_counts_referenced_objects():
+    value = 'x' * 1000
+    assert mod.deep_size([value]) >= sys.getsizeof(value)
+    assert mod.deep_size(Item(value)) >= sys.getsizeof(value)
+    assert mod.deep_size({'key': value}) >= sys.getsizeof(value)
+
+
+def test_deep_size_counts_shared_objects_once():
+    value = 'x' * 1000
+    assert mod.deep_size([value, value]) < 2 * sys.getsizeof(value)
+
+
+def test_deep_size_skips_shared_objects():
+    value = 'x' * 1000
+    item = Item(value)
+    item.db = Handle()
+    item.cls = Item
+    item.module = sys
+    assert mod.deep_size(item) < 2 * sys.getsizeof(value)
+    # objects referenced by shared objects are not walked either
+    assert mod.deep_size([item, threading.Lock()]) < 2 * sys.getsizeof(value)
+
+
+def test_read_meminfo(tmpdir):
+    meminfo = tmpdir.join('meminfo')
+    meminfo.write('MemTotal:        1000 kB\nMemAvailable:     500 kB\n')
+    assert mod.read_meminfo(str(meminfo)) == dict(MemTotal=1000,
+                                                  MemAvailable=500)
+    assert mod.read_meminfo(str(tmpdir.join('missing'))) == {}
@@ -0,0 +1,120 @@
+import gevent
+import mock
+import pytest
+
+import librarian.core.contrib.cache.backends as backends
+import librarian.core.contrib.cache.decorators as mod
+
+
+@pytest.fixture
+def cache():
+    cache = backends.InMemoryCache()
+    with mock.patch.object(mod, 'request') as request:
+        request.app.supervisor.exts.is_installed.return_value = True
+        request.app.supervisor.exts.cache = cache
+        with mock.patch.dict(mod._stats, clear=True):
+            yield cache
+
+
+def make_func(delay=0):
+    calls = []
+
+    def func(x):
+        calls.append(x)
+        gevent.sleep(delay)
+        return x * 2
+    return (func, calls)
+
+
+def test_cached(cache):
+    (func, calls) = make_func()
+    cached = mod.cached(prefix='pre_')(func)
+    assert cached(2) == 4
+    assert cached(2) == 4
+    assert calls == [2]
+    assert mod.get_stats()['pre_'] == dict(hits=1, misses=1, waits=0,
+                                           stale=0)
+
+
+def test_cached_single_flight(cache):
+    (func, calls) = make_func(delay=0.01)
+    cached = mod.cached(prefix='pre_')(func)
+    greenlets = [gevent.spawn(cached, 2) for _ in range(5)]
+    gevent.joinall(greenlets)
+    assert [g.value for g in greenlets] == [4] * 5
+    assert calls == [2]
+    assert mod.get_stats()['pre_']['waits'] == 4
+    assert mod._pending == {}
+
+
+def test_cached_wait_timeout(cache):
+    (func, calls) = make_func(delay=0.05)
+    cached = mod.cached(wait=0.01)(func)
+    greenlets = [gevent.spawn(cached, 2) for _ in range(2)]
+    gevent.joinall(greenlets)
+    assert [g.value for g in greenlets] == [4, 4]
+    assert calls == [2, 2]
+
+
+def test_cached_waiters_get_exception(cache):
+    def func():
+        gevent.sleep(0.01)
+        raise ValueError()
+    cached = mod.cached()(func)
+    greenlets = [gevent.spawn(cached) for _ in range(2)]
+    gevent.joinall(greenlets)
+    assert all(isinstance(g.exception, ValueError) for g in greenlets)
+    assert mod._pending == {}
+
+
+@mock.patch.object(mod.time, 'time')
+def test_cached_stale_while_revalidate(time, cache):
+    (func, calls) = make_func()
+    cached = mod.cached(timeout=10, stale=100)(func)
+    time.return_value = 1000
+    assert cached(2) == 4
+    time.return_value = 1011
+    with mock.patch.object(mod.gevent, 'spawn') as spawn:
+        assert cached(2) == 4
+    assert calls == [2]
+    assert mod.get_stats()['']['stale'] == 1
+    # the refresh computes and stores the new value
+    mod.refresh(*spawn.call_args[0][1:])
+    assert calls == [2, 2]
+    assert cached(2) == 4
+    assert mod.get_stats()['']['hits'] == 1
+
+
+def test_cached_none(cache):
+    calls = []
+
+    def func():
+        calls.append(1)
+    cached = mod.cached()(func)
+    assert cached() is None
+    assert cached() is None
+    assert calls == [1]
+    assert mod.get_stats()[''] == dict(hits=1, misses=1, waits=0, stale=0)
+
+
+@mock.patch.object(mod.time, 'time')
+def test_cached_refresh_in_request_context(time, cache):
+    seen = []
+
+    def func():
+        seen.append(mod.request.bind.call_args)
+        return 1
+    cached = mod.cached(timeout=10, stale=100)(func)
+    mod.request.environ = {'bottle.request.ext.user': 'someone'}
+    time.return_value = 1000
+    cached()
+    time.return_value = 1011
+    with mock.patch.object(mod.gevent, 'spawn') as spawn:
+        cached()
+    (refresh, environ) = spawn.call_args[0][:2]
+    # the environment is copied, as the request may be over by the refresh
+    assert environ == mod.request.environ
+    assert environ is not mod.request.environ
+    mod.request.bind.reset_mock()
+    refresh(*spawn.call_args[0][1:])
+    assert seen[-1] == mock.call(environ)
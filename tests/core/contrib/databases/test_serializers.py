@@ -0,0 +1,36 @@
+import datetime
+import json
+
+import pytz
+
+import librarian.core.contrib.databases.serializers as mod
+
+
+def test_roundtrip():
+    nested = datetime.datetime(2016, 1, 2, tzinfo=pytz.utc)
+    data = dict(created=datetime.datetime(2016, 1, 2, 3, 4, 5, 6, pytz.utc),
+                naive=datetime.datetime(2016, 1, 2, 3, 4, 5),
+                nested=[dict(at=nested)],
+                name='2016-01-02',
+                count=3)
+    assert mod.loads(mod.dumps(data)) == data
+
+
+def test_strings_are_not_parsed():
+    data = dict(username='may', path='2016/01/02')
+    assert mod.loads(mod.dumps(data)) == data
+
+
+def test_aware_datetime_stored_in_utc():
+    tz = pytz.timezone('Europe/Belgrade')
+    value = tz.localize(datetime.datetime(2016, 6, 1, 12))
+    loaded = mod.loads(mod.dumps(dict(value=value)))['value']
+    assert loaded == value
+    assert loaded.tzinfo is pytz.utc
+
+
+def test_loads_legacy():
+    created = datetime.datetime(2016, 1, 2, 3, 4, 5, tzinfo=pytz.utc)
+    data = json.dumps(dict(created=created, username='someone'),
+                      cls=mod.DateTimeEncoder)
+    assert mod.loads(data) == dict(created=created, username='someone')
@@ -0,0 +1,152 @@
+import datetime
+
+import mock
+import pytest
+
+import librarian.core.contrib.sessions.sessions as mod
+
+
+EXPIRES = mod.utcnow() + datetime.timedelta(days=1)
+
+
+@pytest.fixture
+def store():
+    store = mod.SessionStore(limit=2)
+    with mock.patch.object(mod.Session, 'store', store):
+        yield store
+
+
+@pytest.fixture
+def db():
+    with mock.patch.object(mod, 'exts') as exts:
+        yield exts.databases.librarian
+
+
+def test_save_unchanged_is_not_written(store, db):
+    db.fetchone.return_value = dict(session_id='a',
+                                    data='{"user": "x"}',
+                                    expires=EXPIRES)
+    session = mod.Session.fetch('a')
+    session['user'] = 'x'
+    session.save()
+    assert mod.Session.flush() == 0
+    session['user'] = 'y'
+    session.save()
+    assert mod.Session.flush() == 1
+    assert db.executemany.call_args[0][1] == [
+        dict(session_id='a', data='{"user": "y"}', expires=EXPIRES)]
+
+
+def test_fetch_served_from_store(store, db):
+    session = mod.Session('a', {'user': 'x'}, EXPIRES)
+    session.save()
+    fetched = mod.Session.fetch('a')
+    assert fetched['user'] == 'x'
+    assert not db.fetchone.called
+
+
+def test_delete_drops_pending(store, db):
+    session = mod.Session('a', {}, EXPIRES)
+    session.save()
+    session.delete()
+    assert mod.Session.flush() == 0
+    db.fetchone.return_value = None
+    with pytest.raises(mod.SessionInvalid):
+        mod.Session.fetch('a')
+
+
+def test_store_evicts_only_clean(store):
+    store.put('a', '{}', EXPIRES, dirty=True)
+    store.put('b', '{}', EXPIRES)
+    store.put('c', '{}', EXPIRES)
+    assert store.get('a') is not None
+    assert store.get('b') is None
+    assert store.get('c') is not None
+
+
+def test_flush_failure_keeps_pending(store, db):
+    store.put('a', '{}', EXPIRES, dirty=True)
+    db.executemany.side_effect = RuntimeError()
+    assert store.flush(db) == 0
+    db.executemany.side_effect = None
+    assert store.flush(db) == 1
+
+
+def test_delete_during_flush(store, db):
+    session = mod.Session('a', {}, EXPIRES)
+    session.save()
+
+    def executemany(query, rows):
+        # the write yields, and the session is deleted meanwhile
+        session.delete()
+
+    db.executemany.side_effect = executemany
+    db.execute.reset_mock()
+    assert store.flush(db) == 1
+    # the session is deleted once more after the write
+    assert db.execute.call_count == 2
+    assert db.execute.call_args[0][1] == (('a',),)
+    db.execute.reset_mock()
+    store.put('b', '{}', EXPIRES, dirty=True)
+    db.executemany.side_effect = None
+    assert store.flush(db) == 1
+    assert not db.execute.called
+
+
+@pytest.fixture
+def anonymous_config():
+    with mock.patch.object(mod, 'request') as request:
+        request.app.config = {'session.lifetime': 3600,
+                              'session.anonymous': True,
+                              'session.cookie_name': 'session',
+                              'session.secret': 'secret'}
+        yield request.app.config
+
+
+def test_anonymous_session_not_stored(anonymous_config, store, db):
+    session = mod.Session.create()
+    assert session.anonymous
+    session['user'] = 'x'
+    session.save()
+    session.delete()
+    assert mod.Session.flush() == 0
+    assert not db.execute.called
+
+
+def test_anonymous_session_cookie_roundtrip(anonymous_config, store):
+    session = mod.Session.create()
+    session['user'] = 'x'
+    restored = mod.Session.from_cookie(session.to_cookie())
+    assert restored.anonymous
+    assert restored.id == session.id
+    assert restored['user'] == 'x'
+    assert abs((restored.expires - session.expires).total_seconds()) < 1
+
+
+def test_anonymous_session_expired_cookie(anonymous_config):
+    session = mod.Session.create()
+    cookie = session.to_cookie()
+    cookie['expires'] -= 7200
+    with pytest.raises(mod.SessionExpired):
+        mod.Session.from_cookie(cookie)
+    with pytest.raises(mod.SessionInvalid):
+        mod.Session.from_cookie({'id': 'a'})
+
+
+@mock.patch.object(mod, 'response')
+def test_anonymous_session_upgraded(response, anonymous_config, store, db):
+    session = mod.Session.create()
+    session['user'] = 'x'
+    session.rotate()
+    assert not session.anonymous
+    assert session.to_cookie() == session.id
+    assert mod.Session.flush() == 1
+
+
+def test_anonymous_session_upgraded_when_too_big(anonymous_config, store,
+                                                 db):
+    session = mod.Session.create()
+    session['data'] = 'x' * mod.Session.COOKIE_LIMIT
+    session.save()
+    assert not session.anonymous
+    assert mod.Session.flush() == 1
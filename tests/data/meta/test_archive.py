@@ -37,7 +37,18 @@ def test_analyze_blocking(_analyze, exts):
     archive = mod.Archive()
     _analyze.return_value = {'path': 'metadata'}
     assert archive.analyze('path') == _analyze.return_value
-    _analyze.assert_called_once_with('path', False)
+    _analyze.assert_called_once_with('path', False, None)
+
+
+@mock.patch.object(mod, 'exts')
+@mock.patch.object(mod.Archive.Processor, 'is_entry_point')
+def test__analyze_detached(is_entry_point, exts):
+    is_entry_point.return_value = True
+    archive = mod.Archive()
+    links = dict()
+    archive._analyze('/path/to/file', True, links)
+    # nothing is announced, so nothing is written into the database
+    assert not exts.events.publish.called
 
 
 @mock.patch.object(mod, 'exts')
@@ -53,7 +64,7 @@ def test_analyze_nonblocking_call(_analyze, exts):
 @mock.patch.object(mod, 'exts')
 @mock.patch.object(mod.Archive, '_analyze')
 def test_analyze_nonblocking_result(_analyze, exts):
-    _analyze.side_effect = lambda x, p: {x: 'meta'}
+    _analyze.side_effect = lambda x, p, l: {x: 'meta'}
     exts.tasks.schedule.side_effect = lambda x: x()
     archive = mod.Archive()
     callback = mock.Mock()
@@ -265,10 +276,30 @@ def test__attach_missing_partial(analyze, exts):
     ret = archive._attach_missing(['path', 'missing'], data, True)
     assert ret == {'path': 'exists', 'missing': 'found'}
     paths = set(['missing'])
-    analyze.assert_has_calls([
-        mock.call(paths, callback=archive.save_many),
-        mock.call(paths, partial=True),
-    ])
+    analyze.assert_called_once_with(paths, partial=True)
+    exts.analysis.schedule.assert_called_once_with(
+        paths,
+        priority=mod.AnalysisScheduler.INTERACTIVE)
+
+
+@mock.patch.object(mod, 'exts')
+@mock.patch.object(mod.Archive, 'save_many')
+@mock.patch.object(mod.Archive, 'analyze')
+def test_process(analyze, save_many, exts):
+    archive = mod.Archive()
+    archive.process(['path1', 'path2'])
+    analyze.assert_called_once_with(['path1', 'path2'])
+    save_many.assert_called_once_with(analyze.return_value)
+
+
+@mock.patch.object(mod, 'exts')
+def test_schedule_analysis_background(exts):
+    archive = mod.Archive()
+    ret = archive.schedule_analysis(['path'])
+    assert ret == exts.analysis.schedule.return_value
+    exts.analysis.schedule.assert_called_once_with(
+        ['path'],
+        priority=mod.AnalysisScheduler.BACKGROUND)
 
 
 @mock.patch.object(mod, 'exts')
@@ -419,6 +450,8 @@ def test_search(exts, populated_database):
 def test_save(exts, databases):
     mocked_cache = mock.Mock()
     mocked_cache.get.return_value = None
+    mocked_cache.get_many.return_value = {}
+    mocked_cache.parse_prefix.return_value = 'fs_0:'
     exts.cache = mocked_cache
     data = {
         'type': mod.FILE_TYPE,
@@ -503,3 +536,118 @@ def test__entry_point_found_worse(get, save, exts):
     archive._entry_point_found('/path/parent/main.html', 'html', html_proc)
     get.assert_called_once_with('/path/parent', ignore_missing=True)
     assert not save.called
+
+
+@mock.patch.object(mod, 'exts')
+@mock.patch.object(mod.Archive, 'ShadowRebuild')
+def test_rebuild(ShadowRebuild, exts):
+    archive = mod.Archive()
+    archive.rebuild()
+    ShadowRebuild.assert_called_once_with(archive,
+                                          db=archive._db,
+                                          fsal=archive._fsal)
+    ShadowRebuild.return_value.run.assert_called_once_with()
+    archive._cache.invalidate.assert_called_once_with(prefix='fs_')
+    # changes made during the rebuild are replayed by it
+    assert not archive._analysis.schedule.called
+
+
+@mock.patch.object(mod, 'exts')
+def test__save_metadata_single_statement(exts):
+    archive = mod.Archive()
+    metadata = {'en': {'title': 'T', 'junk': 1}, '': {'name': 'N'}}
+    cleaned = archive._save_metadata(7, metadata)
+    assert cleaned == {'en': {'title': 'T'}, '': {'name': 'N'}}
+    # one statement for all rows, bumping the revision of the entry once
+    (query, params) = archive._db.execute.call_args[0]
+    assert archive._db.execute.call_count == 1
+    assert query.count('(%s, %s, %s, %s)') == 2
+    assert "UPDATE fs SET rev = nextval('archive_rev_seq')" in query
+    assert sorted([params[i:i + 4] for i in range(0, 8, 4)]) == [
+        [7, '', 'name', 'N'], [7, 'en', 'title', 'T']]
+    assert params[-1] == 7
+
+
+@mock.patch.object(mod, 'exts')
+def test__save_metadata_empty(exts):
+    archive = mod.Archive()
+    assert archive._save_metadata(7, {}) == {}
+    assert not archive._db.execute.called
+
+
+@mock.patch.object(mod, 'exts')
+def test_revision(exts):
+    archive = mod.Archive()
+    archive._db.fetchone.return_value = {'rev': 42}
+    assert archive.revision() == 42
+
+
+@mock.patch.object(mod, 'exts')
+def test_revision_empty(exts):
+    archive = mod.Archive()
+    archive._db.fetchone.return_value = {'rev': None}
+    assert archive.revision() == 0
+
+
+@mock.patch.object(mod, 'exts')
+def test_changes_since(exts):
+    archive = mod.Archive()
+    rows = [{'path': 'a', 'type': 0, 'rev': 5, 'deleted': False},
+            {'path': 'b', 'type': 0, 'rev': 6, 'deleted': True}]
+    archive._db.fetchiter.return_value = iter(rows)
+    assert archive.changes_since(4, limit=2) == rows
+    (query, params) = archive._db.fetchiter.call_args[0]
+    assert params == dict(rev=4, limit=2)
+    assert 'fs_deleted' in query
+
+
+@mock.patch.object(mod, 'exts')
+@mock.patch.object(mod.Archive, 'process')
+@mock.patch.object(mod.Archive, 'remove')
+@mock.patch.object(mod.Archive, 'SnapshotImport')
+def test_import_snapshot(SnapshotImport, remove, process, exts):
+    snapshot = SnapshotImport.return_value
+    snapshot.verify.return_value = (['missing'], ['changed'], ['thumb'])
+    snapshot.stats = {'missing': [], 'changed': [], 'kept': []}
+    archive = mod.Archive()
+    assert archive.import_snapshot('snap.gz') == dict(imported=3,
+                                                     missing=1,
+                                                     changed=1)
+    remove.assert_called_once_with(['missing'])
+    # analysis is not left to greenlets, which don't survive the exit
+    process.assert_called_once_with(['changed'])
+    assert not archive._analysis.schedule.called
+    assert not archive._cache.set_many.called
+
+
+def test_fswriter_get_chain_batches_lookups():
+    cache = mock.Mock()
+    cache.parse_prefix.return_value = 'fs_0:'
+    cache.get_many.return_value = {'fs_0:': dict(id=1, path=''),
+                                   'fs_0:a': dict(id=2, path='a')}
+    db = mock.Mock()
+    db.fetchiter.return_value = [dict(id=3, path='a/b')]
+    data = dict(path='a/b/c', type=mod.FILE_TYPE, mime_type=None,
+                content_types=1)
+    writer = mod.FSWriter(data, db=db, cache=cache)
+    (found, missing) = writer._get_chain()
+    cache.get_many.assert_called_once_with(['fs_0:', 'fs_0:a', 'fs_0:a/b',
+                                            'fs_0:a/b/c'])
+    assert [entry['id'] for entry in found] == [1, 2, 3]
+    assert missing == ['a/b/c']
+    cache.set_many.assert_called_once_with({'fs_0:a/b': dict(id=3,
+                                                             path='a/b')},
+                                           timeout=writer.CACHE_TIMEOUT)
+
+
+def test_fswriter_noop_cache():
+    from librarian.core.contrib.cache.backends import NoOpCache
+    db = mock.Mock()
+    db.fetchiter.return_value = [dict(id=1, path=''), dict(id=2, path='a')]
+    data = dict(path='a/b', type=mod.FILE_TYPE, mime_type=None,
+                content_types=1)
+    writer = mod.FSWriter(data, db=db, cache=NoOpCache())
+    assert writer.key('a') == 'fs_a'
+    (found, missing) = writer._get_chain()
+    assert [entry['id'] for entry in found] == [1, 2]
+    assert missing == ['a/b']
@@ -0,0 +1,144 @@
+import json
+
+import mock
+import pytest
+
+import librarian.data.meta.crawler as mod
+
+
+def fso(path):
+    return mock.Mock(rel_path=path)
+
+
+TREE = {
+    '': (['a', 'b'], ['f1']),
+    'a': ([], ['a/f2', 'a/f3']),
+    'b': (['b/c'], []),
+    'b/c': ([], ['b/c/f4']),
+}
+
+
+def list_dir(path):
+    path = '' if path == '.' else path
+    (dirs, files) = TREE[path]
+    return (True, map(fso, dirs), map(fso, files))
+
+
+@pytest.fixture
+def crawler(tmpdir):
+    fsal = mock.Mock()
+    fsal.list_dir.side_effect = list_dir
+    archive_factory = mock.Mock()
+    archive_factory.return_value.get.return_value = {}
+    return mod.Crawler(archive_factory=archive_factory,
+                       checkpoint_path=str(tmpdir.join('crawler.json')),
+                       fsal=fsal,
+                       state=mock.Mock(),
+                       load=mock.Mock(),
+                       iowait=mock.Mock(),
+                       slice_duration=60,
+                       checkpoint_interval=1,
+                       min_delay=1,
+                       max_delay=8,
+                       idle_delay=100)
+
+
+@mock.patch.object(mod.gevent, 'sleep')
+def test_run_slice_complete(sleep, crawler):
+    archive = crawler._archive_factory.return_value
+    crawler.start()
+    assert crawler.is_active
+    assert crawler.run_slice() is False
+    archive.schedule_analysis.assert_has_calls([mock.call(['f1']),
+                                      mock.call(['a/f2', 'a/f3']),
+                                      mock.call(['b/c/f4'])])
+    progress = crawler.progress()
+    assert progress['status'] == crawler.IDLE
+    assert progress['dirs_done'] == 4
+    assert progress['files_done'] == 4
+    assert progress['pending'] == 0
+    # checkpoint is removed when crawl is finished
+    assert not crawler.is_active
+    assert crawler._state.provider.return_value.set.called
+
+
+@mock.patch.object(mod.gevent, 'sleep')
+def test_run_slice_skips_existing(sleep, crawler):
+    archive = crawler._archive_factory.return_value
+    archive.get.return_value = {'a/f2': 'meta'}
+    crawler.start('a')
+    crawler.run_slice()
+    archive.schedule_analysis.assert_called_once_with(['a/f3'])
+
+
+@mock.patch.object(mod.gevent, 'sleep')
+def test_run_slice_retries_failed(sleep, crawler):
+    archive = crawler._archive_factory.return_value
+    archive.schedule_analysis.side_effect = [None, IOError(), None, None]
+    crawler.start()
+    assert crawler.run_slice() is False
+    # the failed directory is retried after the rest of the frontier
+    assert archive.schedule_analysis.call_args_list == [mock.call(['f1']),
+                                              mock.call(['a/f2', 'a/f3']),
+                                              mock.call(['a/f2', 'a/f3']),
+                                              mock.call(['b/c/f4'])]
+    assert crawler.progress()['dirs_done'] == 4
+    assert crawler._failures == {}
+
+
+@mock.patch.object(mod.gevent, 'sleep')
+def test_run_slice_gives_up(sleep, crawler):
+    archive = crawler._archive_factory.return_value
+    archive.schedule_analysis.side_effect = IOError()
+    crawler.start('a')
+    assert crawler.run_slice() is False
+    assert archive.schedule_analysis.call_count == crawler.MAX_RETRIES + 1
+    assert crawler._failures == {}
+
+
+@mock.patch.object(mod.gevent, 'sleep')
+def test_resume_from_checkpoint(sleep, crawler):
+    crawler.start()
+    # crawl only the root directory
+    crawler._slice_duration = 0
+    crawler._crawl(crawler._frontier.popleft())
+    crawler.checkpoint()
+    with open(crawler._checkpoint_path) as checkpoint_file:
+        data = json.load(checkpoint_file)
+    assert data['frontier'] == ['a', 'b']
+    assert data['dirs_done'] == 1
+    # a new crawler instance picks up where the previous one left off
+    resumed = mod.Crawler(archive_factory=crawler._archive_factory,
+                          checkpoint_path=crawler._checkpoint_path,
+                          fsal=crawler._fsal,
+                          state=mock.Mock(),
+                          slice_duration=60)
+    assert resumed.progress()['pending'] == 2
+    assert resumed.run_slice() is False
+    assert resumed.progress()['dirs_done'] == 4
+
+
+def test_checkpoint_version_mismatch(crawler):
+    with open(crawler._checkpoint_path, 'w') as checkpoint_file:
+        json.dump(dict(version=0, frontier=['a']), checkpoint_file)
+    assert not crawler.is_active
+
+
+def test_stop(crawler):
+    crawler.start()
+    crawler.stop()
+    assert not crawler.is_active
+    crawler._loaded = False
+    assert not crawler.is_active
+
+
+def test_get_delay_adapts(crawler):
+    assert crawler.get_delay() == 100
+    crawler.start()
+    crawler._load.is_busy.return_value = True
+    assert [crawler.get_delay() for _ in range(4)] == [2, 4, 8, 8]
+    crawler._load.is_busy.return_value = False
+    crawler._iowait.sample.return_value = 0.9
+    assert crawler.get_delay() == 8
+    crawler._iowait.sample.return_value = 0
+    assert [crawler.get_delay() for _ in range(4)] == [4, 2, 1, 1]
@@ -180,3 +180,14 @@ def test_for_type_success():
 ])
 def test_is_entry_point(old, new, use):
     assert mod.HtmlProcessor.is_entry_point(new, old) is use
+
+
+@mock.patch.object(mod, 'links')
+@mock.patch.object(mod.Processor, 'process')
+def test_html_process_collects_links(process, links):
+    found = dict()
+    proc = mod.HtmlProcessor('a/index.html', fsal=mock.Mock(), links=found)
+    proc.metadata_extractor = mock.Mock(assets=['b.css', 'a.js', 'b.css'])
+    proc.process()
+    assert found == {'a/index.html': ['a.js', 'b.css']}
+    assert not links.update_links.called
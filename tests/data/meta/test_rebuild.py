@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+import itertools
+
+import mock
+import pytest
+
+import librarian.data.meta.rebuild as mod
+from librarian.data.meta.processors import Processor
+from librarian.data.meta.wrapper import MetaWrapper
+
+
+def fso(path):
+    return mock.Mock(rel_path=path)
+
+
+TREE = {
+    '': (['a', 'b'], []),
+    'a': ([], ['a/index.html', 'a/f.txt']),
+    'b': (['b/c'], []),
+    'b/c': ([], ['b/c/.dirinfo']),
+}
+
+
+def list_dir(path):
+    path = '' if path == '.' else path
+    (dirs, files) = TREE[path]
+    return (True, map(fso, dirs), map(fso, files))
+
+
+def analyze(paths, links):
+    metas = {}
+    for path in paths:
+        if path.endswith('.html'):
+            links[path] = ['a/f.txt']
+        if path.endswith('.dirinfo'):
+            metas['b/c'] = MetaWrapper(dict(path='b/c',
+                                            type=mod.FILE_TYPE,
+                                            mime_type=None,
+                                            content_types=32,
+                                            metadata={'': {'name': 'C'}}))
+        else:
+            metas[path] = MetaWrapper(dict(path=path,
+                                           type=mod.FILE_TYPE,
+                                           mime_type='text/plain',
+                                           content_types=3,
+                                           metadata={'': {'title': 'T',
+                                                          'junk': 1}}))
+    return metas
+
+
+@pytest.fixture
+def rebuild():
+    archive = mock.Mock()
+    archive.Processor = Processor
+    archive.analyze.side_effect = analyze
+    db = mock.Mock()
+    counter = itertools.count(1)
+    db.fetchall.side_effect = lambda q, p: [dict(id=next(counter))
+                                            for _ in range(p[1])]
+    fsal = mock.Mock()
+    fsal.list_dir.side_effect = list_dir
+    rebuild = mod.ShadowRebuild(archive, db=db, fsal=fsal)
+    rebuild._sequence = 'fs_id_seq'
+    return rebuild
+
+
+@mock.patch.object(mod.ShadowRebuild, '_insert')
+@mock.patch.object(mod.gevent, 'sleep')
+def test__ingest(sleep, _insert, rebuild):
+    rebuild._ingest()
+    copied = dict()
+    for ((table, columns, rows), _) in _insert.call_args_list:
+        copied.setdefault(table, []).extend(list(rows))
+    fs = dict((row[2], row) for row in copied['fs_shadow'])
+    # directories without files are not stored
+    assert sorted(fs.keys()) == ['', 'a', 'a/f.txt', 'a/index.html', 'b',
+                                 'b/c']
+    # parents are linked through their ids
+    assert fs[''][1] == 0
+    assert fs['a'][1] == fs[''][0]
+    assert fs['a/index.html'][1] == fs['a'][0]
+    assert fs['b/c'][1] == fs['b'][0]
+    # content types of files are propagated to their direct parent only
+    assert fs['a'][5] == 3
+    assert fs[''][5] == 1
+    # redirected metadata is stored on the directory
+    assert fs['b/c'][3] == mod.DIRECTORY_TYPE
+    assert fs['b/c'][5] == 33
+    meta = copied['meta_shadow']
+    assert (fs['b/c'][0], '', 'name', 'C') in meta
+    assert (fs['a/f.txt'][0], '', 'title', 'T') in meta
+    # unknown keys are dropped
+    assert not [row for row in meta if row[2] == 'junk']
+    # entry point is elected on the parent
+    assert (fs['a'][0], '__auto__', 'main', 'index.html') in meta
+    # links are collected instead of being written into the live table
+    assert copied['links_shadow'] == [('a/index.html', 'a/f.txt')]
+    assert all(isinstance(c[1]['links'], dict)
+               for c in rebuild._archive.analyze.call_args_list)
+
+
+def test__next_id_reserves_blocks(rebuild):
+    rebuild.ID_BLOCK_SIZE = 2
+    assert [rebuild._next_id() for _ in range(3)] == [1, 2, 3]
+    assert rebuild._db.fetchall.call_count == 2
+
+
+def test__insert(rebuild):
+    rebuild.INSERT_BATCH_SIZE = 2
+    rows = iter([(1, u'a'), (2, None), (3, u'š')])
+    rebuild._insert('fs_shadow', ('id', 'path'), rows)
+    calls = rebuild._db.execute.call_args_list
+    assert calls == [
+        mock.call('INSERT INTO fs_shadow (id, path) VALUES (%s, %s), '
+                  '(%s, %s)', [1, u'a', 2, None]),
+        mock.call('INSERT INTO fs_shadow (id, path) VALUES (%s, %s)',
+                  [3, u'š']),
+    ]
+
+
+def test__insert_empty(rebuild):
+    rebuild._insert('fs_shadow', ('id', 'path'), [])
+    assert not rebuild._db.execute.called
+
+
+def test__shadow_definition(rebuild):
+    fk = 'FOREIGN KEY (fs_id) REFERENCES fs(id)'
+    assert (rebuild._shadow_definition(fk) ==
+            'FOREIGN KEY (fs_id) REFERENCES fs_shadow(id)')
+    other = 'FOREIGN KEY (x) REFERENCES other(id)'
+    assert rebuild._shadow_definition(other) == other
+
+
+def test__index(rebuild):
+    cursor = mock.Mock()
+    results = {
+        'fs': ([dict(definition='PRIMARY KEY (id)')],
+               [dict(definition='CREATE UNIQUE INDEX fs_path_idx ON '
+                                'public.fs USING btree (path)')]),
+        'meta': ([dict(definition='FOREIGN KEY (fs_id) REFERENCES fs(id)')],
+                 []),
+        'links': ([],
+                  [dict(definition='CREATE INDEX target_index ON links '
+                                   'USING btree (target)')]),
+    }
+    fetched = []
+    for table in rebuild.TABLES:
+        fetched.extend(results[table])
+    cursor.fetchall.side_effect = fetched
+    rebuild._index(cursor)
+    executed = [c[0][0] for c in cursor.execute.call_args_list]
+    assert 'ALTER TABLE fs_shadow ADD PRIMARY KEY (id)' in executed
+    assert ('CREATE UNIQUE INDEX ON fs_shadow USING btree (path)'
+            in executed)
+    assert ('ALTER TABLE meta_shadow ADD FOREIGN KEY (fs_id) '
+            'REFERENCES fs_shadow(id)' in executed)
+    assert 'CREATE INDEX ON links_shadow USING btree (target)' in executed
+    # triggers would fire for the replayed changes
+    assert not [sql for sql in executed if 'TRIGGER' in sql]
+
+
+def test__prepare(rebuild):
+    cursor = mock.Mock()
+    cursor.fetchone.side_effect = [dict(name='fs_id_seq'), dict(rev=42)]
+    rebuild._prepare(cursor)
+    executed = [c[0][0] for c in cursor.execute.call_args_list]
+    # writes in progress are waited for before the revision is taken
+    assert executed[0] == 'LOCK TABLE fs, meta IN SHARE MODE'
+    assert rebuild._sequence == 'fs_id_seq'
+    assert rebuild._start_rev == 42
+
+
+def test__replay(rebuild):
+    rebuild._start_rev = 42
+    cursor = mock.Mock()
+    rebuild._replay(cursor)
+    calls = cursor.execute.call_args_list
+    assert all(c[0][1] == dict(rev=42) for c in calls)
+    executed = [c[0][0] for c in calls]
+    # dependent rows are removed before the entries they belong to
+    fs_delete = [sql for sql in executed
+                 if sql.startswith('DELETE FROM fs_shadow')]
+    assert len(fs_delete) == 1
+    assert 'fs_deleted' in fs_delete[0]
+    for sql in executed[:executed.index(fs_delete[0])]:
+        assert sql.startswith(('DELETE FROM meta_shadow',
+                               'DELETE FROM links_shadow'))
+    # changed and added entries are copied over with their metadata and links
+    (update, insert_fs, insert_meta, insert_links) = executed[-4:]
+    assert update.startswith('UPDATE fs_shadow')
+    assert insert_fs.startswith('INSERT INTO fs_shadow (id, parent_id, path')
+    assert insert_meta.startswith('INSERT INTO meta_shadow')
+    assert insert_links.startswith('INSERT INTO links_shadow')
+
+
+@mock.patch.object(mod.ShadowRebuild, '_replay')
+def test__swap(_replay, rebuild):
+    cursor = mock.Mock()
+    triggers = dict(
+        fs=[dict(definition='CREATE TRIGGER fs_stamp_rev BEFORE UPDATE '
+                            'ON public.fs FOR EACH ROW WHEN ((old.rev = '
+                            'new.rev)) EXECUTE PROCEDURE fs_stamp_rev()')],
+        meta=[],
+        links=[])
+    cursor.fetchall.side_effect = [triggers[t] for t in rebuild.TABLES]
+    cursor.fetchone.side_effect = [dict(name='fs_id_seq'),
+                                   dict(name='meta_id_seq')]
+    _replay.side_effect = lambda c: c.execute('REPLAY')
+    assert rebuild._swap(cursor) is None
+    executed = [c[0][0] for c in cursor.execute.call_args_list]
+    assert executed[0].startswith('LOCK TABLE')
+    # triggers are recreated after the changes are replayed
+    trigger = ('CREATE TRIGGER fs_stamp_rev BEFORE UPDATE ON fs_shadow FOR '
+               'EACH ROW WHEN ((old.rev = new.rev)) EXECUTE PROCEDURE '
+               'fs_stamp_rev()')
+    assert executed.index('REPLAY') < executed.index(trigger)
+    renames = [sql for sql in executed if 'RENAME' in sql]
+    assert renames == ['ALTER TABLE fs RENAME TO fs_old',
+                       'ALTER TABLE fs_shadow RENAME TO fs',
+                       'ALTER TABLE meta RENAME TO meta_old',
+                       'ALTER TABLE meta_shadow RENAME TO meta',
+                       'ALTER TABLE links RENAME TO links_old',
+                       'ALTER TABLE links_shadow RENAME TO links']
+    # sequences are moved before the old tables are dropped
+    owned = executed.index('ALTER SEQUENCE fs_id_seq OWNED BY fs.id')
+    assert owned < executed.index('DROP TABLE fs_old')
+    assert 'ALTER SEQUENCE meta_id_seq OWNED BY meta.id' in executed
+    assert (executed.index('DROP TABLE meta_old') <
+            executed.index('DROP TABLE fs_old'))
+    # entries missing from the rebuilt archive are recorded as deleted
+    tombstones = [sql for sql in executed if 'fs_deleted' in sql]
+    assert len(tombstones) == 1
+    assert executed.index('REPLAY') < executed.index(tombstones[0])
+    assert executed.index(tombstones[0]) < executed.index(trigger)
+    assert executed.index(trigger) < executed.index(renames[0])
@@ -0,0 +1,77 @@
+import mock
+import pytest
+
+import librarian.data.meta.scheduler as mod
+
+
+@pytest.fixture
+def scheduler():
+    with mock.patch.object(mod.gevent, 'spawn'):
+        sched = mod.AnalysisScheduler(archive_factory=mock.Mock(),
+                                      batch_size=2,
+                                      delay=0)
+        yield sched
+
+
+def test_schedule_dedupe(scheduler):
+    assert scheduler.schedule(['a', 'b']) == 2
+    assert scheduler.schedule(['a', 'b', 'c']) == 1
+    assert scheduler.pending() == 3
+    assert scheduler.pending(scheduler.BACKGROUND) == 3
+    mod.gevent.spawn.assert_called_once_with(scheduler._consume)
+
+
+def test_schedule_invalid_priority(scheduler):
+    with pytest.raises(ValueError):
+        scheduler.schedule(['a'], priority=42)
+
+
+def test_schedule_promotes(scheduler):
+    scheduler.schedule(['a', 'b', 'c'])
+    assert scheduler.schedule(['c'], priority=scheduler.INTERACTIVE) == 1
+    assert scheduler.pending(scheduler.INTERACTIVE) == 1
+    assert scheduler.pending(scheduler.BACKGROUND) == 2
+    # demotion is not possible
+    assert scheduler.schedule(['c']) == 0
+    assert scheduler.pending(scheduler.INTERACTIVE) == 1
+
+
+def test_next_batch_order(scheduler):
+    scheduler.schedule(['a', 'b', 'c'])
+    scheduler.schedule(['d', 'c'], priority=scheduler.INTERACTIVE)
+    assert scheduler._next_batch() == (scheduler.INTERACTIVE, ['d', 'c'])
+    assert scheduler._next_batch() == (scheduler.BACKGROUND, ['a', 'b'])
+    assert scheduler._next_batch() == (None, [])
+    assert scheduler.pending() == 0
+
+
+def test_processing_not_rescheduled(scheduler):
+    scheduler._processing.add('a')
+    assert scheduler.schedule(['a']) == 0
+    assert scheduler.is_scheduled('a')
+
+
+@mock.patch.object(mod.gevent, 'sleep')
+def test_consume(sleep, scheduler):
+    archive = scheduler._archive_factory.return_value
+    scheduler.schedule(['a', 'b', 'c'])
+    scheduler.schedule(['c'], priority=scheduler.INTERACTIVE)
+    scheduler._consume()
+    scheduler._archive_factory.assert_called_once_with()
+    archive.process.assert_has_calls([mock.call(['c']),
+                                      mock.call(['a', 'b'])])
+    assert scheduler.stats() == dict(interactive=0,
+                                     background=0,
+                                     processing=0,
+                                     processed=3)
+    assert scheduler._greenlet is None
+
+
+@mock.patch.object(mod.gevent, 'sleep')
+def test_consume_failure(sleep, scheduler):
+    archive = scheduler._archive_factory.return_value
+    archive.process.side_effect = [Exception(), None]
+    scheduler.schedule(['a', 'b', 'c'])
+    scheduler._consume()
+    assert archive.process.call_count == 2
+    assert not scheduler.is_scheduled('a')
@@ -0,0 +1,103 @@
+import gzip
+import itertools
+import json
+
+import mock
+import pytest
+
+import librarian.data.meta.snapshot as mod
+
+
+FS_ROWS = [
+    dict(id=1, parent_id=0, path='', type=1, mime_type=None,
+         content_types=1),
+    dict(id=2, parent_id=1, path='a.jpg', type=0, mime_type='image/jpeg',
+         content_types=17),
+    dict(id=3, parent_id=1, path='b.txt', type=0, mime_type='text/plain',
+         content_types=1),
+]
+META_ROWS = [dict(fs_id=2, language='', key='width', value='10')]
+LINKS_ROWS = [dict(source='b.txt', target='a.jpg')]
+
+
+@pytest.fixture
+def root(tmpdir):
+    tmpdir.join('a.jpg').write('image')
+    tmpdir.join('b.txt').write('text')
+    tmpdir.mkdir('.thumbs').join('a.jpg').write('thumb')
+    return tmpdir
+
+
+@pytest.fixture
+def fsal(root):
+    fsal = mock.Mock()
+    fsal.list_base_paths.return_value = (True, [str(root)])
+    return fsal
+
+
+@pytest.fixture
+def snapshot_path(tmpdir, fsal):
+    db = mock.Mock()
+    db.fetchiter.side_effect = [iter(FS_ROWS), iter(META_ROWS),
+                                iter(LINKS_ROWS)]
+    config = {'thumbs.dirname': '.thumbs', 'thumbs.extension': 'jpg'}
+    path = str(tmpdir.join('snapshot.gz'))
+    with mock.patch.object(mod.gevent, 'sleep'):
+        counts = mod.SnapshotExport(db, fsal, config).run(path)
+    assert counts == dict(fs=3, meta=1, links=1, thumb=1)
+    return path
+
+
+@pytest.fixture
+def importer(snapshot_path, fsal):
+    db = mock.Mock()
+    ids = itertools.count(100)
+    db.fetchall.side_effect = lambda q, p: [dict(id=next(ids))
+                                            for _ in range(p[1])]
+    importer = mod.SnapshotImport(mock.Mock(), db=db, fsal=fsal,
+                                  path=snapshot_path)
+    importer._sequence = 'fs_id_seq'
+    return importer
+
+
+@mock.patch.object(mod.SnapshotImport, '_insert')
+@mock.patch.object(mod.gevent, 'sleep')
+def test_import(sleep, _insert, importer):
+    importer._ingest()
+    copied = dict((c[0][0], list(c[0][2])) for c in _insert.call_args_list)
+    fs = dict((row[2], row) for row in copied['fs_shadow'])
+    # ids are reassigned, but relations are kept
+    assert fs[''][0] == 100
+    assert fs['a.jpg'][1] == fs[''][0]
+    assert copied['meta_shadow'] == [(fs['a.jpg'][0], '', 'width', '10')]
+    assert copied['links_shadow'] == [('b.txt', 'a.jpg')]
+    assert sorted(importer.stats.keys()) == ['a.jpg', 'b.txt']
+    assert importer.thumbs == ['.thumbs/a.jpg']
+
+
+@mock.patch.object(mod.SnapshotImport, '_insert')
+@mock.patch.object(mod.gevent, 'sleep')
+def test_verify(sleep, _insert, importer, root):
+    importer._ingest()
+    root.join('a.jpg').write('changed image')
+    root.join('b.txt').remove()
+    assert importer.verify() == (['b.txt'], ['a.jpg'], ['.thumbs/a.jpg'])
+
+
+@mock.patch.object(mod.SnapshotImport, '_insert')
+def test_import_truncated(_insert, importer, snapshot_path):
+    with gzip.open(snapshot_path, 'rb') as snapshot_file:
+        lines = snapshot_file.readlines()
+    with gzip.open(snapshot_path, 'wb') as snapshot_file:
+        snapshot_file.writelines(lines[:-1])
+    with pytest.raises(mod.SnapshotError):
+        importer._ingest()
+
+
+@mock.patch.object(mod.SnapshotImport, '_insert')
+def test_import_wrong_version(_insert, importer, snapshot_path):
+    with gzip.open(snapshot_path, 'wb') as snapshot_file:
+        snapshot_file.write(json.dumps(dict(format=mod.FORMAT,
+                                            version=mod.VERSION + 1)))
+    with pytest.raises(mod.SnapshotError):
+        importer._ingest()
@@ -1,3 +1,4 @@
+import gevent
 import mock
 import pytest
 
@@ -10,6 +11,10 @@ def container():
                               events=mock.Mock())
 
 
+def version(container, seq):
+    return '{}-{}'.format(container._id, seq)
+
+
 def test___get_key(container):
     exp = 'state-{}-testprov'.format(container._id)
     assert container._StateContainer__get_key('testprov') == exp
@@ -30,7 +35,8 @@ def test___get_default_value(container):
 def test___set(container):
     testprov = mock.Mock()
     container._registry['testprov'] = testprov
-    assert not container._changed
+    assert container.version == version(container, 0)
+    changed = container._changed
     container._StateContainer__set('testprov', 'testkey', 42, timeout=5)
 
     container._cache.set.assert_called_once_with('testkey', 42, timeout=5)
@@ -38,7 +44,12 @@ def test___set(container):
         container.STATE_CHANGED_EVENT,
         provider=testprov
     )
-    assert list(container._changed) == ['testprov']
+    assert container.version == version(container, 1)
+    assert container.fetch_changes(version(container, 0)) == (
+        version(container, 1), ['testprov'])
+    # waiting clients are woken up
+    assert changed.is_set()
+    assert not container._changed.is_set()
 
 
 def test___onchange(container):
@@ -81,11 +92,85 @@ def test_register_success(container):
 
 
 def test_fetch_changes(container):
-    prov1 = mock.Mock()
-    prov2 = mock.Mock()
-    prov3 = mock.Mock()
-    container._registry.update(prov1=prov1, prov2=prov2, prov3=prov3)
-    container._changed.add('prov1')
-    container._changed.add('prov3')
-    assert container.fetch_changes() == {'prov1': prov1, 'prov3': prov3}
-    assert not container._changed
+    container._registry.update(prov1=mock.Mock(), prov2=mock.Mock(),
+                               prov3=mock.Mock())
+    container._seq = 5
+    container._versions.update(prov1=3, prov2=5, prov3=4)
+    assert container.fetch_changes(version(container, 5)) == (
+        version(container, 5), [])
+    changed = container.fetch_changes(version(container, 3))[1]
+    assert sorted(changed) == ['prov2', 'prov3']
+    # missing, invalid and future versions, and versions handed out by
+    # another container get everything
+    everything = ['prov1', 'prov2', 'prov3']
+    for since in (None, 'x', version(container, 9), 'other-3'):
+        assert sorted(container.fetch_changes(since)[1]) == everything
+
+
+def test_wait_for_changes_returns_early(container):
+    container._registry.update(prov1=mock.Mock())
+    container._seq = 2
+    container._versions.update(prov1=2)
+    with mock.patch.object(container, '_changed') as changed:
+        assert container.wait_for_changes(version(container, 1),
+                                          timeout=5) == (
+            version(container, 2), ['prov1'])
+    assert not changed.wait.called
+
+
+def test_wait_for_changes_woken(container):
+    container._registry.update(prov1=mock.Mock())
+    waiter = gevent.spawn(container.wait_for_changes, version(container, 0),
+                          timeout=5)
+    gevent.sleep(0)
+    assert not waiter.ready()
+    container._StateContainer__set('prov1', 'key', 42, timeout=5)
+    assert waiter.get(timeout=1) == (version(container, 1), ['prov1'])
+
+
+def test_wait_for_changes_timeout(container):
+    assert container.wait_for_changes(version(container, 0),
+                                      timeout=0.01) == (
+        version(container, 0), [])
+
+
+def test_has_clients(container):
+    assert not container.has_clients(30)
+    container.fetch_changes()
+    assert container.has_clients(30)
+    container._last_fetch -= 60
+    assert not container.has_clients(30)
+
+
+def test_has_clients_waiting(container):
+    container._registry['prov1'] = mock.Mock()
+    waiter = gevent.spawn(container.wait_for_changes, version(container, 0),
+                          timeout=5)
+    gevent.sleep(0)
+    assert container._waiting == 1
+    assert container.has_clients(0)
+    container._StateContainer__set('prov1', 'key', 42, timeout=5)
+    waiter.get(timeout=1)
+    assert container._waiting == 0
+
+
+def test_get_many(container):
+    from librarian.data.state.provider import StateProvider
+
+    class Prov1(StateProvider):
+        name = 'prov1'
+
+    class Prov2(StateProvider):
+        name = 'prov2'
+        default_value = 42
+
+    container.register(Prov1)
+    container.register(Prov2)
+    key1 = container._StateContainer__get_key('prov1')
+    container._cache.get_many.return_value = {key1: 'data'}
+    assert container.get_many(['prov1', 'prov2']) == {'prov1': 'data',
+                                                      'prov2': 42}
+    assert not container._cache.get.called
+    # prefetched data is not kept around for later reads
+    container._cache.get.return_value = 'fresh'
+    assert container.prov1 == 'fresh'
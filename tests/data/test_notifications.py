@@ -46,6 +46,22 @@ class TestNotification(object):
         calc_expiry.assert_called_once_with(15)
         save.assert_called_once_with()
 
+    @mock.patch.object(mod.NotificationCounts, 'increment')
+    @mock.patch.object(mod.NotificationTarget, 'create')
+    @mock.patch.object(mod.Notification, 'save')
+    @mock.patch.object(mod.Notification, 'generate_unique_id')
+    def test_send_shared_counted(self, generate_unique_id, save, create,
+                                 increment):
+        generate_unique_id.return_value = 'unique id'
+        db = mock.Mock()
+        mod.Notification.send('msg', group='guest', db=db)
+        assert increment.call_args_list == [
+            mock.call('group', 'guest', db=db),
+            mock.call('notification', 'unique id', db=db)]
+        increment.reset_mock()
+        mod.Notification.send('msg', group='guest', dismissable=False, db=db)
+        increment.assert_called_once_with('group', 'guest', db=db)
+
     @mock.patch.object(mod, 'datetime')
     @mock.patch.object(mod.Notification, 'save')
     @mock.patch.object(mod.Notification, 'calc_expiry')
@@ -119,16 +135,19 @@ class TestNotification(object):
                                         db=mock.Mock())
         assert notification.read_at == 'now'
 
+    @mock.patch.object(mod, 'SharedReadState')
     @mock.patch.object(mod, 'request')
     @mock.patch.object(mod.Notification, 'is_shared')
-    def test_read_at_shared(self, is_shared, request):
+    def test_read_at_shared(self, is_shared, request, SharedReadState):
         is_shared.__get__ = mock.Mock(return_value=True)
-        request.user.options.get.return_value = {'unique_id': 'sometime'}
+        SharedReadState.return_value.get.return_value = 'sometime'
         notification = mod.Notification('unique_id',
                                         'msg',
                                         'today',
                                         db=mock.Mock())
         assert notification.read_at == 'sometime'
+        SharedReadState.assert_called_once_with(request.user.options)
+        SharedReadState.return_value.get.assert_called_once_with(notification)
 
     @mock.patch.object(mod.Notification, 'read_at')
     def test_is_read_true(self, read_at):
@@ -148,35 +167,41 @@ class TestNotification(object):
                                         db=mock.Mock())
         assert not notification.is_read
 
+    @mock.patch.object(mod.NotificationCounts, 'mark')
+    @mock.patch.object(mod, 'SharedReadState')
     @mock.patch.object(mod, 'request')
-    def test__mark_shared_read_creates(self, request):
-        request.user.options = {}
-        notification = mod.Notification('unique_id',
-                                        'msg',
-                                        'today',
-                                        db=mock.Mock())
-        notification._mark_shared_read('now')
-        assert request.user.options == {'notifications': {'unique_id': 'now'}}
-
+    def test_mark_all_read_shared(self, request, SharedReadState, mark):
+        db = mock.Mock()
+        notification = mod.Notification('unique_id', 'msg', 'today', db=db)
+        state = SharedReadState.return_value
+        state.watermark = 'today'
+        mod.Notification.mark_all_read([notification], 'now')
+        state.mark_all.assert_called_once_with([notification], 'now')
+        # covered notifications are counted once per watermark
+        mark.assert_called_once_with('today', db=db)
+
+    @mock.patch.object(mod, 'SharedReadState')
     @mock.patch.object(mod, 'request')
-    def test__mark_shared_read_updates(self, request):
-        request.user.options = {'notifications': {'previous': 'yesterday'}}
+    def test__mark_shared_read(self, request, SharedReadState):
         notification = mod.Notification('unique_id',
                                         'msg',
                                         'today',
                                         db=mock.Mock())
         notification._mark_shared_read('now')
-        expected = {'notifications': {'previous': 'yesterday',
-                                      'unique_id': 'now'}}
-        assert request.user.options == expected
+        SharedReadState.assert_called_once_with(request.user.options)
+        SharedReadState.return_value.mark.assert_called_once_with(
+            notification, 'now')
 
+    @mock.patch.object(mod.NotificationCounts, 'increment')
     @mock.patch.object(mod, 'request')
-    def test__mark_private_read(self, request):
+    def test__mark_private_read(self, request, increment):
         db = mock.Mock()
-        notification = mod.Notification('unique_id', 'msg', 'today', db=db)
+        notification = mod.Notification('unique_id', 'msg', 'today',
+                                        username='user', db=db)
         notification._mark_private_read('now')
         data = dict(notification_id='unique_id', read_at='now')
         db.execute.assert_called_once_with(db.Update.return_value, data)
+        increment.assert_called_once_with('user', 'user', -1, db=db)
 
     @mock.patch.object(mod.Notification, '_mark_private_read')
     @mock.patch.object(mod.Notification, '_mark_shared_read')
@@ -251,20 +276,23 @@ class TestNotification(object):
                     icon=None)
         db.execute.assert_called_once_with(db.Replace.return_value, data)
 
-    def test_delete(self):
+    @mock.patch.object(mod.NotificationCounts, 'delete')
+    def test_delete(self, delete):
         db = mock.Mock()
-        transaction = mock.Mock()
-        ctx_manager = mock.MagicMock()
-        ctx_manager.__enter__.return_value = transaction
-        db.transaction.return_value = ctx_manager
         notification = mod.Notification('unique_id', 'msg', 'today', db=db)
         notification.delete()
-        transaction.execute.assert_has_calls([
-            mock.call(db.Delete.return_value.serialize.return_value,
-                      ('unique_id',)),
-            mock.call(db.Delete.return_value.serialize.return_value,
-                      ('unique_id',))
-        ])
+        delete.assert_called_once_with(
+            'n.notification_id = %(notification_id)s',
+            dict(notification_id='unique_id'),
+            db=db)
+
+    @mock.patch.object(mod.NotificationCounts, 'delete')
+    def test_delete_many(self, delete):
+        db = mock.Mock()
+        mod.Notification.delete_many(['a', 'b'], db)
+        delete.assert_called_once_with('n.notification_id IN %(ids)s',
+                                       dict(ids=('a', 'b')),
+                                       db=db)
 
     def test_generate_unique_id(self):
         uid = mod.Notification.generate_unique_id()
@@ -276,6 +304,202 @@ class TestNotification(object):
         assert isinstance(mod.Notification.calc_expiry(10), datetime.datetime)
 
 
+class TestEnsureRetract(object):
+
+    def notification(self, **kwargs):
+        params = dict(notification_id='existing',
+                      message='low space',
+                      created_at='today',
+                      category='diskspace',
+                      dismissable=False,
+                      priority=mod.Notification.URGENT,
+                      db=mock.Mock())
+        params.update(kwargs)
+        return mod.Notification(**params)
+
+    @mock.patch.object(mod.Notification, 'send')
+    @mock.patch.object(mod.Notification, 'delete_many')
+    @mock.patch.object(mod.Notification, 'find')
+    def test_ensure_unchanged(self, find, delete_many, send):
+        existing = self.notification()
+        find.return_value = [existing]
+        db = mock.Mock()
+        ret = mod.Notification.ensure('diskspace', 'guest', 'low space',
+                                      priority=mod.Notification.URGENT,
+                                      dismissable=False, db=db)
+        assert ret is existing
+        find.assert_called_once_with('diskspace', 'guest', db=db)
+        assert not delete_many.called
+        assert not send.called
+
+    @mock.patch.object(mod.Notification, 'send')
+    @mock.patch.object(mod.Notification, 'delete_many')
+    @mock.patch.object(mod.Notification, 'find')
+    def test_ensure_changed(self, find, delete_many, send):
+        find.return_value = [self.notification()]
+        db = mock.Mock()
+        ret = mod.Notification.ensure('diskspace', 'guest', 'no space',
+                                      priority=mod.Notification.URGENT,
+                                      dismissable=False, db=db)
+        assert ret is send.return_value
+        delete_many.assert_called_once_with(['existing'], db)
+        send.assert_called_once_with('no space',
+                                     category='diskspace',
+                                     icon=None,
+                                     priority=mod.Notification.URGENT,
+                                     expiration=0,
+                                     dismissable=False,
+                                     groupable=True,
+                                     group='guest',
+                                     db=db)
+
+    @mock.patch.object(mod.Notification, 'send')
+    @mock.patch.object(mod.Notification, 'delete_many')
+    @mock.patch.object(mod.Notification, 'find')
+    def test_ensure_missing(self, find, delete_many, send):
+        find.return_value = []
+        mod.Notification.ensure('diskspace', 'guest', 'low space',
+                                db=mock.Mock())
+        assert not delete_many.called
+        assert send.called
+
+    @mock.patch.object(mod.Notification, 'delete_many')
+    @mock.patch.object(mod.Notification, 'find')
+    def test_retract_nothing(self, find, delete_many):
+        find.return_value = []
+        callback = mock.Mock()
+        with mock.patch.object(mod.Notification, 'on_retract_callbacks',
+                               [callback]):
+            assert not mod.Notification.retract('diskspace', db=mock.Mock())
+        assert not delete_many.called
+        assert not callback.called
+
+    @mock.patch.object(mod.Notification, 'delete_many')
+    @mock.patch.object(mod.Notification, 'find')
+    def test_retract(self, find, delete_many):
+        find.return_value = [self.notification()]
+        callback = mock.Mock()
+        db = mock.Mock()
+        with mock.patch.object(mod.Notification, 'on_retract_callbacks',
+                               [callback]):
+            assert mod.Notification.retract('diskspace', db=db)
+        delete_many.assert_called_once_with(['existing'], db)
+        callback.assert_called_once_with('diskspace')
+
+
+class TestNotificationCounts(object):
+
+    def test_get(self):
+        db = mock.Mock()
+        db.fetchiter.return_value = [
+            dict(target_type='user', count=2),
+            dict(target_type='group', count=3),
+            dict(target_type='group', count=1),
+            dict(target_type='notification', count=1),
+            dict(target_type='mark', count=2),
+        ]
+        assert mod.NotificationCounts.get('me', ['guest', 'all'],
+                                          watermark='then',
+                                          read=['a', 'b'],
+                                          db=db) == (2, 4, 3)
+        db.fetchiter.assert_called_once_with(
+            mod.NotificationCounts.LOOKUP_QUERY,
+            dict(username='me',
+                 groups=('guest', 'all'),
+                 watermark='then',
+                 read=['a', 'b']))
+
+    def test_mark(self):
+        db = mock.Mock()
+        mod.NotificationCounts.mark('then', db=db)
+        db.execute.assert_called_once_with(
+            mod.NotificationCounts.MARK_QUERY, dict(boundary='then'))
+
+    def test_delete(self):
+        db = mock.Mock()
+        db.fetchone.return_value = dict(count=2)
+        params = dict(category='diskspace')
+        assert mod.NotificationCounts.delete('n.category = %(category)s',
+                                             params,
+                                             db=db) == 2
+        (query, passed) = db.fetchone.call_args[0]
+        assert passed is params
+        # notifications and their targets are deleted with the same condition
+        assert query.count('n.category = %(category)s') == 2
+        # counts are decremented by what was actually deleted
+        assert 'RETURNING' in query
+        assert 'UPDATE notification_counts' in query
+        assert 'UPDATE notification_marks' in query
+
+
+class TestSharedReadState(object):
+
+    NOW = datetime.datetime(2016, 6, 1, 12)
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        with mock.patch.object(mod, 'exts') as exts:
+            exts.config = {'notifications.default_expiry': 3600}
+            with mock.patch.object(mod, 'utcnow', return_value=self.NOW):
+                yield
+
+    def notification(self, notification_id, minutes_ago, **kwargs):
+        created_at = self.NOW - datetime.timedelta(minutes=minutes_ago)
+        return mod.Notification(notification_id, 'msg', created_at,
+                                db=mock.Mock(), **kwargs)
+
+    def test_mark(self):
+        options = {}
+        notification = self.notification('a', 10)
+        mod.SharedReadState(options).mark(notification, self.NOW)
+        state = mod.SharedReadState(options)
+        assert state.get(notification) == self.NOW
+        assert state.get(self.notification('b', 5)) is None
+
+    def test_mark_prunes_expired(self):
+        options = {}
+        mod.SharedReadState(options).mark(self.notification('a', 130),
+                                          self.NOW)
+        mod.SharedReadState(options).mark(self.notification('b', 10),
+                                          self.NOW)
+        assert list(options['notifications_read']['read']) == ['b']
+
+    def test_mark_all(self):
+        options = {}
+        old = self.notification('a', 20)
+        newest = self.notification('b', 10)
+        fixed = self.notification('c', 15, dismissable=False)
+        mod.SharedReadState(options).mark(newest, self.NOW)
+        mod.SharedReadState(options).mark_all([old, newest], self.NOW)
+        state = mod.SharedReadState(options)
+        assert state.watermark == newest.created_at
+        # exceptions covered by the watermark are pruned
+        assert state.read == {}
+        assert 'covered' not in options['notifications_read']
+        assert state.get(old) == newest.created_at
+        assert state.get(fixed) is None
+        assert state.get(self.notification('d', 5)) is None
+
+    def test_legacy_converted(self):
+        read_at = self.NOW - datetime.timedelta(minutes=5)
+        options = {'notifications': {'a': read_at}}
+        state = mod.SharedReadState(options)
+        assert state.get(self.notification('a', 10)) == read_at
+        state.mark(self.notification('b', 10), self.NOW)
+        assert 'notifications' not in options
+        assert sorted(options['notifications_read']['read']) == ['a', 'b']
+
+    def test_covered_ignored(self):
+        # read states stored with the ids of covered notifications
+        watermark = self.NOW - datetime.timedelta(minutes=10)
+        options = {'notifications_read': {'watermark': watermark,
+                                          'covered': {'a': self.NOW},
+                                          'read': {}}}
+        state = mod.SharedReadState(options)
+        state.mark(self.notification('b', 5), self.NOW)
+        assert sorted(options['notifications_read']) == ['read', 'watermark']
+
+
 class TestNotificationGroup(object):
 
     @mock.patch.object(mod, 'request')
@@ -0,0 +1,39 @@
+import mock
+import pytest
+
+import librarian.routes.cache as mod
+
+
+@pytest.fixture
+def route():
+    with mock.patch.object(mod.CacheStats, 'request') as request:
+        request.no_auth = True
+        with mock.patch('librarian.decorators.auth.request', request):
+            yield mod.CacheStats()
+
+
+@mock.patch.object(mod, 'get_stats')
+@mock.patch.object(mod, 'exts')
+def test_get(exts, get_stats, route):
+    assert route.get() == get_stats.return_value
+    get_stats.assert_called_once_with(exts.cache)
+
+
+@mock.patch.object(mod, 'get_stats')
+@mock.patch.object(mod, 'reset_stats')
+@mock.patch.object(mod, 'exts')
+def test_post_xhr(exts, reset_stats, get_stats, route):
+    route.request.is_xhr = True
+    assert route.post() == get_stats.return_value
+    reset_stats.assert_called_once_with(exts.cache)
+
+
+@mock.patch.object(mod, 'i18n_url')
+@mock.patch.object(mod.CacheStats, 'redirect')
+@mock.patch.object(mod, 'reset_stats')
+@mock.patch.object(mod, 'exts')
+def test_post_redirects(exts, reset_stats, redirect, i18n_url, route):
+    route.request.is_xhr = False
+    route.post()
+    reset_stats.assert_called_once_with(exts.cache)
+    redirect.assert_called_once_with(i18n_url.return_value)
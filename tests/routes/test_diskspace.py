@@ -20,8 +20,8 @@ def test_consolidate_state_get(request, get_consolidate_status):
 def test_notifier_clear(exts):
     notifier = mod.Notifier()
     notifier.clear()
-    args = ('consolidate_storage', exts.databases.librarian)
-    exts.notifications.delete_by_category.assert_called_once_with(*args)
+    exts.notifications.retract.assert_called_once_with(
+        'consolidate_storage', db=exts.databases.librarian)
 
 
 @mock.patch.object(mod, 'exts')
@@ -26,11 +26,10 @@ def test_list_mark_read(request, utcnow):
 @mock.patch.object(mod.List, 'request')
 def test_list_invalidate_cache(request, exts):
     request.session.id = '1'
+    exts.cache.prefixed.side_effect = lambda prefix, key: prefix + key
     route = mod.List()
     route.invalidate_cache()
-    calls = [mock.call('notification_group_1'),
-             mock.call('notification_count_1')]
-    exts.cache.delete.assert_has_calls(calls)
+    exts.cache.delete.assert_called_once_with('notification_group_1')
 
 
 @mock.patch.object(mod, 'get_notifications')
@@ -90,8 +89,34 @@ def test_list_form_valid(request, get_markable_groups, mark_read,
     get_markable_groups.return_value = groups
 
     route = mod.List()
+    route.form = mock.Mock()
+    route.form.should_mark_all.return_value = False
     assert route.form_valid() == {'groups': [groups[0], groups[1]]}
 
     calls = [mock.call(grp.notifications) for grp in groups]
     mark_read.assert_has_calls(calls)
     invalidate_cache.assert_called_once_with()
+
+
+@mock.patch.object(mod, 'utcnow')
+@mock.patch.object(mod.Notification, 'mark_all_read')
+@mock.patch.object(mod.List, 'invalidate_cache')
+@mock.patch.object(mod.List, 'mark_read')
+@mock.patch.object(mod.List, 'get_markable_groups')
+@mock.patch.object(mod.List, 'request')
+def test_list_form_valid_mark_all(request, get_markable_groups, mark_read,
+                                  invalidate_cache, mark_all_read, utcnow):
+    dismissable = mock.Mock(dismissable=True)
+    fixed = mock.Mock(dismissable=False)
+    groups = [mock.Mock(notifications=[dismissable, fixed])]
+    get_markable_groups.return_value = groups
+
+    route = mod.List()
+    route.form = mock.Mock()
+    route.form.should_mark_all.return_value = True
+    route.form_valid()
+
+    mark_all_read.assert_called_once_with([dismissable],
+                                          utcnow.return_value)
+    assert not mark_read.called
+    invalidate_cache.assert_called_once_with()
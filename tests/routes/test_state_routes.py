@@ -0,0 +1,36 @@
+import mock
+
+from librarian.routes import state as mod
+
+
+@mock.patch.object(mod, 'exts')
+@mock.patch.object(mod.StateRoute, 'request')
+def test_state_since(request, exts):
+    request.params = {'since': 'abc-4'}
+    exts.state.fetch_changes.return_value = ('abc-6', ['prov'])
+    route = mod.StateRoute()
+    assert route.get() == dict(version='abc-6',
+                               changes=exts.state.get_many.return_value)
+    exts.state.fetch_changes.assert_called_once_with('abc-4')
+    exts.state.get_many.assert_called_once_with(['prov'])
+
+
+@mock.patch.object(mod, 'exts')
+@mock.patch.object(mod.StateRoute, 'request')
+def test_state_no_since(request, exts):
+    request.params = {}
+    exts.state.fetch_changes.return_value = ('abc-6', [])
+    mod.StateRoute().get()
+    exts.state.fetch_changes.assert_called_once_with(None)
+
+
+@mock.patch.object(mod, 'exts')
+@mock.patch.object(mod.StatePollRoute, 'request')
+def test_state_poll(request, exts):
+    request.params = {'since': 'abc-6'}
+    exts.config = {'state.poll_timeout': 30}
+    exts.state.wait_for_changes.return_value = ('abc-7', ['prov'])
+    route = mod.StatePollRoute()
+    assert route.get()['version'] == 'abc-7'
+    exts.state.wait_for_changes.assert_called_once_with('abc-6',
+                                                        timeout=30)
@@ -0,0 +1,65 @@
+import mock
+
+import librarian.utils.load as mod
+
+
+@mock.patch.object(mod.time, 'time')
+def test_request_load_active(time):
+    time.return_value = 100
+    load = mod.RequestLoad()
+    load.begin()
+    load.begin()
+    assert load.active == 2
+    load.end()
+    load.end()
+    load.end()
+    assert load.active == 0
+
+
+@mock.patch.object(mod.time, 'time')
+def test_request_load_rate(time):
+    load = mod.RequestLoad()
+    for started in (80, 95, 98, 99):
+        time.return_value = started
+        load.begin()
+        load.end()
+    time.return_value = 100
+    assert load.rate() == 0.3
+    assert load.rate(window=30) == 4 / 30.0
+
+
+@mock.patch.object(mod.time, 'time')
+def test_request_load_is_busy(time):
+    time.return_value = 100
+    load = mod.RequestLoad()
+    assert not load.is_busy(0.5)
+    load.begin()
+    assert load.is_busy(0.5)
+    load.end()
+    # a single request in the last 10 seconds is a rate of 0.1
+    assert not load.is_busy(0.5)
+    assert load.is_busy(0.05)
+
+
+def test_iowait_sample(tmpdir):
+    stat = tmpdir.join('stat')
+    stat.write('cpu  10 0 10 70 10 0 0 0 0 0\ncpu0 1 2 3 4 5\n')
+    iowait = mod.IOWait(str(stat))
+    # first sample has nothing to compare with
+    assert iowait.sample() == 0
+    stat.write('cpu  20 0 20 120 40 0 0 0 0 0\n')
+    assert iowait.sample() == 0.3
+    # no time passed
+    assert iowait.sample() == 0
+
+
+def test_iowait_unavailable(tmpdir):
+    iowait = mod.IOWait(str(tmpdir.join('missing')))
+    assert iowait.sample() == 0
+    assert iowait.sample() == 0
+
+
+def test_iowait_malformed(tmpdir):
+    stat = tmpdir.join('stat')
+    stat.write('cpu  x y z\n')
+    assert mod.IOWait(str(stat)).sample() == 0